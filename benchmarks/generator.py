@@ -0,0 +1,142 @@
+"""Seeded synthetic trade books.
+
+A book is a sequence of round trips: a position in an ISIN is opened by one
+or more (partial) fills and closed, after a holding period, by as many
+others. Most positions are long, some short, and some are never closed.
+Reporters and ISINs are drawn with a skew, as in a real firm a few traders
+and instruments account for most trades.
+
+Trades are yielded in chronological order, as they would be reported, while
+holding no more than the fills not yet due.
+"""
+import heapq
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from marshmallow import ValidationError
+
+from tcm_app.models import validate_isin
+
+CURRENCIES = ('SEK', 'USD', 'EUR')
+
+# Share of positions closed within the holding period (of 32 days).
+SHORT_HOLDING_SHARE = 0.4
+
+
+def make_isin(n):
+    """Returns a valid ISIN, unique for n."""
+    stem = 'XS%09d' % n
+    for check in '0123456789':
+        try:
+            validate_isin(stem + check)
+            return stem + check
+        except ValidationError:
+            pass
+
+
+def _skewed(n):
+    """Returns cumulative weights of n items, item i weighing 1 / (i + 1).
+    """
+    weights, total = [], 0.0
+    for i in range(n):
+        total += 1 / (i + 1)
+        weights.append(total)
+    return weights
+
+
+def _split(rnd, quantity, parts):
+    """Splits quantity into parts (partial fills) of multiples of 10."""
+    if quantity < 10 * parts:
+        return [quantity]
+    cuts = sorted(rnd.sample(range(1, quantity // 10), parts - 1))
+    sizes = [b - a for a, b in zip([0] + cuts, cuts + [quantity // 10])]
+    return [size * 10 for size in sizes]
+
+
+def generate(trades, reporters=100, isins=500, seed=0,
+             start=date(2015, 1, 1), end=date(2019, 12, 31)):
+    """Yields trades (dicts of column values) of a book of reporters trading
+    isins between start and end, in chronological order.
+    """
+    rnd = random.Random(seed)
+    days = (end - start).days
+    reporter_weights = _skewed(reporters)
+    isin_weights = _skewed(isins)
+    isin_codes = [make_isin(i) for i in range(isins)]
+    prices = [Decimal(rnd.randint(10, 1000)) for _ in range(isins)]
+    reported_at = datetime(end.year, end.month, end.day) + timedelta(days=1)
+
+    # Fills not yet yielded, as (date, sequence, trade) tuples.
+    pending = []
+    sequence = 0
+    # Round trips of almost four fills on average, hence enough for trades.
+    starts = sorted(rnd.randrange(days) for _ in range(trades // 3 + 1))
+    yielded = 0
+    for start_day in starts:
+        while pending and pending[0][0] <= start_day:
+            yield heapq.heappop(pending)[2]
+            yielded += 1
+            if yielded == trades:
+                return
+
+        reporter = 'trader{}@example.com'.format(rnd.choices(
+            range(reporters), cum_weights=reporter_weights)[0])
+        i = rnd.choices(range(isins), cum_weights=isin_weights)[0]
+        # Prices follow a random walk per ISIN.
+        prices[i] = max(Decimal('0.01'), (prices[i] * Decimal(
+            1 + rnd.gauss(0, 0.02))).quantize(Decimal('0.01')))
+        open_price = prices[i]
+        close_price = max(Decimal('0.01'), (open_price * Decimal(
+            1 + rnd.gauss(0.005, 0.05))).quantize(Decimal('0.01')))
+        if rnd.random() < SHORT_HOLDING_SHARE:
+            holding = rnd.randint(0, 31)
+        else:
+            holding = rnd.randint(32, 365)
+        opening = 'Buy' if rnd.random() < 0.8 else 'Sell'
+        closing = 'Sell' if opening == 'Buy' else 'Buy'
+        quantity = rnd.randint(1, 100) * 100
+
+        fills = [(start_day + rnd.randint(0, 2), opening, q, open_price)
+                 for q in _split(rnd, quantity, rnd.randint(1, 3))]
+        if rnd.random() < 0.9:  # Otherwise left open
+            close_day = start_day + holding
+            fills.extend(
+                (close_day + rnd.randint(0, 2), closing, q, close_price)
+                for q in _split(rnd, quantity, rnd.randint(1, 3)))
+
+        for day, direction, q, price in fills:
+            if day > days:
+                continue
+            trade = {
+                'isin': isin_codes[i],
+                'name': f'Instrument {i}',
+                'direction': direction,
+                'quantity': Decimal(q),
+                'price': price,
+                'currency': CURRENCIES[i % len(CURRENCIES)],
+                'amount': price * q,
+                'date': start + timedelta(days=day),
+                'reporter': reporter,
+                'reported_at': reported_at,
+            }
+            heapq.heappush(pending, (day, sequence, trade))
+            sequence += 1
+
+    while pending and yielded < trades:
+        yield heapq.heappop(pending)[2]
+        yielded += 1
+
+
+def as_json(trade):
+    """Returns a generated trade as reported in a request body."""
+    return {
+        'isin': trade['isin'],
+        'name': trade['name'],
+        'direction': trade['direction'],
+        'quantity': str(trade['quantity']),
+        'price': str(trade['price']),
+        'currency': trade['currency'],
+        'amount': str(trade['amount']),
+        'date': trade['date'].isoformat(),
+    }
@@ -0,0 +1,170 @@
+"""Local stand-in for the Auth0 identity provider, for tests and load tests
+without network access.
+
+Signs RS256 access tokens, by a key generated at start, with the claims and
+permissions the API expects and serves the endpoints it requests: the JSON
+Web Key Set (/.well-known/jwks.json) and /userinfo. Tokens are also issued
+by GET /token?email=...&role=employee|compliance-officer. Point the API at
+the stand-in by the AUTH0_API_BASE_URL environment variable.
+
+    python -m benchmarks.identity_provider --port 8765
+    AUTH0_API_BASE_URL=http://127.0.0.1:8765 flask run
+"""
+import argparse
+import threading
+import time
+from base64 import urlsafe_b64encode
+from collections import Counter
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask, abort, jsonify, request
+from jose import jwt
+from werkzeug.serving import make_server
+
+# Permissions by role, as assigned by Auth0 (see README).
+ROLES = {
+    'employee': (
+        'post:trades', 'get:trades', 'patch:trades', 'delete:trades',
+        'get:violations'),
+}
+ROLES['compliance-officer'] = ROLES['employee'] + (
+    'get:all-trades', 'get:all-violations')
+
+
+def _b64_uint(value):
+    """Encodes an unsigned integer as in a JSON Web Key."""
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class IdentityProvider:
+    """Signs access tokens for users of base_url (the issuer) and audience.
+    Requests served are counted by path, and answered with 503 while
+    unavailable is set (to test how the API handles failures).
+    """
+
+    def __init__(self, base_url, audience='trade_compliance_monitor',
+                 kid='local-stand-in'):
+        self.base_url = base_url.rstrip('/')
+        self.audience = audience
+        self.rotate(kid)
+        self._emails = {}  # By subject, for userinfo
+        self.requests = Counter()
+        self.unavailable = False
+
+    def rotate(self, kid):
+        """Replaces the signing key by a new one, with key id kid."""
+        self.kid = kid
+        key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048, backend=default_backend())
+        self._private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()).decode('ascii')
+        self._public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo).decode('ascii')
+        numbers = key.public_key().public_numbers()
+        self._jwk = {'kty': 'RSA', 'kid': kid, 'use': 'sig', 'alg': 'RS256',
+                     'n': _b64_uint(numbers.n), 'e': _b64_uint(numbers.e)}
+
+    def jwks(self):
+        return {'keys': [self._jwk]}
+
+    def issue(self, email, role='employee', expires_in=3600,
+              email_claim=None):
+        """Returns an access token for email with the permissions of role,
+        optionally with the email in a custom claim as well.
+        """
+        now = int(time.time())
+        sub = f'local|{email}'
+        self._emails[sub] = email
+        claims = {
+            'iss': self.base_url + '/',
+            'sub': sub,
+            'aud': self.audience,
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(ROLES[role]),
+        }
+        if email_claim:
+            claims[email_claim] = email
+        return jwt.encode(claims, self._private_pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+    def userinfo(self, token):
+        """Returns the userinfo of a token issued by this provider, or None.
+        """
+        try:
+            claims = jwt.decode(
+                token, self._public_pem, algorithms='RS256',
+                audience=self.audience, issuer=self.base_url + '/')
+        except jwt.JWTError:
+            return None
+        email = self._emails.get(claims['sub'])
+        return {'sub': claims['sub'], 'email': email} if email else None
+
+    def wsgi_app(self):
+        app = Flask(__name__)
+
+        @app.before_request
+        def count():
+            self.requests[request.path] += 1
+            if self.unavailable:
+                abort(503)
+
+        @app.route('/.well-known/jwks.json')
+        def jwks():
+            return jsonify(self.jwks())
+
+        @app.route('/userinfo')
+        def userinfo():
+            auth = request.headers.get('Authorization', '')
+            info = self.userinfo(auth[len('Bearer '):]) if auth.startswith(
+                'Bearer ') else None
+            if info is None:
+                abort(401)
+            return jsonify(info)
+
+        @app.route('/token')
+        def token():
+            email = request.args.get('email')
+            role = request.args.get('role', 'employee')
+            if not email or role not in ROLES:
+                abort(400)
+            return jsonify(access_token=self.issue(
+                email, role, email_claim=request.args.get('email_claim')),
+                token_type='Bearer')
+
+        return app
+
+
+def start(host='127.0.0.1', port=0, audience='trade_compliance_monitor'):
+    """Starts an identity provider in this process. Returns it with its
+    server.
+    """
+    server = make_server(host, port, None, threaded=True)
+    provider = IdentityProvider(
+        f'http://{host}:{server.server_port}', audience)
+    server.app = provider.wsgi_app()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return provider, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--audience', default='trade_compliance_monitor')
+    args = parser.parse_args()
+
+    provider = IdentityProvider(
+        f'http://{args.host}:{args.port}', args.audience)
+    print(f'Issuer: {provider.base_url}/')
+    make_server(args.host, args.port, provider.wsgi_app(),
+                threaded=True).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
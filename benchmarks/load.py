@@ -0,0 +1,280 @@
+"""Load test of every endpoint, reporting throughput and latency percentiles.
+
+A synthetic book (see benchmarks.generator) is seeded and the API served in
+this process, authorizing requests by tokens of a local identity provider
+stand-in (see benchmarks.identity_provider), hence without network access.
+Each endpoint is requested by a number of concurrent clients for a while,
+one endpoint at a time.
+
+WARNING: drops and recreates all tables of the given database (and of the
+replica, if given).
+
+    python -m benchmarks.load --database-url sqlite:////tmp/load.db \
+        --trades 100000 --concurrency 8 --duration 10
+
+To load an API served otherwise (e.g. by gunicorn, with AUTH0_API_BASE_URL
+of a stand-in started by python -m benchmarks.identity_provider), give
+--url and --identity-provider.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date
+
+import requests
+from werkzeug.serving import make_server
+
+EMPLOYEE = 'trader0@example.com'  # The reporter with the most trades
+COMPLIANCE_OFFICER = 'john.doe@example.com'
+
+TRADE = {
+    'isin': 'US0378331005', 'name': 'Apple Inc', 'direction': 'Buy',
+    'quantity': 100, 'price': 365, 'currency': 'USD', 'amount': 36500,
+    'date': date(2020, 1, 2).isoformat(),
+}
+
+
+def percentile(latencies, p):
+    """Returns the p:th percentile (nearest rank) of sorted latencies."""
+    if not latencies:
+        return None
+    return latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)]
+
+
+def scenarios(url, tokens):
+    """Returns (name, request function) tuples, one per endpoint. A request
+    function takes a session and returns the response, or None when done.
+    """
+    employee = {'Authorization': f'Bearer {tokens["employee"]}'}
+    officer = {'Authorization': f'Bearer {tokens["compliance-officer"]}'}
+    api = url.rstrip('/') + '/api'
+
+    def get(path, headers):
+        return lambda session: session.get(api + path, headers=headers)
+
+    # Written trades are deleted again by the DELETE scenario.
+    created = []
+    lock = threading.Lock()
+
+    def post(session):
+        response = session.post(api + '/trades', headers=employee, json=TRADE)
+        if response.ok:
+            with lock:
+                created.append(response.json()['id'])
+        return response
+
+    def take():
+        with lock:
+            return created.pop() if created else None
+
+    # Quantities alternate, hence (mostly) every PATCH changes the trade.
+    quantities = itertools.cycle((50, 100))
+
+    def patch(session):
+        id = take()
+        if id is None:
+            return None  # All deleted
+        with lock:
+            quantity = next(quantities)
+        response = session.patch(
+            f'{api}/trades/{id}', headers=employee, json=dict(
+                TRADE, quantity=quantity,
+                amount=quantity * TRADE['price']))
+        if response.ok:  # Still there, to be patched or deleted again
+            with lock:
+                created.append(id)
+        return response
+
+    def delete(session):
+        id = take()
+        if id is None:
+            return None  # All deleted
+        return session.delete(f'{api}/trades/{id}', headers=employee)
+
+    def batch(session):
+        return session.post(api + '/trades/batch', headers=employee,
+                            json=[TRADE] * 10)
+
+    first = requests.get(api + '/trades?limit=1', headers=employee).json()
+    id = first[0]['id']
+    return [
+        ('GET /api/trades', get('/trades', employee)),
+        ('GET /api/trades?limit=100', get('/trades?limit=100', employee)),
+        ('GET /api/trades/<id>', get(f'/trades/{id}', employee)),
+        ('GET /api/violations', get('/violations', employee)),
+        ('GET /api/all-trades?limit=100',
+         get('/all-trades?limit=100', officer)),
+        ('GET /api/all-violations', get('/all-violations', officer)),
+        ('GET /api/all-violations?stream=ndjson',
+         get('/all-violations?stream=ndjson', officer)),
+        ('POST /api/trades', post),
+        ('PATCH /api/trades/<id>', patch),
+        ('DELETE /api/trades/<id>', delete),
+        ('POST /api/trades/batch', batch),
+    ]
+
+
+def run(name, request, concurrency, duration, max_requests):
+    """Requests by concurrency clients until duration seconds have passed
+    (or max_requests requests have been made). Returns the result.
+    """
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    remaining = [max_requests]
+
+    def client():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            with lock:
+                if remaining[0] is not None:
+                    if remaining[0] == 0:
+                        return
+                    remaining[0] -= 1
+            start = time.perf_counter()
+            response = request(session)
+            if response is None:
+                return
+            response.content  # Until the whole body is read
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'name': name,
+        'requests': len(latencies),
+        'errors': sum(n for status, n in statuses.items() if status >= 400),
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'throughput': len(latencies) / seconds,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def seed(app, args):
+    """Seeds a book of args.trades trades, and copies it to the replica."""
+    from benchmarks.generator import generate
+    from tcm_app.models import Trade, db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        rows = list(generate(args.trades, args.reporters, args.isins,
+                             seed=args.seed))
+        with app.test_request_context():
+            Trade.bulk_create(rows, app.config['TRADES_BATCH_CHUNK_SIZE'])
+
+        # A replica in sync, see tcm_app.replicas
+        replica = app.extensions.get('replica')
+        if replica is not None:
+            db.metadata.drop_all(replica.engine)
+            db.metadata.create_all(replica.engine)
+            with replica.engine.begin() as connection:
+                for table in db.metadata.sorted_tables:
+                    rows = [dict(row) for row in
+                            db.session.execute(table.select())]
+                    if rows:
+                        connection.execute(table.insert(), rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--replica-database-url',
+                        help='Of a replica, read from by GET endpoints.')
+    parser.add_argument('--trades', type=int, default=10000)
+    parser.add_argument('--reporters', type=int, default=100)
+    parser.add_argument('--isins', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Seconds per endpoint.')
+    parser.add_argument('--requests', type=int,
+                        help='Maximum number of requests per endpoint.')
+    parser.add_argument('--url', help='Of an API already served.')
+    parser.add_argument('--identity-provider',
+                        help='URL of the stand-in the API is pointed at.')
+    parser.add_argument('--output', help='JSON file of results.')
+    args = parser.parse_args()
+    if args.url and not args.identity_provider:
+        parser.error('--url requires --identity-provider.')
+
+    from benchmarks import identity_provider
+    if args.identity_provider:
+        base_url = args.identity_provider.rstrip('/')
+
+        def issue(email, role):
+            response = requests.get(base_url + '/token', params={
+                'email': email, 'role': role})
+            response.raise_for_status()
+            return response.json()['access_token']
+    else:
+        provider, _ = identity_provider.start()
+        base_url, issue = provider.base_url, provider.issue
+
+    os.environ['DATABASE_URL'] = args.database_url
+    if args.replica_database_url:
+        os.environ['DATABASE_REPLICA_URL'] = args.replica_database_url
+    os.environ['AUTH0_API_BASE_URL'] = base_url
+    os.environ.setdefault('APP_SETTINGS', 'config.ProductionConfig')
+    os.environ.setdefault('APP_BASE_URL', 'http://127.0.0.1:5000')
+    os.environ.setdefault('AUTH0_CLIENT_SECRET', '')
+    from tcm_app import create_app
+    app = create_app()
+    seed(app, args)
+    print(f'Seeded {args.trades} trades', file=sys.stderr)
+
+    url = args.url
+    if url is None:
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}'
+
+    tokens = {
+        'employee': issue(EMPLOYEE, 'employee'),
+        'compliance-officer': issue(COMPLIANCE_OFFICER, 'compliance-officer'),
+    }
+    results = []
+    print('{:<38} {:>8} {:>7} {:>9} {:>8} {:>8} {:>8}'.format(
+        'endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms'))
+    for name, request in scenarios(url, tokens):
+        result = run(name, request, args.concurrency, args.duration,
+                     args.requests)
+        results.append(result)
+        print('{name:<38} {requests:>8} {errors:>7} {throughput:>9.1f} '
+              '{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}'.format(**dict(
+                  result, **{p: (result[p] or 0) * 1000
+                             for p in ('p50', 'p95', 'p99')})))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'database': args.database_url.split(':')[0],
+                'arguments': {key: value for key, value in vars(args).items()
+                              if key not in ('database_url',
+                                             'replica_database_url',
+                                             'output')},
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""Timings and peak memory of the hot paths on synthetic trade books.
+
+Books of increasing size (see benchmarks.generator) are seeded and the
+results saved as JSON, optionally compared against those of a previous run.
+
+WARNING: drops and recreates all tables of the given database.
+
+    python -m benchmarks.performance --database-url postgresql://... \
+        --sizes 1000 10000 100000 1000000 --output results.json \
+        --baseline previous.json
+
+Each benchmark is timed repeat times (the minimum and median are reported)
+and run once more under tracemalloc for its peak memory. Requests are made
+through the test client, with the access token's verified payload cached
+up front, hence without any request to Auth0.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+
+def measure(fn, repeat, trace=True):
+    """Returns the minimum and median time of repeat calls of fn and the
+    peak memory (bytes allocated) of one more, if traced.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if trace:
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'seconds': min(times), 'median_seconds': statistics.median(times),
+            'peak_bytes': peak}
+
+
+def authorize(app, email):
+    """Returns headers of an access token for email with all permissions,
+    its verified payload cached as if verified against Auth0.
+    """
+    from tcm_app import auth
+    token = f'benchmark-token-{email}'
+    claim = app.config['AUTH0_EMAIL_CLAIM'] or 'https://benchmark/email'
+    app.config['AUTH0_EMAIL_CLAIM'] = claim
+    auth.verified_tokens.put(token, {
+        'sub': email,
+        'exp': time.time() + 24 * 3600,
+        claim: email,
+        'permissions': [
+            'get:trades', 'post:trades', 'patch:trades', 'delete:trades',
+            'get:violations', 'get:all-trades', 'get:all-violations'],
+    }, max(app.config['TOKEN_CACHE_SIZE'], 1))
+    return {'Authorization': f'Bearer {token}'}
+
+
+def run_size(app, size, args):
+    """Seeds a book of size trades and runs all benchmarks on it. Returns
+    results as dicts.
+    """
+    from flask import json as flask_json
+
+    from benchmarks.generator import as_json, generate
+    from tcm_app import api, cache, fifo, validation
+    from tcm_app.models import (
+        Trade, db, load_trades, trade_serializer, trades_schema)
+
+    config = app.config
+    book = dict(trades=size, reporters=args.reporters, isins=args.isins,
+                seed=args.seed)
+    results = []
+
+    def record(name, fn, repeat=args.repeat, trace=True, **extra):
+        result = measure(fn, repeat, trace)
+        result.update(name=name, trades=size, **extra)
+        results.append(result)
+        print('{trades:>9} {name:<40} {seconds:9.4f}s {mib:>9} MiB'.format(
+            mib='-' if result['peak_bytes'] is None else
+            round(result['peak_bytes'] / 2**20, 1), **result),
+            file=sys.stderr)
+
+    # Each stage holds its data in a function of its own, hence it is freed
+    # before the next stage is traced.
+    def seed():
+        """Seeds the book (once, untraced) by the batch insert, including the
+        ledger.
+        """
+        rows = list(generate(**book))
+        with app.test_request_context():
+            record('Trade.bulk_create', lambda: Trade.bulk_create(
+                rows, config['TRADES_BATCH_CHUNK_SIZE']),
+                repeat=1, trace=False)
+
+    def reporter_trades():
+        """Returns the reporter with the most trades (trader0 by the skew),
+        its number of trades and its trades, detached.
+        """
+        (email, count), = db.session.query(
+            Trade.reporter, db.func.count(Trade.id)).group_by(
+                Trade.reporter).order_by(
+                    db.func.count(Trade.id).desc()).limit(1).all()
+        trades = Trade.query.filter_by(reporter=email).order_by(
+            Trade.isin.asc(), Trade.date.asc(), Trade.id.asc()).all()
+        db.session.expunge_all()
+        return email, count, trades
+
+    def match_and_serialise(trades, count):
+        with app.test_request_context():
+            record('find_violations', lambda: api.find_violations(trades),
+                   reporter_trades=count)
+            record('fifo.match_by_isin', lambda: list(
+                fifo.match_by_isin(trades)), reporter_trades=count)
+            record('serialise (schema)', lambda: flask_json.dumps(
+                trades_schema.dump(trades)), reporter_trades=count)
+            record('serialise (compiled)', lambda: flask_json.dumps(
+                trade_serializer.raw(trades)), reporter_trades=count)
+
+    def validate():
+        trades_json = [as_json(trade) for trade in generate(**book)]
+        validation._isin_errors.clear()
+        record('load_trades (validation)', lambda: load_trades(trades_json))
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+        email, count, trades = reporter_trades()
+    match_and_serialise(trades, count)
+    del trades
+    validate()
+
+    # Endpoints, computing violations on every request.
+    config['VIOLATIONS_CACHE_TYPE'] = 'null'
+    cache.violations.init_app(app)
+    headers = authorize(app, email)
+    client = app.test_client()
+
+    def get(url):
+        def fn():
+            response = client.get(url, headers=headers)
+            assert response.status_code in (200, 204), response.status
+        return fn
+
+    record('GET /api/trades', get('/api/trades'), reporter_trades=count)
+    record('GET /api/trades?limit=100', get('/api/trades?limit=100'))
+    record('GET /api/violations (ledger)', get('/api/violations'),
+           reporter_trades=count)
+    record('GET /api/all-violations (ledger)', get('/api/all-violations'))
+    config['VIOLATIONS_FROM_LEDGER'] = False
+    config['VIOLATIONS_FROM_CHECKPOINTS'] = False
+    record('GET /api/violations (replay)', get('/api/violations'),
+           reporter_trades=count)
+    record('GET /api/all-violations (replay)', get('/api/all-violations'))
+    config['VIOLATIONS_FROM_LEDGER'] = True
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints the ratio of each time to the baseline's. Returns the
+    benchmarks slower than the baseline by more than tolerance.
+    """
+    previous = {(r['name'], r['trades']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['name'], result['trades']))
+        if before is None or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions.append(result)
+        print('{trades:>9} {name:<40} {ratio:6.2f}x {flag}'.format(
+            ratio=ratio, flag=flag, **result))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--reporters', type=int, default=100)
+    parser.add_argument('--isins', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file of results.')
+    parser.add_argument('--baseline', help='JSON file of a previous run.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Slowdown flagged as a regression (0.2 = 20%%).')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('APP_SETTINGS', 'config.ProductionConfig')
+    os.environ.setdefault('APP_BASE_URL', 'http://127.0.0.1:5000')
+    os.environ.setdefault('AUTH0_CLIENT_SECRET', '')
+    from tcm_app import create_app
+    app = create_app()
+
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(app, size, args))
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+        'arguments': {key: value for key, value in vars(args).items()
+                      if key not in ('database_url', 'output', 'baseline')},
+        # Of the whole run, in KiB on Linux
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
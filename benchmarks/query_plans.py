@@ -0,0 +1,136 @@
+"""Query plans of the hot trade queries before and after the composite
+indexes (migration 0dba7661334a) on a seeded table.
+
+WARNING: drops and recreates all tables of the given database.
+
+    python -m benchmarks.query_plans --database-url postgresql://... \
+        --rows 1000000
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, text
+
+from tcm_app.models import Trade, TradePaperTrail, db
+
+# Indexes added by migration 0dba7661334a.
+INDEXES = [
+    index for table in (Trade.__table__, TradePaperTrail.__table__)
+    for index in table.indexes]
+
+COLUMNS = (
+    'isin, name, direction, quantity, price, currency, amount, date, '
+    'reporter, reported_at')
+
+SEED = {
+    'postgresql': f'''
+        INSERT INTO "Trade" ({COLUMNS})
+        SELECT 'XS' || lpad(((i * 7) % :isins)::text, 10, '0'),
+               'Instrument', CASE WHEN i % 3 = 0 THEN 'Sell' ELSE 'Buy' END,
+               10 + i % 90, 100 + i % 13, 'SEK', (10 + i % 90) * 100,
+               DATE '2015-01-01' + (i % 2000), 'reporter' || (i % :reporters),
+               TIMESTAMP '2020-01-01'
+        FROM generate_series(1, :rows) AS i''',
+    'sqlite': f'''
+        INSERT INTO "Trade" ({COLUMNS})
+        WITH RECURSIVE s(i) AS (
+            SELECT 1 UNION ALL SELECT i + 1 FROM s WHERE i < :rows)
+        SELECT printf('XS%010d', (i * 7) % :isins),
+               'Instrument', CASE WHEN i % 3 = 0 THEN 'Sell' ELSE 'Buy' END,
+               10 + i % 90, 100 + i % 13, 'SEK', (10 + i % 90) * 100,
+               date('2015-01-01', '+' || (i % 2000) || ' days'),
+               'reporter' || (i % :reporters), '2020-01-01 00:00:00'
+        FROM s''',
+}
+
+SEED_TRAIL = '''
+    INSERT INTO "TradePaperTrail" (trade_id, {columns}, trailed_at)
+    SELECT id, {columns}, reported_at FROM "Trade" WHERE id % 10 = 0
+'''.format(columns=COLUMNS)
+
+EXPLAIN = {
+    'postgresql': 'EXPLAIN (ANALYZE, BUFFERS) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+ANALYZE = {
+    'postgresql': 'ANALYZE',
+    'sqlite': 'ANALYZE',
+}
+
+# Access paths of the API, see tcm_app.api and tcm_app.ledger.
+QUERIES = {
+    'TradesView.get (page)': '''
+        SELECT * FROM "Trade" WHERE reporter = :reporter AND id > :id
+        ORDER BY id LIMIT 101''',
+    'TradeView.get/patch/delete': '''
+        SELECT * FROM "Trade" WHERE id = :id AND reporter = :reporter''',
+    'ViolationsView.get': '''
+        SELECT * FROM "Trade" WHERE reporter = :reporter
+        ORDER BY isin, date, id''',
+    'ledger.rematch (suffix)': '''
+        SELECT * FROM "Trade" WHERE reporter = :reporter AND isin = :isin
+        AND (date > :date OR (date = :date AND id >= :id))
+        ORDER BY date, id''',
+    'AllViolationsView.get (stream)': '''
+        SELECT * FROM "Trade" ORDER BY reporter, isin, date, id LIMIT 1000''',
+    'TradePaperTrail by trade_id': '''
+        SELECT * FROM "TradePaperTrail" WHERE trade_id = :id
+        ORDER BY trailed_at''',
+}
+
+
+def explain(connection, dialect, params):
+    plans = {}
+    for name, query in QUERIES.items():
+        rows = connection.execute(text(EXPLAIN[dialect] + query), params)
+        plans[name] = '\n'.join(' '.join(str(v) for v in row) for row in rows)
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--reporters', type=int, default=1000)
+    parser.add_argument('--isins', type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    dialect = engine.dialect.name
+    if dialect not in SEED:
+        parser.error(f'Unsupported database "{dialect}".')
+
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    for index in INDEXES:
+        index.drop(engine)
+
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(text(SEED[dialect]), rows=args.rows,
+                           reporters=args.reporters, isins=args.isins)
+        connection.execute(text(SEED_TRAIL))
+        connection.execute(text(ANALYZE[dialect]))
+    print(f'Seeded {args.rows} trades in {time.perf_counter() - start:.1f}s')
+
+    params = {
+        'reporter': 'reporter7', 'isin': 'XS0000000049',
+        'date': '2019-06-01', 'id': args.rows // 2}
+    with engine.connect() as connection:
+        before = explain(connection, dialect, params)
+
+    for index in INDEXES:
+        index.create(engine)
+    with engine.begin() as connection:
+        connection.execute(text(ANALYZE[dialect]))
+    with engine.connect() as connection:
+        after = explain(connection, dialect, params)
+
+    for name in QUERIES:
+        print(f'\n=== {name}\n--- before\n{before[name]}\n--- after\n'
+              f'{after[name]}')
+
+
+if __name__ == '__main__':
+    main()
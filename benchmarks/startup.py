@@ -0,0 +1,167 @@
+"""Start-up time of a worker: importing tcm_app and running create_app.
+
+Each run is a fresh interpreter, as a worker started by gunicorn, which
+reports its timings, peak memory and whether any of the modules only some
+requests need (HEAVY) were imported. Runs are made with the OpenAPI
+template cached (see tcm_app.openapi) and without. The largest imports, by
+python -X importtime, are listed too.
+
+    python -m benchmarks.startup --repeat 10 --output startup.json \
+        --baseline previous.json
+
+No database is connected to, hence --database-url is only configured.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+# Modules not needed for the app to start.
+HEAVY = ('numpy', 'pandas', 'pyarrow', 'alembic', 'apispec_webframeworks')
+
+CHILD = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import tcm_app
+imported = time.perf_counter()
+tcm_app.create_app()
+created = time.perf_counter()
+json.dump({
+    'import': imported - start,
+    'create_app': created - imported,
+    'total': created - start,
+    'modules': len(sys.modules),
+    'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy': sorted(name for name in %r if name in sys.modules),
+}, sys.stdout)
+''' % (HEAVY,)
+
+METRICS = ('import', 'create_app', 'total')
+
+
+def start(env, importtime=False):
+    """Starts the app in a new interpreter. Returns its report, and its
+    import times if importtime.
+    """
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else [])
+    process = subprocess.run(command + ['-c', CHILD], env=env,
+                             capture_output=True, text=True, check=True)
+    return json.loads(process.stdout), process.stderr
+
+
+def largest_imports(stderr, top):
+    """Returns the top (module, cumulative seconds) of python -X importtime
+    output, of modules imported directly by the app or at the top level.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line[13:]:
+            continue
+        _, cumulative, name = line[12:].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(imports, key=lambda item: -item[1])[:top]
+
+
+def run(name, env, repeat):
+    """Starts the app repeat times. Returns the medians of the reports."""
+    reports = [start(env)[0] for _ in range(repeat)]
+    result = {'name': name}
+    for metric in METRICS + ('max_rss', 'modules'):
+        result[metric] = statistics.median(r[metric] for r in reports)
+    result['min_total'] = min(r['total'] for r in reports)
+    result['heavy'] = reports[-1]['heavy']
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Prints the ratio of each total time to the baseline's. Returns the
+    results slower than the baseline by more than tolerance.
+    """
+    previous = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None or not before['total']:
+            continue
+        ratio = result['total'] / before['total']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions.append(result)
+        print('{name:<12} {ratio:6.2f}x {flag}'.format(
+            ratio=ratio, flag=flag, **result))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15,
+                        help='Number of largest imports listed.')
+    parser.add_argument('--output', help='JSON file of results.')
+    parser.add_argument('--baseline', help='JSON file of a previous run.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Slowdown flagged as a regression (0.2 = 20%%).')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_URL=args.database_url)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [root, env.get('PYTHONPATH')]))
+    env.setdefault('APP_SETTINGS', 'config.ProductionConfig')
+    env.setdefault('APP_BASE_URL', 'http://127.0.0.1:5000')
+    env.setdefault('AUTH0_CLIENT_SECRET', '')
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        cached = dict(env, OPENAPI_TEMPLATE_PATH=os.path.join(
+            directory, 'openapi_template.json'))
+        start(cached)  # Caches the template
+        results.append(run('cached', cached, args.repeat))
+        results.append(run('uncached', dict(env, OPENAPI_TEMPLATE_PATH=''),
+                           args.repeat))
+        imports = largest_imports(start(cached, importtime=True)[1], args.top)
+
+    print('{:<12} {:>9} {:>12} {:>9} {:>10} {:>8}  {}'.format(
+        'template', 'import s', 'create_app s', 'total s', 'rss KiB',
+        'modules', 'heavy'))
+    for result in results:
+        print('{name:<12} {import:>9.3f} {create_app:>12.3f} {total:>9.3f} '
+              '{max_rss:>10.0f} {modules:>8.0f}  {heavy}'.format(
+                  **dict(result, heavy=', '.join(result['heavy']) or '-')))
+    print('\nLargest imports (cumulative s):')
+    for module, seconds in imports:
+        print('{:>9.3f}  {}'.format(seconds, module))
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'arguments': {key: value for key, value in vars(args).items()
+                      if key not in ('database_url', 'output', 'baseline')},
+        'results': results,
+        'imports': imports,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -11,17 +12,116 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Read replica of the database, see tcm_app.replicas. GET endpoints read
+    # from it when consistent with the primary, or when reading all trades,
+    # when at most REPLICA_MAX_LAG seconds behind. When it fails, reads go
+    # to the primary for REPLICA_RETRY_INTERVAL seconds.
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+    REPLICA_RETRY_INTERVAL = 30
+
+    # Connection pool options of the primary and the replica (see
+    # SQLAlchemy's create_engine) as JSON, e.g. {"pool_size": 10}.
+    SQLALCHEMY_ENGINE_OPTIONS = json.loads(
+        os.environ.get('DATABASE_ENGINE_OPTIONS', '{}'))
+    SQLALCHEMY_REPLICA_ENGINE_OPTIONS = json.loads(
+        os.environ.get('DATABASE_REPLICA_ENGINE_OPTIONS', '{}'))
+
     APP_BASE_URL = os.environ['APP_BASE_URL']
 
     SWAGGER_BASE_URL = APP_BASE_URL
 
     AUTH0_CLIENT_ID = "BEPLKGgYmTMma3QUvs21cPY0Hq36ZAPP"
     AUTH0_CLIENT_SECRET = os.environ['AUTH0_CLIENT_SECRET']
-    AUTH0_API_BASE_URL = "https://erigre.eu.auth0.com"
+    # Overridden e.g. by a local stand-in, see benchmarks.identity_provider
+    AUTH0_API_BASE_URL = os.environ.get(
+        'AUTH0_API_BASE_URL', "https://erigre.eu.auth0.com")
     AUTH0_ACCESS_TOKEN_URL = AUTH0_API_BASE_URL + '/oauth/token'
     AUTH0_AUTHORIZE_URL = AUTH0_API_BASE_URL + '/authorize'
     AUTH0_AUDIENCE = "trade_compliance_monitor"
     AUTH0_CALLBACK_URL = APP_BASE_URL + '/callback'
+    # Custom claim of access tokens holding the user's email (added by an
+    # Auth0 rule), making userinfo requests unnecessary.
+    AUTH0_EMAIL_CLAIM = os.environ.get('AUTH0_EMAIL_CLAIM')
+
+    # Emails from userinfo endpoint are cached per subject (sub)
+    USERINFO_CACHE_TTL = 3600
+    USERINFO_CACHE_SIZE = 10000
+    USERINFO_TIMEOUT = 5
+
+    # JSON Web Key Set cache (seconds), see tcm_app.auth.JWKSCache
+    JWKS_TTL = 600
+    JWKS_MIN_REFRESH_INTERVAL = 30
+    JWKS_TIMEOUT = 5
+
+    # Maximum number of verified tokens cached, see tcm_app.auth.TokenCache
+    TOKEN_CACHE_SIZE = 1024
+
+    # Default page size (number of trades) when listing trades, None for all.
+    TRADES_DEFAULT_LIMIT = None
+    # Maximum page size when listing trades, larger limits are clamped.
+    TRADES_MAX_LIMIT = 1000
+
+    # Rows per multi-row insert when reporting a batch of trades.
+    TRADES_BATCH_CHUNK_SIZE = 1000
+
+    # Rows read and validated at a time when importing a file of trades.
+    IMPORT_CHUNK_SIZE = 10000
+
+    # Maximum number of invalid rows reported back from a file import.
+    IMPORT_MAX_ERRORS = 1000
+
+    # Read violations from the ledger of already matched positions (kept up
+    # to date on every trade write) instead of matching all trades per read.
+    VIOLATIONS_FROM_LEDGER = True
+
+    # Otherwise, match only trades after the latest checkpoints (see
+    # tcm_app.checkpoints), created as of CHECKPOINT_AGE days ago by: flask
+    # trades checkpoint. Older trades are seldom written, which would
+    # invalidate their checkpoints.
+    VIOLATIONS_FROM_CHECKPOINTS = True
+    CHECKPOINT_AGE = 2 * 32
+
+    # When matching all trades, reporters are evaluated in a 'thread' or
+    # 'process' pool of VIOLATIONS_WORKERS (default: number of CPUs) workers,
+    # or 'serial'. Books smaller than the threshold (number of trades) are
+    # always evaluated serially. Threads by default, as forking a process
+    # pool within a web worker is better opted into.
+    VIOLATIONS_EXECUTOR = os.environ.get('VIOLATIONS_EXECUTOR', 'thread')
+    VIOLATIONS_WORKERS = int(os.environ.get('VIOLATIONS_WORKERS', 0)) or None
+    VIOLATIONS_PARALLEL_THRESHOLD = 10000
+
+    # Rows fetched at a time when streaming violations.
+    VIOLATIONS_STREAM_BATCH_SIZE = 1000
+
+    # Cache of violations by reporter, see tcm_app.cache: 'memory' (in
+    # process), 'filesystem' or 'redis' (shared by all workers) or 'null'.
+    VIOLATIONS_CACHE_TYPE = os.environ.get('VIOLATIONS_CACHE_TYPE', 'memory')
+    VIOLATIONS_CACHE_SIZE = 10000  # Reporters
+    VIOLATIONS_CACHE_DIR = os.path.join(basedir, 'violations_cache')
+    VIOLATIONS_CACHE_REDIS_URL = os.environ.get(
+        'VIOLATIONS_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Request metrics in the Prometheus text format at /metrics, see
+    # tcm_app.metrics, optionally also as a Server-Timing response header.
+    METRICS_ENABLED = True
+    METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING') == '1'
+
+    # Profiling of each request's SQL statements, see tcm_app.profiling:
+    # slow statements and statements repeated more than the limit (N+1
+    # queries) are logged and counted.
+    SQL_PROFILING = os.environ.get('SQL_PROFILING') == '1'
+    SQL_SLOW_STATEMENT_SECONDS = float(
+        os.environ.get('SQL_SLOW_STATEMENT_SECONDS', 0.5))
+    SQL_REPEATED_STATEMENT_LIMIT = int(
+        os.environ.get('SQL_REPEATED_STATEMENT_LIMIT', 10))
+
+    # Swagger template of the OpenAPI document, cached at this path by: flask
+    # openapi, or else by the first app started (see tcm_app.openapi). None
+    # (or empty) to build it at every start.
+    OPENAPI_TEMPLATE_PATH = os.environ.get(
+        'OPENAPI_TEMPLATE_PATH',
+        os.path.join(basedir, 'openapi_template.json')) or None
 
 
 class ProductionConfig(Config):
@@ -40,3 +140,4 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    OPENAPI_TEMPLATE_PATH = None
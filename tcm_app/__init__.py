@@ -1,14 +1,10 @@
 import os
 
-from apispec.ext.marshmallow import MarshmallowPlugin
-from apispec_webframeworks.flask import FlaskPlugin
-from flasgger import APISpec, Swagger
+from flasgger import Swagger
 from flask import Flask
-from flask_migrate import Migrate
 from flask_session import Session
 
 from flask_cors import CORS
-from tcm_app.models import TradeSchema
 
 
 def create_app():
@@ -31,9 +27,26 @@ def create_app():
     # ---
     # MODELS
     # ---
+    from tcm_app import replicas
     from tcm_app.models import db
     db.init_app(app)
-    migrate = Migrate(app, db)
+    replicas.init_app(app)
+    # Migrations are only run by the flask command, and importing Alembic
+    # slows down the start of workers.
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Violations by reporter
+    from tcm_app import cache
+    cache.violations.init_app(app)
+
+    # ---
+    # METRICS
+    # ---
+    from tcm_app import metrics, profiling
+    metrics.init_app(app)
+    profiling.init_app(app)
 
     # ---
     # AUTHORIZATION
@@ -41,6 +54,9 @@ def create_app():
     from tcm_app import auth
     app.register_blueprint(auth.bp)
     auth.oauth.init_app(app)
+    # API requests are stateless (identified by access token only)
+    app.session_interface = auth.StatelessSessionInterface(
+        app.session_interface, ['/api/', '/metrics'])
 
     # ---
     # API ENDPOINTS
@@ -49,88 +65,18 @@ def create_app():
     app.register_blueprint(api.bp)
 
     # ---
-    # SWAGGER
+    # CLI COMMANDS
     # ---
-    spec = APISpec(
-        title='Trade Compliance Monitor',
-        version='0.0.1',
-        openapi_version='3.0.2',
-        plugins=[
-            FlaskPlugin(),
-            MarshmallowPlugin(),
-        ],
-        tags=[{
-            'name': 'trades',
-        }],
-        components={
-            'securitySchemes': {
-                #  https://swagger.io/docs/specification/authentication/
-                'bearerAuth': {
-                    'type': 'http',
-                    'scheme': 'bearer',
-                    'bearerFormat': 'JWT'
-                },
-                # Alternative authorization. Requires pasting Client Id as well
-                # as checking boxes for scope, but applies the token
-                # automatically.
-                'implicitFlow': {
-                    'type': 'oauth2',
-                    'flows': {
-                        'implicit': {
-                            'authorizationUrl': (
-                                '{}/authorize?audience={}'.format(
-                                    app.config['AUTH0_API_BASE_URL'],
-                                    app.config['AUTH0_AUDIENCE']
-                                )
-                            ),
-                            'scopes': {
-                                'openid': '',
-                                'email': ''
-                            }
-                        }
-                    }
-                },
+    from tcm_app import checkpoints, imports, openapi
+    imports.cli.add_command(checkpoints.checkpoint_command)
+    app.cli.add_command(imports.cli)
+    app.cli.add_command(openapi.openapi_command)
 
-                # # Currently not implemented
-                # # Alternative authorization. Requires pasting Client Id and
-                # # Secret as well as checking boxes for scope, but applies the
-                # # token automatically.
-                # 'authorizationCodeFlow': {
-                #     'type': 'oauth2',
-                #     'flows': {
-                #         'authorizationCode': {
-                #             'authorizationUrl': (
-                #                 '{}/authorize?audience={}'.format(
-                #                     app.config['AUTH0_API_BASE_URL'],
-                #                     app.config['AUTH0_AUDIENCE']
-                #                 )
-                #             ),
-                #             'tokenUrl': '{}/oauth/token'.format(
-                #                 app.config['AUTH0_API_BASE_URL']
-                #             ),
-                #             'scopes': {
-                #                 'openid': '',
-                #                 'email': ''
-                #             }
-                #         }
-                #     }
-                # }
-            }
-        },
-        security=[
-            {
-                'bearerAuth': [],
-            },
-            {
-                'implicitFlow': []
-            },
-            # # Currently not implemented
-            # {
-            #     'authorizationCodeFlow': []
-            # }
-        ]
-    )
-    swagger_template = spec.to_flasgger(app, definitions=[TradeSchema])
+    # ---
+    # SWAGGER
+    # ---
+    # Built once and cached, see tcm_app.openapi
+    swagger_template = openapi.template(app)
 
     app.config['SWAGGER'] = {
         'uiversion': '3',
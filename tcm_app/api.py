@@ -1,29 +1,100 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
+from functools import wraps
+from hashlib import sha256
+from itertools import groupby
+from operator import attrgetter
 
 from flasgger import SwaggerView
 from flask import (
-    Blueprint, abort, current_app, jsonify, make_response, request)
+    Blueprint, Response, abort, current_app, json, jsonify, make_response,
+    request, stream_with_context, url_for)
 from marshmallow import ValidationError
+from simplejson import RawJSON
 from werkzeug.exceptions import HTTPException
 
+from tcm_app import (
+    cache, checkpoints, evaluation, fifo, imports, ledger, metrics, replicas)
 from tcm_app.auth import require_token
 from tcm_app.models import (
-  Trade, TradePaperTrail, db, trade_schema, trades_schema)
-import pandas as pd
+  ReporterVersion, Trade, db, load_trades, trade_schema,
+  trade_serializer, trades_schema)
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+STREAM_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def conditional_on_version(firm_wide=False):
+    """Decorator for GET endpoints (below require_token), responding 304 Not
+    Modified when If-None-Match holds the ETag of the current version of the
+    reporter's trades (or of all trades), without querying them. Responses
+    get ETag and Last-Modified headers of that version, which is available
+    to the endpoint as self.version. Reads of the endpoint may be routed to
+    a replica (see tcm_app.replicas).
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(self, *args, **kwargs):
+            scope = '*' if firm_wide else self.email
+            # Of the database read from, see tcm_app.replicas
+            version, modified_at = replicas.route(
+                None if firm_wide else self.email)
+            # Weak, as key order of serialised trades varies by process.
+            etag = sha256(f'{scope}:{version}'.encode()).hexdigest()[:32]
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                self.version = version
+                response = f(self, *args, **kwargs)
+            response.set_etag(etag, weak=True)
+            if modified_at is not None:
+                response.last_modified = modified_at
+            return response
+        return wrapper
+    return decorator
+
 
 class TradesView(SwaggerView):
     tags = ['trades']
 
     @require_token('get:trades')
+    @conditional_on_version()
     def get(self):
         """
         Fetch all trades reported by authenticated user
         ---
+        parameters:
+        - name: limit
+          in: query
+          description: >
+            Maximum number of trades per page, clamped to at most 1000 (by
+            default).
+          required: false
+          schema:
+            type: integer
+            minimum: 1
+        - name: cursor
+          in: query
+          description: >
+            Position to continue from, as given by the next link of the
+            previous page.
+          required: false
+          schema:
+            type: string
         responses:
           200:
+            headers:
+              Link:
+                description: >
+                  Link to the next page (rel="next") when there are more
+                  trades.
+                schema:
+                  type: string
             content:
               application/json:
                 schema:
@@ -32,13 +103,18 @@ class TradesView(SwaggerView):
                     $ref: '#/components/schemas/Trade'
           204:
             description: When no trades exist.
+          304:
+            description: >
+              When trades are unchanged since the ETag given by
+              If-None-Match.
         """
         # Query DB for trades filtered by email (from userinfo via JWT)
-        trades = Trade.query.filter_by(reporter=self.email).all()
+        trades, next_cursor = paginate(
+            query_trade_rows().filter(Trade.reporter == self.email))
         if len(trades) == 0:
             return make_response_204()
-        result = trades_schema.dump(trades)
-        return jsonify(result)
+        result = dump_trades(trades)
+        return make_response_page(result, next_cursor)
 
     @require_token('post:trades')
     def post(self):
@@ -95,6 +171,380 @@ bp.add_url_rule(
 )
 
 
+class TradesBatchView(SwaggerView):
+    tags = ['trades']
+
+    @require_token('post:trades')
+    def post(self):
+        """
+        Report a batch of trades (for the authenticated user)
+        ---
+        parameters:
+        - name: mode
+          in: query
+          description: >
+            With atomic (default) no trade is reported unless all are valid.
+            With partial valid trades are reported even if others are not.
+          required: false
+          schema:
+            type: string
+            enum: [atomic, partial]
+        requestBody:
+          description: >
+            Trades to be reported, as a JSON array or as newline delimited
+            JSON with one trade per line.
+          content:
+            application/json:
+              schema:
+                type: array
+                items:
+                  $ref: '#/components/schemas/Trade'
+            application/x-ndjson:
+              schema:
+                $ref: '#/components/schemas/Trade'
+          required: true
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    reported:
+                      type: integer
+                      description: Number of reported trades.
+                      example: 2
+                    errors:
+                      type: array
+                      description: Invalid trades (not reported).
+                      items:
+                        type: object
+                        properties:
+                          index:
+                            type: integer
+                            description: Position of trade in request.
+                            example: 1
+                          messages:
+                            type: object
+          422:
+            description: >
+              When any trade is invalid in atomic mode (none is reported).
+        """
+        mode = request.args.get('mode', 'atomic')
+        if mode not in ('atomic', 'partial'):
+            abort(400, 'Parameter mode must be one of: atomic, partial.')
+
+        json_data = get_json_list()
+        if not json_data:
+            abort(400, 'No input data provided.')
+
+        # Validate and deserialize input
+        valid, errors = load_trades(json_data)
+        errors = [{'index': index, 'messages': messages}
+                  for index, messages in sorted(errors.items())]
+        if errors and mode == 'atomic':
+            response = jsonify(reported=0, errors=errors)
+            response.status_code = 422
+            return response
+
+        reported_at = datetime.utcnow()
+        rows = [dict(data, reporter=self.email, reported_at=reported_at)
+                for _, data in valid]
+        if rows:
+            Trade.bulk_create(
+                rows, current_app.config['TRADES_BATCH_CHUNK_SIZE'])
+
+        return jsonify(reported=len(rows), errors=errors)
+
+    @require_token('patch:trades')
+    def patch(self):
+        """
+        Update a batch of trades (for the authenticated user)
+        ---
+        description: >
+          All trades are updated in a single transaction, hence none is
+          unless all are valid and found. A paper trail of the previous
+          trade records is kept.
+        requestBody:
+          description: >
+            Trades to be updated, each with its id, as a JSON array or as
+            newline delimited JSON with one trade per line.
+          content:
+            application/json:
+              schema:
+                type: array
+                items:
+                  allOf:
+                  - $ref: '#/components/schemas/Trade'
+                  - type: object
+                    required: [id]
+            application/x-ndjson:
+              schema:
+                allOf:
+                - $ref: '#/components/schemas/Trade'
+                - type: object
+                  required: [id]
+          required: true
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    updated:
+                      type: integer
+                      description: >
+                        Number of updated trades (excluding those identical
+                        to what already exists).
+                      example: 1
+                    results:
+                      type: array
+                      items:
+                        type: object
+                        properties:
+                          index:
+                            type: integer
+                            description: Position of trade in request.
+                            example: 0
+                          id:
+                            type: integer
+                            example: 1
+                          status:
+                            type: string
+                            enum: [updated, unchanged]
+                          trade:
+                            $ref: '#/components/schemas/Trade'
+                    errors:
+                      type: array
+                      items:
+                        type: object
+          422:
+            description: >
+              When any trade is invalid or not found (none is updated), with
+              errors of the same form as when reporting a batch.
+        """
+        json_data = get_json_list()
+        if not json_data:
+            abort(400, 'No input data provided.')
+
+        ids, id_errors = load_trade_ids([
+            item.pop('id', None) if isinstance(item, dict) else None
+            for item in json_data])
+        valid, errors = load_trades(json_data)
+        for index, messages in id_errors.items():
+            errors.setdefault(index, {}).update(messages)
+        if errors:
+            return batch_errors_response(errors, updated=0)
+
+        serialised, missing = Trade.bulk_update_reported(
+            self.email, {ids[index]: data for index, data in valid},
+            current_app.config['TRADES_BATCH_CHUNK_SIZE'])
+        if missing:
+            return batch_errors_response(missing_trade_errors(ids, missing),
+                                         updated=0)
+
+        results = []
+        for index, id in enumerate(ids):
+            if serialised[id] is None:  # Identical to what already exists
+                results.append(
+                    {'index': index, 'id': id, 'status': 'unchanged'})
+            else:
+                results.append({'index': index, 'id': id, 'status': 'updated',
+                                'trade': serialised[id]})
+        return jsonify(
+            updated=sum(result['status'] == 'updated' for result in results),
+            results=results, errors=[])
+
+    @require_token('delete:trades')
+    def delete(self):
+        """
+        Delete a batch of trades (for the authenticated user)
+        ---
+        description: >
+          All trades are deleted in a single transaction, hence none is
+          unless all are found. A paper trail of the deleted trades is kept.
+        requestBody:
+          description: Ids of trades to be deleted, as a JSON array.
+          content:
+            application/json:
+              schema:
+                type: array
+                items:
+                  type: integer
+                  format: int64
+                example: [1, 2]
+          required: true
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    deleted:
+                      type: integer
+                      description: Number of deleted trades.
+                      example: 2
+                    results:
+                      type: array
+                      items:
+                        type: object
+                        properties:
+                          index:
+                            type: integer
+                            description: Position of id in request.
+                            example: 0
+                          id:
+                            type: integer
+                            example: 1
+                          status:
+                            type: string
+                            enum: [deleted]
+                    errors:
+                      type: array
+                      items:
+                        type: object
+          422:
+            description: >
+              When any id is invalid or not found (none is deleted), with
+              errors of the same form as when reporting a batch.
+        """
+        json_data = get_json_list()
+        if not json_data:
+            abort(400, 'No input data provided.')
+
+        ids, errors = load_trade_ids(json_data)
+        if errors:
+            return batch_errors_response(errors, deleted=0)
+
+        missing = Trade.bulk_delete_reported(
+            self.email, ids, current_app.config['TRADES_BATCH_CHUNK_SIZE'])
+        if missing:
+            return batch_errors_response(missing_trade_errors(ids, missing),
+                                         deleted=0)
+
+        return jsonify(deleted=len(ids), results=[
+            {'index': index, 'id': id, 'status': 'deleted'}
+            for index, id in enumerate(ids)], errors=[])
+
+
+bp.add_url_rule(
+    '/trades/batch',
+    view_func=TradesBatchView.as_view('trades_batch_endpoint'),
+    methods=['POST', 'PATCH', 'DELETE']
+)
+
+
+class TradesImportView(SwaggerView):
+    tags = ['trades']
+
+    @require_token('post:trades')
+    def post(self):
+        """
+        Import trades from a CSV or Parquet file (for the authenticated user)
+        ---
+        parameters:
+        - name: mode
+          in: query
+          description: >
+            With atomic (default) no trade is imported unless all are valid.
+            With partial valid trades are imported even if others are not.
+          required: false
+          schema:
+            type: string
+            enum: [atomic, partial]
+        - name: format
+          in: query
+          description: File format, by default from the file extension.
+          required: false
+          schema:
+            type: string
+            enum: [csv, parquet]
+        requestBody:
+          description: >
+            File of trades, CSV with a header row or Parquet, with columns
+            named as the fields of a trade.
+          content:
+            multipart/form-data:
+              schema:
+                type: object
+                properties:
+                  file:
+                    type: string
+                    format: binary
+          required: true
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    rows:
+                      type: integer
+                      description: Number of rows in file.
+                      example: 2
+                    reported:
+                      type: integer
+                      description: Number of reported trades.
+                      example: 2
+                    invalid:
+                      type: integer
+                      description: Number of invalid rows.
+                      example: 0
+                    seconds:
+                      type: number
+                      description: Import duration.
+                    errors:
+                      type: array
+                      description: >
+                        Invalid rows (not reported), limited in number.
+                      items:
+                        type: object
+                        properties:
+                          index:
+                            type: integer
+                            description: Position of row in file.
+                            example: 1
+                          messages:
+                            type: object
+          422:
+            description: >
+              When any row is invalid in atomic mode (none is reported).
+        """
+        mode = request.args.get('mode', 'atomic')
+        if mode not in ('atomic', 'partial'):
+            abort(400, 'Parameter mode must be one of: atomic, partial.')
+
+        file = request.files.get('file')
+        if file is None or not file.filename:
+            abort(400, 'No file provided.')
+        format = request.args.get(
+            'format', file.filename.rsplit('.', 1)[-1].lower())
+        if format not in imports.FORMATS:
+            abort(400, 'Parameter format must be one of: {}.'.format(
+                ', '.join(imports.FORMATS)))
+
+        try:
+            counters, errors = imports.import_trades(
+                file.stream, format, self.email, atomic=mode == 'atomic')
+        except imports.FileFormatError as err:
+            abort(400, str(err))
+
+        response = jsonify(errors=errors, **counters)
+        if counters['invalid'] and mode == 'atomic':
+            response.status_code = 422
+        return response
+
+
+bp.add_url_rule(
+    '/trades/import',
+    view_func=TradesImportView.as_view('trades_import_endpoint'),
+    methods=['POST']
+)
+
+
 class TradeView(SwaggerView):
     tags = ['trades']
 
@@ -164,34 +614,13 @@ class TradeView(SwaggerView):
         except ValidationError as err:
             abort(422, err.messages)
 
-        # Query for existing trade
-        trade = Trade.query.filter_by(id=id, reporter=self.email).one_or_none()
-        if trade is None:  # Not a valid id for logged-in user
-            abort(404)
-
-        # Keep paper trail of previous trade record
-        trail = TradePaperTrail()
-        changed = False
-        for key, value in trade_updated_info.items():
-            current_value = getattr(trade, key)
-            setattr(trail, key, current_value)
-            if current_value != value:
-                setattr(trade, key, value)
-                changed = True
-
-        if changed:
-            trail.trade_id = id
-            trail.reporter = self.email
-            trail.reported_at = trade.reported_at
-            trade.reported_at = datetime.utcnow()
-            trail.trailed_at = trade.reported_at
-
-            # Persist in db and serialise
-            serialised_trade = trade.update()
-
-            return jsonify(serialised_trade)
-        else:
+        # Paper trail of the previous trade record kept, see
+        # Trade.update_reported
+        serialised_trade = Trade.update_reported(
+            id, self.email, trade_updated_info)
+        if serialised_trade is None:  # Identical to what already exists
             return make_response_204()
+        return jsonify(serialised_trade)
 
     @require_token('delete:trades')
     def delete(self, id):
@@ -210,24 +639,8 @@ class TradeView(SwaggerView):
           204:
             description: When deletion successful.
         """
-        # Query for existing trade
-        trade = Trade.query.filter_by(id=id, reporter=self.email).one_or_none()
-        if trade is None:  # Not a valid id for logged-in user
-            abort(404)
-
-        # Keep paper trail of deleted trade
-        trail = TradePaperTrail()
-        attributes = (
-            'isin', 'name', 'direction', 'quantity', 'price', 'currency',
-            'amount', 'date', 'reporter', 'reported_at')
-        for attribute in attributes:
-            setattr(trail, attribute, getattr(trade, attribute))
-        trail.trade_id = id
-        trail.trailed_at = datetime.utcnow()
-
-        # Persist data in database
-        db.session.add(trail)
-        trade.delete()
+        # Paper trail of the deleted trade kept, see Trade.delete_reported
+        Trade.delete_reported(id, self.email)
 
         return make_response_204()
 
@@ -243,6 +656,7 @@ class ViolationsView(SwaggerView):
     tags = ['violations']
 
     @require_token('get:violations')
+    @conditional_on_version()
     def get(self):
         """
         Fetch all trades (for authenticated user) violating holding period
@@ -280,20 +694,35 @@ class ViolationsView(SwaggerView):
                                 maxItems: 2
           204:
             description: When there are no trade violations.
+          304:
+            description: >
+              When trades are unchanged since the ETag given by
+              If-None-Match.
         """
-        # Query DB for trades filtered by email (from userinfo via JWT) and
-        # store in a Pandas dataframe.
-        trades = pd.read_sql(
-            Trade.query.filter_by(reporter=self.email).order_by(
-                Trade.date.asc()).statement,
-            db.session.bind
-        )
-
-        violations = find_violations(trades)
-        if violations is None:
+        # Cached for the current version of the reporter's trades
+        violations_json = cache.violations.get(self.email, self.version)
+        if violations_json is None:
+            source = positions_source()
+            if source is not None:
+                # Query DB for (mostly) already matched positions
+                with metrics.stage('match'):
+                    positions = dict(
+                        source.violating_positions([self.email]))
+                    violations = summarise_violations(
+                        positions.get(self.email, []))
+            else:
+                # Query DB for trades filtered by email (from userinfo via
+                # JWT) in chronological order per isin.
+                trades = Trade.query.filter_by(reporter=self.email).order_by(
+                    Trade.isin.asc(), Trade.date.asc(), Trade.id.asc()).all()
+                violations = find_violations(trades)
+            violations_json = dump_violations(violations)
+            cache.violations.put(self.email, self.version, violations_json)
+
+        if violations_json == 'null':
             return make_response_204()
 
-        return jsonify(violations)
+        return jsonify(RawJSON(violations_json))
 
 
 bp.add_url_rule(
@@ -307,12 +736,38 @@ class AllTradesView(SwaggerView):
     tags = ['all-trades']
 
     @require_token('get:all-trades')
+    @conditional_on_version(firm_wide=True)
     def get(self):
         """
         Fetch all trades reported by any reporter
         ---
+        parameters:
+        - name: limit
+          in: query
+          description: >
+            Maximum number of trades per page, clamped to at most 1000 (by
+            default).
+          required: false
+          schema:
+            type: integer
+            minimum: 1
+        - name: cursor
+          in: query
+          description: >
+            Position to continue from, as given by the next link of the
+            previous page.
+          required: false
+          schema:
+            type: string
         responses:
           200:
+            headers:
+              Link:
+                description: >
+                  Link to the next page (rel="next") when there are more
+                  trades.
+                schema:
+                  type: string
             content:
               application/json:
                 schema:
@@ -321,13 +776,17 @@ class AllTradesView(SwaggerView):
                     $ref: '#/components/schemas/Trade'
           204:
             description: When no trades exist.
+          304:
+            description: >
+              When trades are unchanged since the ETag given by
+              If-None-Match.
         """
         # Query DB for all trades
-        trades = Trade.query.all()
+        trades, next_cursor = paginate(query_trade_rows())
         if len(trades) == 0:
             return make_response_204()
-        result = trades_schema.dump(trades)
-        return jsonify(result)
+        result = dump_trades(trades)
+        return make_response_page(result, next_cursor)
 
 
 bp.add_url_rule(
@@ -341,13 +800,34 @@ class AllViolationsView(SwaggerView):
     tags = ['all-violations']
 
     @require_token('get:all-violations')
+    @conditional_on_version(firm_wide=True)
     def get(self):
         """
         Fetch all trades (for all users) violating holding period regulation
         ---
+        parameters:
+        - name: stream
+          in: query
+          description: >
+            Stream violations one reporter at a time, either as newline
+            delimited JSON (ndjson) with one reporter per line or as a JSON
+            array (json). Reporters are then ordered as stored in the db.
+          required: false
+          schema:
+            type: string
+            enum: [ndjson, json]
         responses:
           200:
             content:
+              application/x-ndjson:
+                schema:
+                  type: object
+                  properties:
+                    reporter:
+                      type: string
+                      example: john.doe@example.com
+                    data:
+                      type: object
               application/json:
                 schema:
                   type: array
@@ -385,20 +865,44 @@ class AllViolationsView(SwaggerView):
                                       maxItems: 2
           204:
             description: When there are no trade violations.
+          304:
+            description: >
+              When trades are unchanged since the ETag given by
+              If-None-Match.
         """
-        # Query DB for all trades and store in a Pandas dataframe.
-        trades = pd.read_sql(
-            Trade.query.order_by(Trade.date.asc()).statement, db.session.bind)
-
-        # # One list item per ISIN.
+        stream = request.args.get('stream')
+        if stream is not None:
+            if stream not in STREAM_MIMETYPES:
+                abort(400, 'Parameter stream must be one of: {}.'.format(
+                    ', '.join(STREAM_MIMETYPES)))
+            return stream_violations(stream)
+
+        # Violations (as JSON) by reporter, cached for the current version of
+        # each reporter's trades. Only reporters missing are searched.
+        versions = dict(db.session.query(
+            ReporterVersion.reporter, ReporterVersion.version))
+        violations_json = {}
+        for reporter, version in versions.items():
+            cached = cache.violations.get(reporter, version)
+            if cached is not None:
+                violations_json[reporter] = cached
+        missing = sorted(versions.keys() - violations_json.keys())
+        if missing:
+            with metrics.stage('match'):
+                found = dict(find_violations_by_reporter(missing))
+            for reporter in missing:
+                violations_json[reporter] = dump_violations(
+                    found.get(reporter))
+                cache.violations.put(
+                    reporter, versions[reporter], violations_json[reporter])
+
+        # # One list item per reporter.
         violations_by_reporter = []
-        by_reporter = trades.groupby('reporter')
-        for reporter, trades_ in by_reporter:
-            violations = find_violations(trades_)
-            if violations is not None:
+        for reporter in sorted(violations_json):
+            if violations_json[reporter] != 'null':
                 violations_by_reporter.append({
                     'reporter': reporter,
-                    'data': violations
+                    'data': RawJSON(violations_json[reporter])
                 })
 
         if len(violations_by_reporter) == 0:
@@ -425,98 +929,100 @@ def errorhandler(ex):
 
 def find_violations(trades):
     """Searches for trade violations by matching buy and sell trades on a
-    First In, First Out (FIFO) basis.
+    First In, First Out (FIFO) basis. Trades must be given in chronological
+    order (at least per ISIN).
     """
 
     if len(trades) == 0:
         return None
     # Check uniqueness
-    if len(trades['reporter'].unique()) != 1:
-        raise Exception('DataFrame "trades" must include only one reporter.')
+    if len({trade.reporter for trade in trades}) != 1:
+        raise Exception('"trades" must include only one reporter.')
 
+    with metrics.stage('match'):
+        return summarise_violations(fifo.match_by_isin(trades))
+
+
+def positions_source():
+    """Returns the module finding violating positions without matching all
+    trades, as configured: tcm_app.ledger, tcm_app.checkpoints or None.
+    """
+    if current_app.config['VIOLATIONS_FROM_LEDGER']:
+        return ledger
+    if current_app.config['VIOLATIONS_FROM_CHECKPOINTS']:
+        return checkpoints
+    return None
+
+
+def find_violations_by_reporter(reporters):
+    """Searches trades of reporters for violations. Returns (reporter,
+    violations) tuples, leaving out some reporters without violations.
+    """
+    source = positions_source()
+    if source is not None:
+        # Query DB for (mostly) already matched positions
+        return (
+            (reporter, summarise_violations(positions))
+            for reporter, positions in source.violating_positions(reporters))
+
+    # Query DB for trades in chronological order per reporter and isin, and
+    # match them, possibly in parallel, per reporter.
+    trades = Trade.query.filter(Trade.reporter.in_(reporters)).order_by(
+        Trade.reporter.asc(), Trade.isin.asc(), Trade.date.asc(),
+        Trade.id.asc()).all()
+    pairs_by_reporter = evaluation.violating_pairs(
+        trades,
+        executor=current_app.config['VIOLATIONS_EXECUTOR'],
+        workers=current_app.config['VIOLATIONS_WORKERS'],
+        threshold=current_app.config['VIOLATIONS_PARALLEL_THRESHOLD'])
+    trades_by_id = {trade.id: trade for trade in trades}
+    return (
+        (reporter, summarise_violations(
+            (isin, [fifo.ClosedPosition(
+                trades_by_id[buy_id], trades_by_id[sell_id], None)
+                for buy_id, sell_id in pairs])
+            for isin, pairs in by_isin))
+        for reporter, by_isin in pairs_by_reporter)
+
+
+def dump_violations(violations):
+    """Serialises violations (or None) as compact JSON, as cached."""
+    with metrics.stage('serialise'):
+        return json.dumps(violations, separators=(',', ':'))
+
+
+def summarise_violations(closed_positions_by_isin):
+    """Summarises closed positions, given as (isin, closed positions) tuples
+    in ISIN order, violating holding period regulation.
+    """
     violations_by_isin = []
     ctr_violations = 0
-    grouped_by_isin = trades.groupby('isin')
-    for isin, trades in grouped_by_isin:
-        # Create separate DataFrames for buy and sell.
-        by_direction = trades.groupby('direction')
-        if len(by_direction) == 1:
+    for isin, closed_positions in closed_positions_by_isin:
+        # Only interested in profitable trades violating holding period
+        violating = [p for p in closed_positions if p.violating]
+        if len(violating) == 0:
             continue
 
-        buy = by_direction.get_group('Buy').copy(deep=False)
-        buy.reset_index(drop=True, inplace=True)
-        sell = by_direction.get_group('Sell').copy(deep=False)
-        sell.reset_index(drop=True, inplace=True)
-
-        closed_positions = pd.DataFrame(
-            columns=['buy_id', 'sell_id', 'qty', 'duration'])
-
-        while len(buy) and len(sell):
-            tmp = pd.DataFrame(data={
-                'buy_id': [buy.loc[0, 'id']],
-                'sell_id': [sell.loc[0, 'id']],
-                'buy_price': [buy.loc[0, 'price']],
-                'sell_price': [sell.loc[0, 'price']],
-                'qty': [buy.loc[0, 'quantity'] - sell.loc[0, 'quantity']],
-                'duration': [
-                    abs(buy.loc[0, 'date'] - sell.loc[0, 'date']).days]
+        violating_by_duration = []
+        by_duration = groupby(
+            sorted(violating, key=attrgetter('duration')),
+            key=attrgetter('duration'))
+        for duration, positions in by_duration:
+            buy_sell_pairs = []
+            for position in positions:
+                # Trades are serialised from the already loaded rows, in the
+                # same (id) order as they used to be queried from the db.
+                trade_data = sorted(
+                    (position.buy, position.sell), key=attrgetter('id'))
+                buy_sell_pairs.append(dump_trades(trade_data))
+                ctr_violations += 1
+
+            violating_by_duration.append({
+                'duration': duration,
+                'data': buy_sell_pairs
             })
-            if tmp.loc[0, 'qty'] == 0:
-                tmp.loc[0, 'qty'] = buy.loc[0, 'quantity']
-                buy.drop(0, inplace=True)
-                buy.reset_index(drop=True, inplace=True)
-                sell.drop(0, inplace=True)
-                sell.reset_index(drop=True, inplace=True)
-            elif tmp.loc[0, 'qty'] < 0:
-                sell.loc[0, 'quantity'] = abs(tmp.loc[0, 'qty'])
-                tmp.loc[0, 'qty'] = buy.loc[0, 'quantity']
-                buy.drop(0, inplace=True)
-                buy.reset_index(drop=True, inplace=True)
-            else:
-                buy.loc[0, 'quantity'] = abs(tmp.loc[0, 'qty'])
-                tmp.loc[0, 'qty'] = sell.loc[0, 'quantity']
-                sell.drop(0, inplace=True)
-                sell.reset_index(drop=True, inplace=True)
 
-            closed_positions = closed_positions.append(tmp)
-
-        # Only interested in profitable trades violating holding period
-        too_quick = closed_positions.duration < 32
-        with_profit = closed_positions.buy_price < closed_positions.sell_price
-        violating = closed_positions[too_quick & with_profit]
-
-        if len(violating) != 0:
-            violating_by_duration = []
-            by_duration = violating.groupby('duration')
-            for duration, position_df in by_duration:
-                buy_sell_pairs = []
-                for i in range(len(position_df)):
-                    # ---------------------------------------------------------
-                    # Use buy_id and sell_id from position table to query db
-                    # for the corresponding trades (again even though we
-                    # already have them in a dataframe).
-                    # WHY not using Pandas to_dict method?
-                    # When importing using read_sql() certain types are
-                    # converted to something we don't want (e.g. decimal to
-                    # numeric), and when exporting using
-                    # to_dict(orient='records') datetime turns into Timespan.
-                    # However, with few expected violating trades querying the
-                    # database again should be fine.
-                    # ---------------------------------------------------------
-                    trade_data = Trade.query.filter(
-                        Trade.id.in_(
-                            (position_df.iloc[i, 0], position_df.iloc[i, 1])
-                        )
-                    ).all()
-                    buy_sell_pairs.append(trades_schema.dump(trade_data))
-                    ctr_violations += 1
-
-                violating_by_duration.append({
-                    'duration': duration,
-                    'data': buy_sell_pairs
-                })
-
-            violations_by_isin.append(violating_by_duration)
+        violations_by_isin.append(violating_by_duration)
 
     if ctr_violations == 0:
         return None
@@ -524,6 +1030,195 @@ def find_violations(trades):
     return {'violations': ctr_violations, 'data': violations_by_isin}
 
 
+def iter_violations_by_reporter():
+    """Yields violations one reporter at a time, reading (and holding) no
+    more than a single reporter's trades or positions at once.
+    """
+    batch_size = current_app.config['VIOLATIONS_STREAM_BATCH_SIZE']
+    if current_app.config['VIOLATIONS_FROM_LEDGER']:
+        for reporter, positions in ledger.violating_positions(
+                batch_size=batch_size):
+            with metrics.stage('match'):
+                violations = summarise_violations(positions)
+            yield reporter, violations
+    else:
+        # Server-side cursor (where supported) over all trades, grouped by
+        # reporter and isin in chronological order.
+        trades = Trade.query.order_by(
+            Trade.reporter.asc(), Trade.isin.asc(), Trade.date.asc(),
+            Trade.id.asc()).yield_per(batch_size)
+        for reporter, trades_ in groupby(trades, key=attrgetter('reporter')):
+            yield reporter, find_violations(list(trades_))
+
+
+def stream_violations(stream):
+    """Returns a streamed response of violations by reporter, either as
+    newline delimited JSON ('ndjson') or as a JSON array ('json').
+    """
+    items = (
+        json.dumps({'reporter': reporter, 'data': violations},
+                   separators=(',', ':'))
+        for reporter, violations in iter_violations_by_reporter()
+        if violations is not None)
+
+    first = next(items, None)
+    if first is None:
+        return make_response_204()
+
+    def generate():
+        if stream == 'ndjson':
+            yield first + '\n'
+            for item in items:
+                yield item + '\n'
+        else:
+            yield '[' + first
+            for item in items:
+                yield ',' + item
+            yield ']\n'
+
+    return Response(
+        stream_with_context(generate()), mimetype=STREAM_MIMETYPES[stream])
+
+
+def get_json_list():
+    """Returns request body as a list, parsed either as newline delimited
+    JSON (by mimetype) or as a JSON array.
+    """
+    if request.mimetype == STREAM_MIMETYPES['ndjson']:
+        items = []
+        for number, line in enumerate(
+                request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                abort(400, f'Line {number} is not valid JSON.')
+        return items
+
+    json_data = request.get_json()
+    if json_data is not None and not isinstance(json_data, list):
+        abort(400, 'Input data must be a list.')
+    return json_data
+
+
+def load_trade_ids(values):
+    """Validates values as ids of distinct trades. Returns the ids (by
+    position in values) and error messages by index.
+    """
+    ids, errors, seen = [], {}, set()
+    for index, id in enumerate(values):
+        if id is None:
+            errors[index] = {'id': ['Missing data for required field.']}
+        elif not isinstance(id, int) or isinstance(id, bool):
+            errors[index] = {'id': ['Not a valid integer.']}
+        elif id in seen:
+            errors[index] = {'id': ['Duplicate id.']}
+        else:
+            seen.add(id)
+        ids.append(id)
+    return ids, errors
+
+
+def missing_trade_errors(ids, missing):
+    """Returns error messages by index for ids of trades not found."""
+    missing = set(missing)
+    return {index: {'id': ['No such trade.']}
+            for index, id in enumerate(ids) if id in missing}
+
+
+def batch_errors_response(errors, **counters):
+    """Returns a 422 response of a batch of which nothing was written, with
+    errors (messages by index) and counters.
+    """
+    response = jsonify(**counters, results=[], errors=[
+        {'index': index, 'messages': messages}
+        for index, messages in sorted(errors.items())])
+    response.status_code = 422
+    return response
+
+
+def query_trade_rows():
+    """Returns a query of trades as rows of column values, which are faster
+    to load than entities when only serialised.
+    """
+    return db.session.query(*Trade.__table__.columns)
+
+
+def dump_trades(trades):
+    """Serialises trades (entities or rows) for jsonify, by the precompiled
+    trade serializer unless responses are pretty printed (which it does not
+    indent for).
+    """
+    with metrics.stage('serialise'):
+        if (current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or
+                current_app.debug):
+            return trades_schema.dump(trades)
+        return trade_serializer.raw(
+            trades, current_app.config['JSON_AS_ASCII'])
+
+
+def encode_cursor(id):
+    """Encodes the id of the last trade on a page as an opaque cursor."""
+    return urlsafe_b64encode(str(id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor into the id of the last trade on previous page."""
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        return int(urlsafe_b64decode(cursor + padding).decode())
+    except ValueError:
+        abort(400, 'Parameter cursor is not valid.')
+
+
+def paginate(query):
+    """Fetches a page of trades from query by keyset pagination on id,
+    according to request parameters limit and cursor. Without limit all
+    trades (after cursor) are fetched, unless a default limit is configured.
+    A limit is clamped to TRADES_MAX_LIMIT. Returns trades together with a
+    cursor to the next page (None if last).
+    """
+    limit = request.args.get('limit')
+    if limit is None:
+        limit = current_app.config['TRADES_DEFAULT_LIMIT']
+    else:
+        # Not by type=int, which would ignore a malformed limit.
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            abort(400, 'Parameter limit must be a positive integer.')
+    if limit is not None:
+        limit = min(limit, current_app.config['TRADES_MAX_LIMIT'])
+    cursor = request.args.get('cursor')
+
+    # A range scan on id, instead of an offset, never reads skipped rows.
+    query = query.order_by(Trade.id.asc())
+    if cursor is not None:
+        query = query.filter(Trade.id > decode_cursor(cursor))
+    if limit is None:
+        return query.all(), None
+
+    trades = query.limit(limit + 1).all()
+    if len(trades) > limit:
+        return trades[:limit], encode_cursor(trades[limit - 1].id)
+    return trades, None
+
+
+def make_response_page(result, next_cursor):
+    """Returns a JSON response of a page with a Link header to the next page.
+    """
+    response = jsonify(result)
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        url = url_for(request.endpoint, _external=True, **args)
+        response.headers['Link'] = f'<{url}>; rel="next"'
+    return response
+
+
 def make_response_204():
     """Returns a 204 No Content response.
     """
@@ -1,15 +1,23 @@
 import json
+from collections import OrderedDict
 from functools import wraps
+from hashlib import sha256
+from threading import Lock
+from time import monotonic, time
 from urllib.parse import urlencode
 
 from authlib.integrations.flask_client import OAuth
 from flask import (
     Blueprint, abort, current_app, jsonify, redirect, render_template, request,
     session, url_for)
-from jose import jwt
+from flask.sessions import SessionInterface
+from jose import jwk, jwt
+from jose.utils import base64url_decode
 from six.moves.urllib import request as six_request
 from werkzeug.exceptions import HTTPException
 
+from tcm_app import metrics
+
 
 # ---
 # AUTH0 LOGIN   (based on https://auth0.com/docs/quickstart/webapp/python)
@@ -24,6 +32,25 @@ auth0 = oauth.register(
     client_kwargs={'scope': 'openid email'})
 
 
+class StatelessSessionInterface(SessionInterface):
+    """Wraps a session interface, leaving out requests to paths starting with
+    any of the given prefixes. Such requests get a null session and never
+    read from or write to the session backend.
+    """
+
+    def __init__(self, session_interface, prefixes):
+        self.session_interface = session_interface
+        self.prefixes = tuple(prefixes)
+
+    def open_session(self, app, request):
+        if request.path.startswith(self.prefixes):
+            return None  # Flask then makes a null session
+        return self.session_interface.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.session_interface.save_session(app, session, response)
+
+
 def require_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -104,9 +131,67 @@ def get_token_auth_header():
     return token
 
 
+class TokenCache:
+    """Process-wide, size bounded, least recently used (LRU) cache of
+    verified JWT payloads keyed by a hash of the token. Entries expire at the
+    token's exp claim. Permissions of cached payloads are kept as a frozenset.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._payloads = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        """Returns the cached payload of token, or None."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._payloads.get(key)
+            if entry is not None and entry[0] > time():
+                self._payloads.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._payloads[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload, maxsize):
+        """Caches the verified payload of token, returning the cached payload.
+        Tokens without an exp claim are not cached.
+        """
+        payload = dict(payload)
+        if 'permissions' in payload:
+            payload['permissions'] = frozenset(payload['permissions'])
+        if not isinstance(payload.get('exp'), (int, float)) or maxsize <= 0:
+            return payload
+        key = self._key(token)
+        with self._lock:
+            self._payloads[key] = (payload['exp'], payload)
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > maxsize:
+                self._payloads.popitem(last=False)
+        return payload
+
+    def stats(self):
+        """Returns hit and miss counters and current size."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._payloads)}
+
+
+verified_tokens = TokenCache()
+
+
 def check_permissions(permission, payload):
     """Checks whether JWT payload includes any of listed items in permission.
-    Raises an exception when no permission.
+    Raises an exception when no permission. Permissions of payloads from
+    verify_decode_jwt are a frozenset, hence a constant time lookup.
     """
     if ('permissions' not in payload or
             permission not in payload['permissions']):
@@ -116,10 +201,96 @@ def check_permissions(permission, payload):
     return True
 
 
+class JWKSCache:
+    """Process-wide cache of the signing keys in the identity provider's JSON
+    Web Key Set (JWKS), parsed into key objects once per fetch.
+
+    The set is fetched again when older than JWKS_TTL seconds, or when a key
+    id is unknown, but at most once every JWKS_MIN_REFRESH_INTERVAL seconds
+    whether fetching succeeds or not. The previous keys are used while
+    fetching fails. Only one thread fetches at a time, others wait for and
+    use its result.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._url = None
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._attempts = 0  # Completed attempts to fetch
+
+    def get_key(self, kid):
+        """Returns the key with key id kid, or None if there is no such key.
+        """
+        config = current_app.config
+        url = '{}/.well-known/jwks.json'.format(config['AUTH0_API_BASE_URL'])
+        attempts = self._attempts
+        if self._url == url:
+            keys, now = self._keys, monotonic()
+            if now - self._fetched_at < config['JWKS_TTL'] and kid in keys:
+                return keys[kid]
+            if now - self._attempted_at < config['JWKS_MIN_REFRESH_INTERVAL']:
+                return keys.get(kid)
+
+        with self._lock:
+            # Unless attempted by another thread while waiting.
+            if self._url != url or self._attempts == attempts:
+                self._fetch(url, config)
+            return self._keys.get(kid)
+
+    def _fetch(self, url, config):
+        try:
+            response = six_request.urlopen(url, timeout=config['JWKS_TIMEOUT'])
+            jwks = json.loads(response.read())
+        except Exception:
+            if self._url != url or not self._keys:
+                raise
+            # Keep using the previous keys, retried after a while.
+            current_app.logger.exception('Unable to refresh JWKS.')
+            self._attempted_at = monotonic()
+            self._attempts += 1
+            return
+
+        keys = {}
+        for key in jwks['keys']:
+            if key.get('kty') != 'RSA' or key.get('use', 'sig') != 'sig':
+                continue
+            keys[key['kid']] = jwk.construct({
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use', 'sig'),
+                'n': key['n'],
+                'e': key['e']
+            }, 'RS256')
+        self._url, self._keys, self._fetched_at = url, keys, monotonic()
+        self._attempted_at = self._fetched_at
+        self._attempts += 1
+
+
+jwks = JWKSCache()
+
+
+def verify_signature(token, key, header):
+    """Verifies the RS256 signature of a JWT using a parsed key.
+    Raises an exception when not valid.
+    """
+    if header.get('alg') != 'RS256':
+        raise jwt.JWTError('The specified alg value is not allowed')
+    signing_input, _, crypto_segment = token.encode('utf-8').rpartition(b'.')
+    if not key.verify(signing_input, base64url_decode(crypto_segment)):
+        raise jwt.JWTError('Signature verification failed.')
+
+
 def verify_decode_jwt(token):
     """Partly based on example at
     https://auth0.com/docs/quickstart/backend/python/01-authorization
+    Verified payloads are cached until the token expires.
     """
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return payload
+
     try:
         unverified_header = jwt.get_unverified_header(token)
     except jwt.JWTError as err:
@@ -127,29 +298,21 @@ def verify_decode_jwt(token):
     if 'kid' not in unverified_header:
         abort(401, description='Provided JWT malformed.')
 
-    jsonurl = six_request.urlopen('{}/.well-known/jwks.json'.format(
-        current_app.config['AUTH0_API_BASE_URL']))
-    jwks = json.loads(jsonurl.read())
-    rsa_key = {}
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks.get_key(unverified_header['kid'])
     if rsa_key:
         try:
+            verify_signature(token, rsa_key, unverified_header)
+            # Signature already verified using the parsed key.
             payload = jwt.decode(
                 token,
-                rsa_key,
+                '',
                 algorithms='RS256',
                 audience=current_app.config['AUTH0_AUDIENCE'],
-                issuer=current_app.config['AUTH0_API_BASE_URL'] + '/')
+                issuer=current_app.config['AUTH0_API_BASE_URL'] + '/',
+                options={'verify_signature': False})
 
-            return payload
+            return verified_tokens.put(
+                token, payload, current_app.config['TOKEN_CACHE_SIZE'])
 
         except jwt.ExpiredSignatureError:
             abort(401, description='Provided JWT has expired.')
@@ -163,19 +326,62 @@ def verify_decode_jwt(token):
         401, description='Unable to find the appropriate key in provided JWT.')
 
 
-def get_email(token):
-    """Get email from cookie or userinfo endpoint.
+class TTLCache:
+    """Process-wide, size bounded cache of values expiring ttl seconds after
+    being cached. When full, the oldest entry is evicted.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values = OrderedDict()
+
+    def get(self, key):
+        """Returns the cached value of key, or None."""
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= monotonic():
+                del self._values[key]
+                return None
+            return entry[1]
+
+    def put(self, key, value, ttl, maxsize):
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = (monotonic() + ttl, value)
+            while len(self._values) > maxsize:
+                self._values.popitem(last=False)
+
+
+emails = TTLCache()
+
+
+def get_email(token, payload):
+    """Get email from a custom claim of the access token, when configured and
+    present, otherwise from userinfo endpoint.
     https://auth0.com/docs/api/authentication#user-profile
-    From cookie when allready provided from userinfo endpoint.
+    From an in-memory cache keyed by the token's subject (sub) when already
+    provided from userinfo endpoint.
     """
-    if 'email' not in session:
+    claim = current_app.config['AUTH0_EMAIL_CLAIM']
+    if claim and claim in payload:
+        return payload[claim]
+
+    sub = payload.get('sub')
+    email = emails.get(sub) if sub is not None else None
+    if email is None:
         request = six_request.Request(
             url='{}/userinfo'.format(current_app.config['AUTH0_API_BASE_URL']),
             headers={'Authorization': 'Bearer ' + token})
-        response = six_request.urlopen(request)
+        response = six_request.urlopen(
+            request, timeout=current_app.config['USERINFO_TIMEOUT'])
         userinfo = json.loads(response.read())
-        session['email'] = userinfo['email']
-    return session['email']
+        email = userinfo['email']
+        if sub is not None:
+            emails.put(sub, email, current_app.config['USERINFO_CACHE_TTL'],
+                       current_app.config['USERINFO_CACHE_SIZE'])
+    return email
 
 
 def require_token(permission=''):
@@ -185,9 +391,11 @@ def require_token(permission=''):
         @wraps(f)
         def wrapper(self, *args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
-            self.email = get_email(token)
+            with metrics.stage('auth'):
+                payload = verify_decode_jwt(token)
+                check_permissions(permission, payload)
+            with metrics.stage('userinfo'):
+                self.email = get_email(token, payload)
             return f(self, *args, **kwargs)
         return wrapper
     return decorator_require_token
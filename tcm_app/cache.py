@@ -0,0 +1,154 @@
+"""Cache of violations by reporter.
+
+Violations of a reporter only change when the reporter's trades do, hence
+they are cached (as serialised JSON) together with the version of the
+reporter's trades they were found for (see models.ReporterVersion), and
+invalidated on every write. An entry of another version is never returned,
+even if an invalidation is lost (e.g. by another host's cache).
+
+The backend is any cachelib cache. By default an in-process LRU cache,
+otherwise a cache shared by all workers: 'filesystem' (one host) or 'redis'.
+"""
+import sys
+from collections import OrderedDict
+from threading import Lock
+
+from cachelib import BaseCache, FileSystemCache, NullCache, RedisCache
+
+
+def _sizeof(value):
+    """Returns the size of value, including the items of a tuple."""
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class LRUCache(BaseCache):
+    """In-process cache of at most threshold entries, evicting the least
+    recently used. Entries never expire (timeouts are ignored).
+    """
+
+    def __init__(self, threshold=500):
+        super().__init__()
+        self._threshold = threshold
+        self._lock = Lock()
+        self._values = OrderedDict()
+        self.nbytes = 0  # Size of cached values
+
+    def _pop(self, key):
+        value = self._values.pop(key, None)
+        if value is not None:
+            self.nbytes -= _sizeof(value)
+        return value
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None:
+                self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._pop(key)
+            self._values[key] = value
+            self.nbytes += _sizeof(value)
+            while len(self._values) > self._threshold:
+                self._pop(next(iter(self._values)))
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if key in self._values:
+                return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            return self._pop(key) is not None
+
+    def has(self, key):
+        with self._lock:
+            return key in self._values
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self.nbytes = 0
+        return True
+
+    def __len__(self):
+        return len(self._values)
+
+
+class ViolationsCache:
+    """Cache of violations by reporter, as (version, JSON) tuples."""
+
+    def __init__(self):
+        self.backend = NullCache()
+        self._hits = 0
+        self._misses = 0
+
+    def init_app(self, app):
+        """Creates the backend configured by VIOLATIONS_CACHE_TYPE."""
+        config = app.config
+        cache_type = config['VIOLATIONS_CACHE_TYPE']
+        if cache_type == 'memory':
+            self.backend = LRUCache(config['VIOLATIONS_CACHE_SIZE'])
+        elif cache_type == 'filesystem':
+            self.backend = FileSystemCache(
+                config['VIOLATIONS_CACHE_DIR'],
+                threshold=config['VIOLATIONS_CACHE_SIZE'], default_timeout=0)
+        elif cache_type == 'redis':
+            import redis  # Only required for this backend
+            self.backend = RedisCache(
+                host=redis.from_url(config['VIOLATIONS_CACHE_REDIS_URL']),
+                key_prefix='violations:', default_timeout=0)
+        elif cache_type == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError(f'Unknown violations cache "{cache_type}".')
+        self._hits = self._misses = 0
+
+    def get(self, reporter, version):
+        """Returns the cached JSON of reporter's violations for version of
+        the reporter's trades, or None.
+        """
+        entry = self.backend.get(reporter)
+        if entry is not None and entry[0] == version:
+            self._hits += 1
+            return entry[1]
+        self._misses += 1
+        return None
+
+    def put(self, reporter, version, violations_json):
+        self.backend.set(reporter, (version, violations_json))
+
+    def invalidate(self, reporter):
+        """Removes reporter's violations, after a write of the reporter's
+        trades. A failing backend only leaves an outdated (never returned)
+        entry, hence errors are not raised.
+        """
+        try:
+            self.backend.delete(reporter)
+        except Exception:
+            print(sys.exc_info())
+
+    def stats(self):
+        """Returns hits, misses and hit rate (of this process), and the
+        number and size of entries of an in-process backend.
+        """
+        lookups = self._hits + self._misses
+        stats = {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': self._hits / lookups if lookups else None,
+        }
+        if isinstance(self.backend, LRUCache):
+            stats['entries'] = len(self.backend)
+            stats['bytes'] = self.backend.nbytes
+        return stats
+
+
+violations = ViolationsCache()
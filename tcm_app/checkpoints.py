@@ -0,0 +1,192 @@
+"""Checkpoints of FIFO matching, for matching only recent trades.
+
+Trades are matched in chronological order, hence the matching of a
+reporter's trades in an ISIN as of a date is fully described by the lots
+then still open and by the violating positions closed so far. A checkpoint
+holds just that, and finding violations (when not read from the ledger)
+only matches the trades after the latest checkpoint against its open lots.
+
+Checkpoints are created periodically (flask trades checkpoint) as of a date
+well in the past. Any write of a trade dated on or before a checkpoint
+invalidates it (see ledger.rematch), until the next one is created.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_
+
+from tcm_app import fifo
+from tcm_app.models import (
+    Checkpoint, CheckpointLot, CheckpointViolation, Trade, db)
+
+
+def _after_checkpoint(query):
+    """Filters a query of trades on those after the checkpoint of their
+    reporter and ISIN, if any.
+    """
+    return query.outerjoin(Checkpoint, and_(
+        Checkpoint.reporter == Trade.reporter,
+        Checkpoint.isin == Trade.isin)).filter(or_(
+            Checkpoint.as_of.is_(None), Trade.date > Checkpoint.as_of))
+
+
+def _delete(reporter, isin):
+    """Deletes the checkpoint of reporter in isin, in the current
+    transaction.
+    """
+    for model in (Checkpoint, CheckpointLot, CheckpointViolation):
+        model.query.filter_by(reporter=reporter, isin=isin).delete(
+            synchronize_session=False)
+
+
+def invalidate(reporter, isin, date):
+    """Deletes the checkpoint of reporter in isin if as of date or later, in
+    the current transaction.
+    """
+    outdated = db.session.query(Checkpoint.as_of).filter(
+        Checkpoint.reporter == reporter, Checkpoint.isin == isin,
+        Checkpoint.as_of >= date).first()
+    if outdated is not None:
+        _delete(reporter, isin)
+
+
+def create(as_of, batch_size=1000):
+    """Creates checkpoints as of date for every reporter and ISIN with trades
+    since its latest checkpoint, up to and including as_of, in the current
+    transaction. Later checkpoints are kept. Returns the number of
+    checkpoints created.
+    """
+    rows = _after_checkpoint(db.session.query(
+        Trade.reporter, Trade.isin, Checkpoint.as_of, Trade.id,
+        Trade.direction, Trade.date, Trade.price, Trade.quantity)).filter(
+            Trade.date <= as_of).order_by(
+                Trade.reporter.asc(), Trade.isin.asc(), Trade.date.asc(),
+                Trade.id.asc()).yield_per(batch_size)
+
+    created_at = datetime.utcnow()
+    created = []
+    for (reporter, isin, previous), rows_ in groupby(
+            rows, key=lambda row: row[:3]):
+        trades = []
+        if previous is not None:
+            # Continue matching from the open lots of the previous one
+            trades.extend(
+                fifo.LotTrade(lot.trade_id, lot.direction, lot.date,
+                              lot.price, lot.quantity)
+                for lot in CheckpointLot.query.filter_by(
+                    reporter=reporter, isin=isin).order_by(
+                        CheckpointLot.date.asc(),
+                        CheckpointLot.trade_id.asc()))
+        trades.extend(fifo.LotTrade(*row[3:]) for row in rows_)
+        closed_positions, buy, sell = fifo.match_trades(trades)
+        created.append((
+            reporter, isin, previous,
+            [p for p in closed_positions if p.violating], [*buy, *sell]))
+
+    for reporter, isin, previous, violating, lots in created:
+        if previous is not None:
+            Checkpoint.query.filter_by(reporter=reporter, isin=isin).delete(
+                synchronize_session=False)
+            CheckpointLot.query.filter_by(reporter=reporter, isin=isin).delete(
+                synchronize_session=False)
+        db.session.add(Checkpoint(
+            reporter=reporter, isin=isin, as_of=as_of, created_at=created_at))
+        db.session.bulk_insert_mappings(CheckpointLot, [{
+            'reporter': reporter,
+            'isin': isin,
+            'trade_id': lot.trade.id,
+            'direction': lot.trade.direction,
+            'date': lot.trade.date,
+            'price': lot.trade.price,
+            'quantity': lot.quantity
+        } for lot in lots])
+        db.session.bulk_insert_mappings(CheckpointViolation, [{
+            'reporter': reporter,
+            'isin': isin,
+            'buy_id': p.buy.id,
+            'sell_id': p.sell.id
+        } for p in violating])
+    return len(created)
+
+
+def violating_positions(reporters):
+    """Returns violating closed positions of reporters, as
+    ledger.violating_positions yields them, matching only the trades after
+    each checkpoint.
+    """
+    # Trades (or open lots) to match and violating (buy id, sell id) pairs,
+    # by reporter and isin.
+    matching = defaultdict(lambda: ([], []))
+    lots = CheckpointLot.query.filter(
+        CheckpointLot.reporter.in_(reporters)).order_by(
+            CheckpointLot.date.asc(), CheckpointLot.trade_id.asc())
+    for lot in lots:
+        matching[lot.reporter, lot.isin][0].append(fifo.LotTrade(
+            lot.trade_id, lot.direction, lot.date, lot.price, lot.quantity))
+    violations = CheckpointViolation.query.filter(
+        CheckpointViolation.reporter.in_(reporters)).order_by(
+            CheckpointViolation.id.asc())
+    for violation in violations:
+        matching[violation.reporter, violation.isin][1].append(
+            (violation.buy_id, violation.sell_id))
+
+    trades = _after_checkpoint(Trade.query).filter(
+        Trade.reporter.in_(reporters)).order_by(
+            Trade.date.asc(), Trade.id.asc()).all()
+    trades_by_id = {}
+    for trade in trades:
+        matching[trade.reporter, trade.isin][0].append(trade)
+        trades_by_id[trade.id] = trade
+
+    for trades_, pairs in matching.values():
+        closed_positions, _, _ = fifo.match_trades(trades_)
+        pairs.extend(
+            (p.buy.id, p.sell.id) for p in closed_positions if p.violating)
+
+    # Trades before the checkpoints are only loaded when violating.
+    missing = {id for _, pairs in matching.values() for pair in pairs
+               for id in pair}.difference(trades_by_id)
+    if missing:
+        trades_by_id.update(
+            (trade.id, trade)
+            for trade in Trade.query.filter(Trade.id.in_(missing)))
+
+    return [
+        (reporter, [
+            (isin, [fifo.ClosedPosition(
+                trades_by_id[buy_id], trades_by_id[sell_id], None)
+                for buy_id, sell_id in pairs])
+            for (_, isin), (_, pairs) in items if pairs])
+        for reporter, items in groupby(
+            sorted(matching.items(), key=lambda item: item[0]),
+            key=lambda item: item[0][0])]
+
+
+# ---
+# CLI: flask trades checkpoint
+# ---
+@click.command('checkpoint')
+@click.option('--as-of', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Date of the checkpoints, by default CHECKPOINT_AGE days '
+                   'ago.')
+@with_appcontext
+def checkpoint_command(as_of):
+    """Create checkpoints of matching trades."""
+    if as_of is None:
+        as_of = date.today() - timedelta(
+            days=current_app.config['CHECKPOINT_AGE'])
+    else:
+        as_of = as_of.date()
+    try:
+        created = create(as_of)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    click.echo(f'{created} checkpoints created as of {as_of.isoformat()}')
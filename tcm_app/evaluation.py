@@ -0,0 +1,101 @@
+"""Evaluation of violations for many reporters, optionally in parallel.
+
+Reporters are split into partitions of roughly equal number of trades which
+are matched in a thread or process pool. Partitions are merged in reporter
+order, independent of the order in which they are evaluated.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import groupby
+from operator import attrgetter
+from threading import Lock
+
+from tcm_app import fifo
+
+EXECUTORS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+# Number of partitions per worker, allowing for uneven partitions.
+PARTITIONS_PER_WORKER = 4
+
+# The part of a trade sent to workers.
+TradeRow = namedtuple('TradeRow', 'id isin direction quantity price date')
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def _get_pool(executor, workers):
+    """Returns a pool shared by all requests handled by this process."""
+    with _pools_lock:
+        if (executor, workers) not in _pools:
+            _pools[executor, workers] = EXECUTORS[executor](workers)
+        return _pools[executor, workers]
+
+
+def _violating_pairs(partition):
+    """Matches trades of each reporter in partition, given as (reporter,
+    trade rows) tuples. Returns (reporter, [(isin, [(buy id, sell id), ...]),
+    ...]) tuples, leaving out ISINs without violations.
+    """
+    result = []
+    for reporter, rows in partition:
+        by_isin = []
+        for isin, closed_positions in fifo.match_by_isin(rows):
+            pairs = [(p.buy.id, p.sell.id)
+                     for p in closed_positions if p.violating]
+            if pairs:
+                by_isin.append((isin, pairs))
+        result.append((reporter, by_isin))
+    return result
+
+
+def _partition(trades_by_reporter, size):
+    """Splits (reporter, trade rows) tuples into partitions of at least size
+    trades (but the last one).
+    """
+    partition, partition_size = [], 0
+    for reporter, rows in trades_by_reporter:
+        partition.append((reporter, rows))
+        partition_size += len(rows)
+        if partition_size >= size:
+            yield partition
+            partition, partition_size = [], 0
+    if partition:
+        yield partition
+
+
+def violating_pairs(trades, executor='serial', workers=None, threshold=0):
+    """Searches all reporters' trades, given in chronological order, for
+    violations. Returns (reporter, [(isin, [(buy id, sell id), ...]), ...])
+    tuples in reporter order.
+
+    executor is one of 'serial', 'thread' or 'process'. Books of fewer than
+    threshold trades are always evaluated serially.
+    """
+    if executor != 'serial' and executor not in EXECUTORS:
+        raise ValueError(f'Unknown executor "{executor}".')
+
+    # A stable sort keeps the chronological order within each reporter.
+    trades_by_reporter = [
+        (reporter, [TradeRow(t.id, t.isin, t.direction, t.quantity, t.price,
+                             t.date) for t in trades_])
+        for reporter, trades_ in groupby(
+            sorted(trades, key=attrgetter('reporter')),
+            key=attrgetter('reporter'))]
+
+    if (executor == 'serial' or len(trades) < threshold or
+            len(trades_by_reporter) < 2):
+        return _violating_pairs(trades_by_reporter)
+
+    workers = workers or os.cpu_count()
+    size = max(1, len(trades) // (workers * PARTITIONS_PER_WORKER))
+    partitions = _partition(trades_by_reporter, size)
+    pool = _get_pool(executor, workers)
+    return [
+        result
+        for results in pool.map(_violating_pairs, partitions)
+        for result in results]
@@ -0,0 +1,92 @@
+"""First In, First Out (FIFO) matching of buy and sell trades.
+
+Trades are matched one ISIN at a time by keeping a queue of open lots per
+direction and closing the heads of the two queues against each other. Every
+trade is visited once and every step removes at least one lot from a queue,
+hence matching is linear in the number of trades.
+"""
+from collections import deque, namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+# Profitable positions must be held for at least this many days.
+HOLDING_PERIOD = 32
+
+# The part of a trade needed for matching.
+LotTrade = namedtuple('LotTrade', 'id direction date price quantity')
+
+
+class Lot:
+    """An open, possibly partially matched, trade.
+    """
+    __slots__ = ('trade', 'quantity')
+
+    def __init__(self, trade, quantity=None):
+        self.trade = trade
+        self.quantity = trade.quantity if quantity is None else quantity
+
+
+class ClosedPosition:
+    """A buy and a sell trade matched against each other.
+    """
+    __slots__ = ('buy', 'sell', 'quantity', 'duration')
+
+    def __init__(self, buy, sell, quantity):
+        self.buy = buy
+        self.sell = sell
+        self.quantity = quantity
+        self.duration = abs(buy.date - sell.date).days
+
+    @property
+    def violating(self):
+        """Whether a profitable position was closed too quickly."""
+        return (self.duration < HOLDING_PERIOD and
+                self.buy.price < self.sell.price)
+
+
+def match_lots(buy, sell):
+    """Matches two deques of open lots (buy and sell) on a FIFO basis.
+    Returns a list of closed positions. Matched lots are consumed from the
+    deques, hence what remains are the still open lots.
+    """
+    closed_positions = []
+    while buy and sell:
+        buy_lot, sell_lot = buy[0], sell[0]
+        if buy_lot.quantity < sell_lot.quantity:
+            quantity = buy_lot.quantity
+            sell_lot.quantity -= quantity
+            buy.popleft()
+        elif buy_lot.quantity > sell_lot.quantity:
+            quantity = sell_lot.quantity
+            buy_lot.quantity -= quantity
+            sell.popleft()
+        else:
+            quantity = buy_lot.quantity
+            buy.popleft()
+            sell.popleft()
+        closed_positions.append(
+            ClosedPosition(buy_lot.trade, sell_lot.trade, quantity))
+    return closed_positions
+
+
+def match_trades(trades):
+    """Matches trades of a single ISIN, given in chronological order.
+    Returns closed positions together with the deques of lots left open.
+    """
+    buy, sell = deque(), deque()
+    for trade in trades:
+        (buy if trade.direction == 'Buy' else sell).append(Lot(trade))
+    closed_positions = match_lots(buy, sell)
+    return closed_positions, buy, sell
+
+
+def match_by_isin(trades):
+    """Matches trades, given in chronological order, per ISIN.
+    Yields an (isin, closed positions) tuple per ISIN in ISIN order.
+    """
+    # A stable sort keeps the chronological order within each ISIN.
+    by_isin = groupby(sorted(trades, key=attrgetter('isin')),
+                      key=attrgetter('isin'))
+    for isin, trades_ in by_isin:
+        closed_positions, _, _ = match_trades(trades_)
+        yield isin, closed_positions
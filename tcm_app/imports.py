@@ -0,0 +1,180 @@
+"""Streaming import of trades from CSV and Parquet files.
+
+Files are read, validated (by the TradeSchema rules) and inserted in chunks
+of a fixed number of rows, hence memory use does not depend on file size.
+All trades of a file are reported within a single transaction.
+"""
+import csv
+import io
+import sys
+import time
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from tcm_app import cache, ledger
+from tcm_app.models import ReporterVersion, Trade, db, load_trades
+
+FORMATS = ('csv', 'parquet')
+
+
+class FileFormatError(Exception):
+    pass
+
+
+def read_csv(stream, chunk_size):
+    """Yields chunks of rows (dicts) from a binary CSV stream with a header.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    chunk = []
+    try:
+        for row in csv.DictReader(text):
+            # Empty cells are missing values.
+            chunk.append({key: value for key, value in row.items() if value})
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    except (csv.Error, UnicodeDecodeError) as err:
+        raise FileFormatError(f'Not a valid CSV file: {err}')
+    if chunk:
+        yield chunk
+
+
+def read_parquet(stream, chunk_size):
+    """Yields chunks of rows (dicts) from a seekable binary Parquet stream.
+    Requires pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise FileFormatError('Reading Parquet files requires pyarrow.')
+
+    def jsonable(value):
+        # As if given as JSON, to be loaded by TradeSchema
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+
+    try:
+        parquet_file = pq.ParquetFile(stream)
+    except pa.ArrowException as err:
+        raise FileFormatError(f'Not a valid Parquet file: {err}')
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        columns = batch.to_pydict()
+        yield [
+            {key: jsonable(value) for key, value in zip(columns, values)
+             if value is not None}
+            for values in zip(*columns.values())]
+
+
+READERS = {
+    'csv': read_csv,
+    'parquet': read_parquet,
+}
+
+
+def import_trades(stream, format, reporter, atomic=True, progress=None):
+    """Imports trades for reporter from a binary stream in format (one of
+    FORMATS). In atomic mode no trade is imported unless all are valid.
+
+    progress, if given, is called after each chunk with a dict of counters.
+    Returns the final counters together with (a limited number of) error
+    messages by row index.
+    """
+    config = current_app.config
+    max_errors = config['IMPORT_MAX_ERRORS']
+    counters = {'rows': 0, 'reported': 0, 'invalid': 0, 'seconds': 0.0}
+    errors = []
+    earliest = {}  # Earliest date by isin, for updating the ledger
+    reported_at = datetime.utcnow()
+    start = time.perf_counter()
+
+    try:
+        for chunk in READERS[format](stream, config['IMPORT_CHUNK_SIZE']):
+            valid, chunk_errors = load_trades(chunk)
+            for index, messages in sorted(chunk_errors.items()):
+                if len(errors) < max_errors:
+                    errors.append({'index': counters['rows'] + index,
+                                   'messages': messages})
+            counters['rows'] += len(chunk)
+            counters['invalid'] += len(chunk_errors)
+
+            if not (atomic and counters['invalid']):
+                rows = [dict(data, reporter=reporter, reported_at=reported_at)
+                        for _, data in valid]
+                Trade.insert_many(rows, config['TRADES_BATCH_CHUNK_SIZE'])
+                counters['reported'] += len(rows)
+                for row in rows:
+                    if row['date'] < earliest.get(row['isin'], date.max):
+                        earliest[row['isin']] = row['date']
+
+            counters['seconds'] = time.perf_counter() - start
+            if progress is not None:
+                progress(counters)
+
+        if atomic and counters['invalid']:
+            db.session.rollback()
+            counters['reported'] = 0
+        else:
+            if counters['reported']:
+                ReporterVersion.bump(reporter)  # Locks, see bump
+            ledger.on_bulk_create([
+                {'reporter': reporter, 'isin': isin, 'date': date_}
+                for isin, date_ in earliest.items()])
+            db.session.commit()
+            cache.violations.invalidate(reporter)
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+
+    counters['seconds'] = time.perf_counter() - start
+    return counters, errors
+
+
+# ---
+# CLI: flask trades import
+# ---
+cli = AppGroup('trades', help='Manage trades.')
+
+
+@cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--reporter', required=True,
+              help='Email of the reporter of all trades in file.')
+@click.option('--format', 'format_', type=click.Choice(FORMATS),
+              help='File format, by default from the file extension.')
+@click.option('--partial', is_flag=True,
+              help='Import valid trades even if others are invalid.')
+def import_command(path, reporter, format_, partial):
+    """Import trades from a CSV or Parquet file."""
+    format_ = format_ or path.rsplit('.', 1)[-1].lower()
+    if format_ not in FORMATS:
+        raise click.BadParameter(
+            'Unknown file extension, use --format.', param_hint='--format')
+
+    def progress(counters):
+        click.echo('{rows} rows read, {reported} reported, {invalid} invalid '
+                   '({rate:.0f} rows/s)'.format(
+                       rate=counters['rows'] / max(counters['seconds'], 1e-9),
+                       **counters),
+                   err=True)
+
+    with open(path, 'rb') as stream:
+        try:
+            counters, errors = import_trades(
+                stream, format_, reporter, atomic=not partial,
+                progress=progress)
+        except FileFormatError as err:
+            raise click.ClickException(str(err))
+
+    for error in errors:
+        click.echo('Row {index}: {messages}'.format(**error), err=True)
+    click.echo('{reported} of {rows} trades reported in {seconds:.1f}s'.format(
+        **counters))
+    if counters['invalid']:
+        sys.exit(1)
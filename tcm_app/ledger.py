@@ -0,0 +1,265 @@
+"""Persistent ledger of open lots and closed positions.
+
+The ledger holds the outcome of FIFO matching (see tcm_app.fifo) for every
+(reporter, ISIN) and is kept up to date within the same transaction as any
+trade write. A write only re-matches the suffix of trades from the written
+trade and onwards. Closed positions between two trades before that point are
+unaffected by the write, as FIFO matching consumes both queues in
+chronological order.
+
+Writers of a (reporter, ISIN) are serialised by a lock (see lock) taken
+before the ledger is read, as two concurrent writers would otherwise each
+re-match without the other's trade, leaving them unmatched.
+"""
+from hashlib import sha256
+from itertools import groupby
+from operator import attrgetter
+
+from sqlalchemy import and_, inspect, or_, text
+from sqlalchemy.orm import aliased
+
+from tcm_app import checkpoints, fifo
+from tcm_app.models import ClosedPosition, OpenLot, Trade, db
+
+# Attributes of a trade affecting how it is matched.
+MATCHED_ATTRIBUTES = ('isin', 'direction', 'quantity', 'price', 'date')
+
+
+def _at_or_after(date_column, id_column, date, id):
+    """SQL expression for (date_column, id_column) >= (date, id)."""
+    return or_(
+        date_column > date, and_(date_column == date, id_column >= id))
+
+
+def lock(*keys):
+    """Locks the ledger of each (reporter, isin) of keys until the end of the
+    current transaction, in a consistent order to avoid deadlocks. On
+    PostgreSQL by transaction-level advisory locks, while SQLite serialises
+    writers by locking the database.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for reporter, isin in sorted(set(keys)):
+        digest = sha256(f'{reporter}\0{isin}'.encode()).digest()
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {
+            'key': int.from_bytes(digest[:8], 'big', signed=True)})
+
+
+def rematch(reporter, isin, date, id):
+    """Re-matches trades of reporter in isin from (date, id) and onwards,
+    updating the ledger in the current transaction. A checkpoint as of date
+    or later is outdated too, hence it is invalidated.
+    """
+    lock((reporter, isin))
+    cut = (date, id)
+    checkpoints.invalidate(reporter, isin, date)
+
+    # Closed positions involving a trade at or after cut are re-matched,
+    # hence their trades before cut are re-opened.
+    affected = ClosedPosition.query.filter_by(
+        reporter=reporter, isin=isin).filter(or_(
+            _at_or_after(ClosedPosition.buy_date, ClosedPosition.buy_id,
+                         date, id),
+            _at_or_after(ClosedPosition.sell_date, ClosedPosition.sell_id,
+                         date, id))).all()
+    open_lots = OpenLot.query.filter_by(reporter=reporter, isin=isin).all()
+
+    reopened = {}
+    for lot in open_lots:
+        if (lot.date, lot.trade_id) < cut:
+            reopened[lot.trade_id] = fifo.LotTrade(
+                lot.trade_id, lot.direction, lot.date, lot.price,
+                lot.quantity)
+    for position in affected:
+        for direction, trade_id, date_, price in (
+                ('Buy', position.buy_id, position.buy_date,
+                 position.buy_price),
+                ('Sell', position.sell_id, position.sell_date,
+                 position.sell_price)):
+            if (date_, trade_id) >= cut:
+                continue
+            lot = reopened.get(trade_id)
+            quantity = position.quantity + (lot.quantity if lot else 0)
+            reopened[trade_id] = fifo.LotTrade(
+                trade_id, direction, date_, price, quantity)
+
+    # Plain rows rather than entities, as the suffix may be long.
+    suffix = db.session.query(
+        Trade.id, Trade.direction, Trade.date, Trade.price, Trade.quantity
+    ).filter(
+        Trade.reporter == reporter, Trade.isin == isin,
+        _at_or_after(Trade.date, Trade.id, date, id)
+    ).order_by(Trade.date.asc(), Trade.id.asc())
+
+    trades = sorted(reopened.values(), key=attrgetter('date', 'id'))
+    trades.extend(fifo.LotTrade(*row) for row in suffix)
+    closed_positions, buy, sell = fifo.match_trades(trades)
+
+    for position in affected:
+        db.session.delete(position)
+    for lot in open_lots:
+        db.session.delete(lot)
+    db.session.flush()
+
+    db.session.bulk_insert_mappings(ClosedPosition, [{
+        'reporter': reporter,
+        'isin': isin,
+        'buy_id': p.buy.id,
+        'buy_date': p.buy.date,
+        'buy_price': p.buy.price,
+        'sell_id': p.sell.id,
+        'sell_date': p.sell.date,
+        'sell_price': p.sell.price,
+        'quantity': p.quantity,
+        'duration': p.duration
+    } for p in closed_positions])
+    db.session.bulk_insert_mappings(OpenLot, [{
+        'trade_id': lot.trade.id,
+        'reporter': reporter,
+        'isin': isin,
+        'direction': lot.trade.direction,
+        'date': lot.trade.date,
+        'price': lot.trade.price,
+        'quantity': lot.quantity
+    } for lot in (*buy, *sell)])
+
+
+def on_create(trade):
+    """Updates the ledger for a trade added to the session."""
+    db.session.flush()  # Assigns id
+    rematch(trade.reporter, trade.isin, trade.date, trade.id)
+
+
+def on_bulk_create(rows):
+    """Updates the ledger for trades inserted, as dicts of column values, in
+    the current transaction. Each (reporter, isin) is re-matched once, from
+    the earliest inserted date.
+    """
+    _rematch_earliest(  # Any id on the date
+        (row['reporter'], row['isin'], row['date'], 0) for row in rows)
+
+
+def on_bulk_update(rows):
+    """Updates the ledger for trades updated by statements in the current
+    transaction, given as (old, new) pairs of rows (see on_update_row). Each
+    (reporter, isin) is re-matched once, from the earliest changed trade.
+    """
+    cuts, moved = [], []
+    for old, new in rows:
+        if all(old[a] == new[a] for a in MATCHED_ATTRIBUTES):
+            continue
+        cuts.extend((row['reporter'], row['isin'], row['date'], row['id'])
+                    for row in (old, new))
+        if old['isin'] != new['isin']:
+            moved.append(new['id'])
+    lock(*[(reporter, isin) for reporter, isin, _, _ in cuts])
+    if moved:
+        # Open lots of moved trades are left in the ledger of their old ISIN,
+        # which may be re-matched after their new one (or ISINs are swapped).
+        # Removed beforehand, as at most one lot per trade may exist.
+        OpenLot.query.filter(OpenLot.trade_id.in_(moved)).delete(
+            synchronize_session=False)
+    _rematch_earliest(cuts)
+
+
+def on_bulk_delete(rows):
+    """Updates the ledger for trades deleted by statements in the current
+    transaction, given as rows. Each (reporter, isin) is re-matched once,
+    from the earliest deleted trade.
+    """
+    _rematch_earliest(
+        (row['reporter'], row['isin'], row['date'], row['id'])
+        for row in rows)
+
+
+def _rematch_earliest(cuts):
+    """Re-matches each (reporter, isin) of cuts, as (reporter, isin, date,
+    id) tuples, once from its earliest (date, id).
+    """
+    earliest = {}
+    for reporter, isin, date, id in cuts:
+        key = (reporter, isin)
+        if key not in earliest or (date, id) < earliest[key]:
+            earliest[key] = (date, id)
+    lock(*earliest)
+    for (reporter, isin), (date, id) in earliest.items():
+        rematch(reporter, isin, date, id)
+
+
+def on_update(trade):
+    """Updates the ledger for a changed trade in the session."""
+    attrs = inspect(trade).attrs
+    if not any(attrs[a].history.has_changes() for a in MATCHED_ATTRIBUTES):
+        return
+
+    def previous(attribute):
+        history = attrs[attribute].history
+        return history.deleted[0] if history.deleted else getattr(
+            trade, attribute)
+
+    old_isin, old_date = previous('isin'), previous('date')
+    db.session.flush()
+    _rematch_update(trade.reporter, trade.id, old_isin, old_date, trade.isin,
+                    trade.date)
+
+
+def on_update_row(old, new):
+    """Updates the ledger for a trade updated by a statement in the current
+    transaction, from row old to row new (with at least id, reporter and
+    MATCHED_ATTRIBUTES).
+    """
+    if all(old[a] == new[a] for a in MATCHED_ATTRIBUTES):
+        return
+    _rematch_update(new['reporter'], new['id'], old['isin'], old['date'],
+                    new['isin'], new['date'])
+
+
+def _rematch_update(reporter, id, old_isin, old_date, isin, date):
+    if old_isin != isin:
+        lock((reporter, old_isin), (reporter, isin))
+        rematch(reporter, old_isin, old_date, id)
+        rematch(reporter, isin, date, id)
+    else:
+        rematch(reporter, isin, min(old_date, date), id)
+
+
+def on_delete(trade):
+    """Updates the ledger for a trade deleted from the session, or by a
+    statement (trade being its row).
+    """
+    reporter, isin, date, id = (
+        trade.reporter, trade.isin, trade.date, trade.id)
+    db.session.flush()
+    rematch(reporter, isin, date, id)
+
+
+def violating_positions(reporters=None, batch_size=1000):
+    """Yields violating closed positions one reporter at a time, optionally
+    for some reporters only, as (reporter, [(isin, [position, ...]), ...])
+    tuples. Positions are ordered by isin, duration and matching order, each
+    being a fifo.ClosedPosition between the matched trades. Rows are fetched
+    batch_size at a time, hence only one reporter is held in memory.
+    """
+    buy, sell = aliased(Trade), aliased(Trade)
+    query = db.session.query(ClosedPosition, buy, sell).join(
+        buy, buy.id == ClosedPosition.buy_id).join(
+            sell, sell.id == ClosedPosition.sell_id).filter(
+                ClosedPosition.duration < fifo.HOLDING_PERIOD,
+                ClosedPosition.buy_price < ClosedPosition.sell_price)
+    if reporters is not None:
+        query = query.filter(ClosedPosition.reporter.in_(reporters))
+    query = query.order_by(
+        ClosedPosition.reporter.asc(),
+        ClosedPosition.buy_date.asc(), ClosedPosition.buy_id.asc(),
+        ClosedPosition.sell_date.asc(), ClosedPosition.sell_id.asc()
+    ).yield_per(batch_size)
+
+    for reporter_, rows in groupby(query, key=lambda row: row[0].reporter):
+        # Stable sorts keep the matching order within each group.
+        rows = sorted(rows, key=lambda row: row[0].duration)
+        rows.sort(key=lambda row: row[0].isin)
+        by_isin = [
+            (isin, [fifo.ClosedPosition(buy_, sell_, position.quantity)
+                    for position, buy_, sell_ in group])
+            for isin, group in groupby(rows, key=lambda row: row[0].isin)]
+        yield reporter_, by_isin
@@ -0,0 +1,314 @@
+"""Request metrics in the Prometheus text format, served at /metrics.
+
+The time of each request is broken down into stages, e.g. 'auth',
+'userinfo', 'db', 'match' and 'serialise', timed by the stage context
+manager (and database statements by SQLAlchemy events). Stages are
+exclusive: time spent in a nested stage is not counted in the enclosing
+one, and what no stage accounts for is counted as 'other'. Stages are
+observed in histograms labelled by endpoint when the request ends, i.e.
+after a streamed response has been sent.
+
+Metrics are kept per process, hence every worker is scraped on its own.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+from flask import Blueprint, Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+bp = Blueprint('metrics', __name__)
+
+# Upper bounds (seconds) of histogram buckets of request and stage times.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0, 30.0)
+
+# Upper bounds of histogram buckets of database statements per request.
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _labels(names, values):
+    return ','.join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Histogram by label values, rendered in the Prometheus text format."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = Lock()
+        # Counts by bucket (the last one +Inf) and sum, by label values
+        self._series = {}
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            label_text = _labels(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{_number(bound)}"}}'
+                    f' {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {_number(total)}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Counter by label values, rendered in the Prometheus text format."""
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = Lock()
+        self._values = defaultdict(int)
+
+    def inc(self, labels, value=1):
+        with self._lock:
+            self._values[labels] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(
+                f'{self.name}{{{_labels(self.labels, labels)}}} {value}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+request_seconds = Histogram(
+    'tcm_request_duration_seconds', 'Time of handling a request.',
+    ('endpoint',), BUCKETS)
+stage_seconds = Histogram(
+    'tcm_request_stage_duration_seconds',
+    'Time of a request spent in a stage, excluding nested stages.',
+    ('endpoint', 'stage'), BUCKETS)
+request_statements = Histogram(
+    'tcm_request_db_statements', 'Database statements executed by a request.',
+    ('endpoint',), STATEMENT_BUCKETS)
+
+# Counted by tcm_app.profiling, when enabled.
+slow_statements = Counter(
+    'tcm_db_slow_statements_total',
+    'Statements slower than SQL_SLOW_STATEMENT_SECONDS.', ('endpoint',))
+repeated_statements = Counter(
+    'tcm_db_repeated_statements_total',
+    'Statements repeated more than SQL_REPEATED_STATEMENT_LIMIT times by a '
+    'request (N+1 queries).', ('endpoint',))
+
+# Counted by tcm_app.replicas, when a replica is configured.
+routed_reads = Counter(
+    'tcm_db_routed_reads_total',
+    'Requests reading from the primary or the replica, by reason.',
+    ('database', 'reason'))
+
+METRICS = (request_seconds, stage_seconds, request_statements,
+           slow_statements, repeated_statements, routed_reads)
+
+
+class RequestTimings:
+    """Time spent in each stage of a request."""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.stages = defaultdict(float)
+        self.statements = 0
+        # Time of nested stages, by currently entered stage
+        self._nested = []
+
+    def enter(self):
+        self._nested.append(0.0)
+        return perf_counter()
+
+    def exit(self, stage, start):
+        elapsed = perf_counter() - start
+        self.stages[stage] += elapsed - self._nested.pop()
+        if self._nested:
+            self._nested[-1] += elapsed
+
+    def breakdown(self):
+        """Returns total time and time by stage, including 'other'."""
+        total = perf_counter() - self.start
+        stages = dict(self.stages)
+        stages['other'] = max(total - sum(stages.values()), 0.0)
+        return total, stages
+
+
+def _timings():
+    """Returns timings of the current request, if being timed."""
+    return g.get('_metrics_timings') if has_app_context() else None
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed code as stage name of the current request, if
+    any.
+    """
+    timings = _timings()
+    if timings is None:
+        yield
+        return
+    start = timings.enter()
+    try:
+        yield
+    finally:
+        timings.exit(name, start)
+
+
+# ---
+# DATABASE STATEMENTS
+# ---
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    timings = _timings()
+    if timings is not None:
+        conn.info.setdefault('metrics_starts', []).append(timings.enter())
+
+
+def _end_statement(conn):
+    starts = conn.info.get('metrics_starts')
+    timings = _timings()
+    if starts and timings is not None:
+        timings.exit('db', starts.pop())
+        timings.statements += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    _end_statement(conn)
+
+
+def _handle_error(exception_context):
+    if exception_context.connection is not None:
+        _end_statement(exception_context.connection)
+
+
+# ---
+# REQUESTS
+# ---
+def _before_request():
+    g._metrics_timings = RequestTimings()
+
+
+def _after_request(response):
+    timings = _timings()
+    if timings is not None and current_app.config['METRICS_SERVER_TIMING']:
+        # Up to now, for a streamed response
+        total, stages = timings.breakdown()
+        response.headers['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.1f}'
+            for name, seconds in (*sorted(stages.items()), ('total', total)))
+    return response
+
+
+def _teardown_request(exc):
+    timings = g.pop('_metrics_timings', None)
+    if timings is None:
+        return
+    endpoint = request.endpoint or 'none'
+    total, stages = timings.breakdown()
+    request_seconds.observe((endpoint,), total)
+    for name, seconds in stages.items():
+        stage_seconds.observe((endpoint, name), seconds)
+    request_statements.observe((endpoint,), timings.statements)
+
+
+def _cache_lines():
+    """Returns hits, misses and hit ratio by cache."""
+    from tcm_app import auth, cache
+    stats = {
+        'violations': cache.violations.stats(),
+        'tokens': auth.verified_tokens.stats(),
+    }
+    lines = []
+    for name, type_, help, key in (
+            ('tcm_cache_hits_total', 'counter', 'Cache hits.', 'hits'),
+            ('tcm_cache_misses_total', 'counter', 'Cache misses.', 'misses'),
+            ('tcm_cache_hit_ratio', 'gauge', 'Hits of all lookups.', None)):
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} {type_}']
+        for cache_name, stats_ in stats.items():
+            if key is None:
+                lookups = stats_['hits'] + stats_['misses']
+                value = stats_['hits'] / lookups if lookups else None
+            else:
+                value = stats_[key]
+            lines.append(f'{name}{{cache="{cache_name}"}} {_number(value)}')
+    return lines
+
+
+@bp.route('/metrics')
+def metrics():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _cache_lines()
+    return Response('\n'.join(lines) + '\n',
+                    mimetype='text/plain; version=0.0.4')
+
+
+_listening = False
+
+
+def init_app(app):
+    """Times requests of app and serves /metrics, unless METRICS_ENABLED is
+    off.
+    """
+    global _listening
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.register_blueprint(bp)
+    if not _listening:
+        # Of any engine, timed only within a request
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
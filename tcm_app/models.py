@@ -3,10 +3,15 @@ from datetime import datetime
 
 import simplejson
 from flask import abort
-from flask_sqlalchemy import SQLAlchemy
 from marshmallow import Schema, ValidationError, fields, validate
+from sqlalchemy.dialects import postgresql
 
-db = SQLAlchemy()
+from tcm_app import cache, validation
+from tcm_app.replicas import RoutingSQLAlchemy
+from tcm_app.serializers import TradeSerializer
+
+# Reads of GET endpoints may be routed to a replica, see tcm_app.replicas.
+db = RoutingSQLAlchemy()
 
 
 # ---
@@ -35,6 +40,12 @@ def validate_not_future_date(date):
 # ---
 # MODELS
 # ---
+# Columns of a trade copied to its paper trail (besides its id).
+TRAILED_COLUMNS = (
+    'isin', 'name', 'direction', 'quantity', 'price', 'currency', 'amount',
+    'date', 'reporter', 'reported_at')
+
+
 class Trade(db.Model):
     __tablename__ = 'Trade'
     id = db.Column(db.Integer, primary_key=True)
@@ -49,6 +60,13 @@ class Trade(db.Model):
     reporter = db.Column(db.String(), nullable=False)
     reported_at = db.Column(db.DateTime, nullable=False)
 
+    # Matching per (reporter, isin) in chronological order and listing a
+    # reporter's trades by id.
+    __table_args__ = (
+        db.Index('ix_Trade_reporter_isin_date_id', reporter, isin, date, id),
+        db.Index('ix_Trade_reporter_id', reporter, id),
+    )
+
     def __repr__(self):
         items = self.__dict__.items()
         return '<Trade {}>'.format(', '.join(
@@ -58,10 +76,14 @@ class Trade(db.Model):
     def create(self):
         """Creates model in db and sends it back serialised.
         """
+        from tcm_app import ledger
         error = False
         try:
             db.session.add(self)
+            ReporterVersion.bump(self.reporter)  # Locks, see bump
+            ledger.on_create(self)
             db.session.commit()
+            cache.violations.invalidate(self.reporter)
         except BaseException:
             print(sys.exc_info())
             db.session.rollback()
@@ -74,12 +96,49 @@ class Trade(db.Model):
         if error:
             abort(422)
 
+    @classmethod
+    def insert_many(cls, rows, chunk_size):
+        """Inserts trades, from dicts of column values, by one multi-row insert
+        per chunk of rows in the current transaction. The ledger is not
+        updated.
+        """
+        for start in range(0, len(rows), chunk_size):
+            db.session.execute(
+                cls.__table__.insert().values(rows[start:start + chunk_size]))
+
+    @classmethod
+    def bulk_create(cls, rows, chunk_size):
+        """Creates trades in db, from dicts of column values, by one multi-row
+        insert per chunk of rows within a single transaction.
+        """
+        from tcm_app import ledger
+        try:
+            reporters = sorted({row['reporter'] for row in rows})
+            for reporter in reporters:
+                ReporterVersion.bump(reporter)  # Locks, see bump
+            cls.insert_many(rows, chunk_size)
+            ledger.on_bulk_create(rows)
+            db.session.commit()
+            for reporter in reporters:
+                cache.violations.invalidate(reporter)
+        except BaseException:
+            print(sys.exc_info())
+            db.session.rollback()
+            abort(422)
+        finally:
+            db.session.close()
+
     def update(self):
         """Updates model in db and sends it back serialised.
         """
+        from tcm_app import ledger
         error = False
+        reporter = self.reporter
         try:
+            ReporterVersion.bump(reporter)  # Locks, see bump
+            ledger.on_update(self)
             db.session.commit()
+            cache.violations.invalidate(reporter)
         except BaseException:
             print(sys.exc_info())
             db.session.rollback()
@@ -95,10 +154,248 @@ class Trade(db.Model):
     def delete(self):
         """Deletes model from db.
         """
+        from tcm_app import ledger
         error = False
+        reporter = self.reporter
         try:
             db.session.delete(self)
+            ReporterVersion.bump(reporter)  # Locks, see bump
+            ledger.on_delete(self)
             db.session.commit()
+            cache.violations.invalidate(reporter)
+        except BaseException:
+            print(sys.exc_info())
+            db.session.rollback()
+            error = True
+        finally:
+            db.session.close()
+
+        if error:
+            abort(422)
+
+    @classmethod
+    def _trail(cls, criterion, trailed_at):
+        """Copies the trade matching criterion to the paper trail, locking
+        it, and returns its (previous) row. On PostgreSQL by a single
+        statement, INSERT INTO TradePaperTrail SELECT ... FROM Trade ...
+        RETURNING, otherwise by a SELECT before.
+        """
+        table = cls.__table__
+        columns = [table.c[name] for name in TRAILED_COLUMNS]
+        trail = TradePaperTrail.__table__
+        copy = cls._copy_to_trail(criterion, trailed_at)
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            return db.session.execute(copy.returning(
+                trail.c.trade_id.label('id'),
+                *[trail.c[name] for name in TRAILED_COLUMNS])).first()
+
+        row = db.session.execute(
+            db.select([table.c.id, *columns]).where(criterion)).first()
+        if row is not None:
+            db.session.execute(copy)
+        return row
+
+    @classmethod
+    def _copy_to_trail(cls, criterion, trailed_at):
+        """Returns the statement copying trades matching criterion to the
+        paper trail, locking them.
+        """
+        table = cls.__table__
+        columns = [table.c[name] for name in TRAILED_COLUMNS]
+        return TradePaperTrail.__table__.insert().from_select(
+            ['trade_id', *TRAILED_COLUMNS, 'trailed_at'],
+            db.select([table.c.id, *columns, db.literal(
+                trailed_at, db.DateTime)]).where(criterion).with_for_update())
+
+    @classmethod
+    def _exists(cls, id, reporter):
+        return db.session.query(cls.query.filter_by(
+            id=id, reporter=reporter).exists()).scalar()
+
+    @classmethod
+    def update_reported(cls, id, reporter, values):
+        """Updates reporter's trade id with values (column values by name),
+        keeping a paper trail of the previous trade, in a single transaction
+        of one statement each (plus the ledger's). Returns the trade
+        serialised, or None when values are those of the trade already.
+        Aborts with 404 when there is no such trade.
+        """
+        from tcm_app import ledger
+        table = cls.__table__
+        reported_at = datetime.utcnow()
+        error = found = False
+        serialised = None
+        try:
+            old = cls._trail(db.and_(
+                table.c.id == id, table.c.reporter == reporter,
+                db.or_(*[table.c[key] != value
+                         for key, value in values.items()])), reported_at)
+            if old is None:
+                found = cls._exists(id, reporter)
+            else:
+                found = True
+                update = table.update().where(table.c.id == id).values(
+                    reported_at=reported_at, **values)
+                if db.session.get_bind().dialect.name == 'postgresql':
+                    new = db.session.execute(
+                        update.returning(*table.c)).first()
+                else:
+                    db.session.execute(update)
+                    new = db.session.execute(
+                        table.select().where(table.c.id == id)).first()
+                ReporterVersion.bump(reporter)  # Locks, see bump
+                ledger.on_update_row(old, new)
+                db.session.commit()
+                cache.violations.invalidate(reporter)
+                serialised = trade_schema.dump(new)
+        except BaseException:
+            print(sys.exc_info())
+            db.session.rollback()
+            error = True
+        finally:
+            db.session.close()
+
+        if error:
+            abort(422)
+        if not found:
+            abort(404)
+        return serialised
+
+    @classmethod
+    def delete_reported(cls, id, reporter):
+        """Deletes reporter's trade id, keeping a paper trail of it, in a
+        single transaction of one statement each (plus the ledger's). Aborts
+        with 404 when there is no such trade.
+        """
+        from tcm_app import ledger
+        table = cls.__table__
+        error = found = False
+        try:
+            old = cls._trail(db.and_(
+                table.c.id == id, table.c.reporter == reporter),
+                datetime.utcnow())
+            if old is not None:
+                found = True
+                db.session.execute(table.delete().where(table.c.id == id))
+                ReporterVersion.bump(reporter)  # Locks, see bump
+                ledger.on_delete(old)
+                db.session.commit()
+                cache.violations.invalidate(reporter)
+        except BaseException:
+            print(sys.exc_info())
+            db.session.rollback()
+            error = True
+        finally:
+            db.session.close()
+
+        if error:
+            abort(422)
+        if not found:
+            abort(404)
+
+    @classmethod
+    def _select_reported(cls, ids, reporter, chunk_size):
+        """Returns reporter's trades among ids as rows by id, locking them, by
+        one statement per chunk of ids.
+        """
+        table = cls.__table__
+        rows = {}
+        for start in range(0, len(ids), chunk_size):
+            rows.update((row['id'], row) for row in db.session.execute(
+                table.select().where(db.and_(
+                    table.c.reporter == reporter,
+                    table.c.id.in_(ids[start:start + chunk_size])
+                )).with_for_update()))
+        return rows
+
+    @classmethod
+    def bulk_update_reported(cls, reporter, changes, chunk_size):
+        """Updates reporter's trades with changes (column values by trade id)
+        in a single transaction, keeping a paper trail of the previous trades.
+        Per chunk of trades, all are trailed by one insert and updated by one
+        statement. Returns the changed trades serialised by id (None when
+        values are those of the trade already) and the ids of trades not
+        found, in which case none is updated.
+        """
+        from tcm_app import ledger
+        table = cls.__table__
+        reported_at = datetime.utcnow()
+        error = False
+        serialised, missing = {}, []
+        try:
+            old = cls._select_reported(list(changes), reporter, chunk_size)
+            missing = [id for id in changes if id not in old]
+            changed = [id for id, values in changes.items()
+                       if id in old and any(old[id][key] != value
+                                            for key, value in values.items())]
+            if not missing and changed:
+                new = {}
+                for start in range(0, len(changed), chunk_size):
+                    chunk = changed[start:start + chunk_size]
+                    criterion = table.c.id.in_(chunk)
+                    db.session.execute(
+                        cls._copy_to_trail(criterion, reported_at))
+                    # Values of each trade by a CASE on its id per column
+                    keys = {key for id in chunk for key in changes[id]}
+                    update = table.update().where(criterion).values(
+                        reported_at=reported_at, **{key: db.case(
+                            {id: db.literal(changes[id][key],
+                                            table.c[key].type)
+                             for id in chunk if key in changes[id]},
+                            value=table.c.id, else_=table.c[key])
+                            for key in keys})
+                    if db.session.get_bind().dialect.name == 'postgresql':
+                        rows = db.session.execute(update.returning(*table.c))
+                    else:
+                        db.session.execute(update)
+                        rows = db.session.execute(
+                            table.select().where(criterion))
+                    new.update((row['id'], row) for row in rows)
+                ReporterVersion.bump(reporter)  # Locks, see bump
+                ledger.on_bulk_update([(old[id], new[id]) for id in changed])
+                db.session.commit()
+                cache.violations.invalidate(reporter)
+                serialised = {
+                    id: trade_schema.dump(row) for id, row in new.items()}
+        except BaseException:
+            print(sys.exc_info())
+            db.session.rollback()
+            error = True
+        finally:
+            db.session.close()
+
+        if error:
+            abort(422)
+        if missing:
+            return {}, missing
+        return {id: serialised.get(id) for id in changes}, missing
+
+    @classmethod
+    def bulk_delete_reported(cls, reporter, ids, chunk_size):
+        """Deletes reporter's trades ids in a single transaction, keeping a
+        paper trail of them. Per chunk of trades, all are trailed by one
+        insert and deleted by one statement. Returns the ids of trades not
+        found, in which case none is deleted.
+        """
+        from tcm_app import ledger
+        table = cls.__table__
+        trailed_at = datetime.utcnow()
+        error = False
+        missing = []
+        try:
+            old = cls._select_reported(ids, reporter, chunk_size)
+            missing = [id for id in ids if id not in old]
+            if not missing:
+                for start in range(0, len(ids), chunk_size):
+                    criterion = table.c.id.in_(ids[start:start + chunk_size])
+                    db.session.execute(
+                        cls._copy_to_trail(criterion, trailed_at))
+                    db.session.execute(table.delete().where(criterion))
+                ReporterVersion.bump(reporter)  # Locks, see bump
+                ledger.on_bulk_delete(old.values())
+                db.session.commit()
+                cache.violations.invalidate(reporter)
         except BaseException:
             print(sys.exc_info())
             db.session.rollback()
@@ -108,6 +405,7 @@ class Trade(db.Model):
 
         if error:
             abort(422)
+        return missing
 
 
 class TradeSchema(Schema):
@@ -134,6 +432,40 @@ class TradeSchema(Schema):
 
 trade_schema = TradeSchema()
 trades_schema = TradeSchema(many=True)
+trade_serializer = TradeSerializer(trade_schema)
+
+# Loads trades leaving fields to be validated column-wise, see load_trades.
+_unvalidated_trades_schema = TradeSchema(many=True)
+for name in validation.VALIDATED_FIELDS:
+    _unvalidated_trades_schema.fields[name].validators = []
+
+# Loaded fields not nullable in db.
+NOT_NULLABLE = ('quantity', 'price', 'amount')
+
+
+def load_trades(json_data):
+    """Validates and deserializes a list of trades.
+    Returns valid trades as (index, data) tuples and error messages by index.
+    """
+    try:
+        data, errors = _unvalidated_trades_schema.load(json_data), {}
+    except ValidationError as err:
+        data, errors = err.valid_data, err.messages
+    for index, messages in validation.validate_columns(
+            data, trades_schema).items():
+        errors.setdefault(index, {}).update(messages)
+
+    valid = []
+    for index, data_ in enumerate(data):
+        if index in errors:
+            continue
+        missing = [key for key in NOT_NULLABLE if key not in data_]
+        if missing:
+            errors[index] = {
+                key: ['Missing data for required field.'] for key in missing}
+            continue
+        valid.append((index, data_))
+    return valid, errors
 
 
 class TradePaperTrail(db.Model):
@@ -152,8 +484,182 @@ class TradePaperTrail(db.Model):
     reported_at = db.Column(db.DateTime, nullable=False)
     trailed_at = db.Column(db.DateTime, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_TradePaperTrail_trade_id_trailed_at', trade_id,
+                 trailed_at),
+    )
+
     def __repr__(self):
         items = self.__dict__.items()
         return '<TradePaperTrail {}>'.format(', '.join(
             [f'{key}={str(value)}' for (key, value) in items if key[0] != '_']
         ))
+
+
+class OpenLot(db.Model):
+    """Unmatched (remaining) quantity of a trade, see tcm_app.ledger."""
+    __tablename__ = 'OpenLot'
+    trade_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    reporter = db.Column(db.String(), nullable=False)
+    isin = db.Column(db.String(12), nullable=False)
+    direction = db.Column(db.String(4), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    price = db.Column(db.Numeric, nullable=False)
+    quantity = db.Column(db.Numeric, nullable=False)
+
+    __table_args__ = (db.Index('ix_OpenLot_reporter_isin', reporter, isin),)
+
+    def __repr__(self):
+        items = self.__dict__.items()
+        return '<OpenLot {}>'.format(', '.join(
+            [f'{key}={str(value)}' for (key, value) in items if key[0] != '_']
+        ))
+
+
+class ClosedPosition(db.Model):
+    """A buy and a sell trade matched against each other, see
+    tcm_app.ledger.
+    """
+    __tablename__ = 'ClosedPosition'
+    id = db.Column(db.Integer, primary_key=True)
+    reporter = db.Column(db.String(), nullable=False)
+    isin = db.Column(db.String(12), nullable=False)
+    buy_id = db.Column(db.Integer, nullable=False)
+    buy_date = db.Column(db.Date, nullable=False)
+    buy_price = db.Column(db.Numeric, nullable=False)
+    sell_id = db.Column(db.Integer, nullable=False)
+    sell_date = db.Column(db.Date, nullable=False)
+    sell_price = db.Column(db.Numeric, nullable=False)
+    quantity = db.Column(db.Numeric, nullable=False)
+    duration = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_ClosedPosition_reporter_isin', reporter, isin),)
+
+    def __repr__(self):
+        items = self.__dict__.items()
+        return '<ClosedPosition {}>'.format(', '.join(
+            [f'{key}={str(value)}' for (key, value) in items if key[0] != '_']
+        ))
+
+
+class Checkpoint(db.Model):
+    """Matching of a reporter's trades in an ISIN as of (and including) a
+    date, see tcm_app.checkpoints. The state itself is held by the
+    CheckpointLot and CheckpointViolation rows of the reporter and ISIN.
+    """
+    __tablename__ = 'Checkpoint'
+    reporter = db.Column(db.String(), primary_key=True)
+    isin = db.Column(db.String(12), primary_key=True)
+    as_of = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        items = self.__dict__.items()
+        return '<Checkpoint {}>'.format(', '.join(
+            [f'{key}={str(value)}' for (key, value) in items if key[0] != '_']
+        ))
+
+
+class CheckpointLot(db.Model):
+    """Open (remaining) quantity of a trade as of a checkpoint."""
+    __tablename__ = 'CheckpointLot'
+    id = db.Column(db.Integer, primary_key=True)
+    reporter = db.Column(db.String(), nullable=False)
+    isin = db.Column(db.String(12), nullable=False)
+    trade_id = db.Column(db.Integer, nullable=False)
+    direction = db.Column(db.String(4), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    price = db.Column(db.Numeric, nullable=False)
+    quantity = db.Column(db.Numeric, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_CheckpointLot_reporter_isin', reporter, isin),)
+
+    def __repr__(self):
+        items = self.__dict__.items()
+        return '<CheckpointLot {}>'.format(', '.join(
+            [f'{key}={str(value)}' for (key, value) in items if key[0] != '_']
+        ))
+
+
+class CheckpointViolation(db.Model):
+    """Violating position closed as of a checkpoint, by the ids of its buy
+    and sell trades. Ids are in matching order.
+    """
+    __tablename__ = 'CheckpointViolation'
+    id = db.Column(db.Integer, primary_key=True)
+    reporter = db.Column(db.String(), nullable=False)
+    isin = db.Column(db.String(12), nullable=False)
+    buy_id = db.Column(db.Integer, nullable=False)
+    sell_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_CheckpointViolation_reporter_isin', reporter, isin),)
+
+    def __repr__(self):
+        items = self.__dict__.items()
+        return '<CheckpointViolation {}>'.format(', '.join(
+            [f'{key}={str(value)}' for (key, value) in items if key[0] != '_']
+        ))
+
+
+class ReporterVersion(db.Model):
+    """Version of a reporter's trades, incremented on every write of them
+    (within the same transaction). Identifies the state of the trades
+    without reading them, e.g. for conditional requests.
+    """
+    __tablename__ = 'ReporterVersion'
+    reporter = db.Column(db.String(), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    modified_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        items = self.__dict__.items()
+        return '<ReporterVersion {}>'.format(', '.join(
+            [f'{key}={str(value)}' for (key, value) in items if key[0] != '_']
+        ))
+
+    @classmethod
+    def bump(cls, reporter):
+        """Increments the version of reporter's trades in the current
+        transaction. The row stays locked until the transaction ends, which
+        serialises the writers of reporter. Hence writes bump the version
+        before the ledger is read (see tcm_app.ledger).
+        """
+        table = cls.__table__
+        modified_at = datetime.utcnow()
+        if db.session.get_bind().dialect.name == 'postgresql':
+            insert = postgresql.insert(table).values(
+                reporter=reporter, version=1, modified_at=modified_at)
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=[table.c.reporter],
+                set_={'version': table.c.version + 1,
+                      'modified_at': modified_at}))
+            return
+
+        result = db.session.execute(
+            table.update().where(table.c.reporter == reporter).values(
+                version=table.c.version + 1, modified_at=modified_at))
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(
+                reporter=reporter, version=1, modified_at=modified_at))
+
+    @classmethod
+    def get(cls, reporter):
+        """Returns (version, modified_at) of reporter's trades, (0, None)
+        before any trade is reported.
+        """
+        row = db.session.query(cls.version, cls.modified_at).filter(
+            cls.reporter == reporter).one_or_none()
+        return tuple(row) if row is not None else (0, None)
+
+    @classmethod
+    def firm_wide(cls):
+        """Returns (version, modified_at) of all trades, the version being
+        the sum of all reporters' versions (as these only increase).
+        """
+        version, modified_at = db.session.query(
+            db.func.coalesce(db.func.sum(cls.version), 0),
+            db.func.max(cls.modified_at)).one()
+        return int(version), modified_at
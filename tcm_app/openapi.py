@@ -0,0 +1,169 @@
+"""Swagger (flasgger) template of the OpenAPI document, built by apispec.
+
+Building it imports apispec and its plugins, which is slow compared to the
+rest of the app factory. Hence the template is built once and cached as
+JSON at OPENAPI_TEMPLATE_PATH, either at build time (flask openapi) or by
+the first app started. It is rebuilt when its fingerprint, a hash of what
+it is built from (the config used and the source of the schemas), differs.
+"""
+import json
+import os
+from hashlib import sha256
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+# Config the template depends on.
+CONFIG_KEYS = ('AUTH0_API_BASE_URL', 'AUTH0_AUDIENCE')
+
+# Modules (relative to this one) the template is built from.
+SOURCES = ('openapi.py', 'models.py')
+
+
+def fingerprint(app):
+    """Returns a hash of what the template of app is built from."""
+    digest = sha256(json.dumps(
+        [app.config[key] for key in CONFIG_KEYS]).encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build(app):
+    """Returns the template of app, built by apispec."""
+    from apispec.ext.marshmallow import MarshmallowPlugin
+    from apispec_webframeworks.flask import FlaskPlugin
+    from flasgger import APISpec
+
+    from tcm_app.models import TradeSchema
+
+    spec = APISpec(
+        title='Trade Compliance Monitor',
+        version='0.0.1',
+        openapi_version='3.0.2',
+        plugins=[
+            FlaskPlugin(),
+            MarshmallowPlugin(),
+        ],
+        tags=[{
+            'name': 'trades',
+        }],
+        components={
+            'securitySchemes': {
+                #  https://swagger.io/docs/specification/authentication/
+                'bearerAuth': {
+                    'type': 'http',
+                    'scheme': 'bearer',
+                    'bearerFormat': 'JWT'
+                },
+                # Alternative authorization. Requires pasting Client Id as well
+                # as checking boxes for scope, but applies the token
+                # automatically.
+                'implicitFlow': {
+                    'type': 'oauth2',
+                    'flows': {
+                        'implicit': {
+                            'authorizationUrl': (
+                                '{}/authorize?audience={}'.format(
+                                    app.config['AUTH0_API_BASE_URL'],
+                                    app.config['AUTH0_AUDIENCE']
+                                )
+                            ),
+                            'scopes': {
+                                'openid': '',
+                                'email': ''
+                            }
+                        }
+                    }
+                },
+
+                # # Currently not implemented
+                # # Alternative authorization. Requires pasting Client Id and
+                # # Secret as well as checking boxes for scope, but applies the
+                # # token automatically.
+                # 'authorizationCodeFlow': {
+                #     'type': 'oauth2',
+                #     'flows': {
+                #         'authorizationCode': {
+                #             'authorizationUrl': (
+                #                 '{}/authorize?audience={}'.format(
+                #                     app.config['AUTH0_API_BASE_URL'],
+                #                     app.config['AUTH0_AUDIENCE']
+                #                 )
+                #             ),
+                #             'tokenUrl': '{}/oauth/token'.format(
+                #                 app.config['AUTH0_API_BASE_URL']
+                #             ),
+                #             'scopes': {
+                #                 'openid': '',
+                #                 'email': ''
+                #             }
+                #         }
+                #     }
+                # }
+            }
+        },
+        security=[
+            {
+                'bearerAuth': [],
+            },
+            {
+                'implicitFlow': []
+            },
+            # # Currently not implemented
+            # {
+            #     'authorizationCodeFlow': []
+            # }
+        ]
+    )
+    return spec.to_flasgger(app, definitions=[TradeSchema])
+
+
+def save(app, template, path):
+    """Writes template of app to path, replacing any previous one at once.
+    """
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'w') as f:
+        json.dump({'fingerprint': fingerprint(app), 'template': template}, f)
+    os.replace(temporary, path)
+
+
+def template(app):
+    """Returns the template of app, from the cache when up to date.
+    Otherwise it is built, and cached unless the cache can't be written.
+    """
+    path = app.config['OPENAPI_TEMPLATE_PATH']
+    if path is None:
+        return build(app)
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached['fingerprint'] == fingerprint(app):
+            return cached['template']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    result = build(app)
+    try:
+        save(app, result, path)
+    except OSError:
+        app.logger.warning('Unable to cache OpenAPI template at %s.', path,
+                           exc_info=True)
+    return result
+
+
+@click.command('openapi')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Defaults to OPENAPI_TEMPLATE_PATH.')
+@with_appcontext
+def openapi_command(output):
+    """Build and cache the OpenAPI (Swagger) template."""
+    app = current_app._get_current_object()
+    path = output or app.config['OPENAPI_TEMPLATE_PATH']
+    if path is None:
+        raise click.UsageError('OPENAPI_TEMPLATE_PATH is not configured.')
+    save(app, build(app), path)
+    click.echo('OpenAPI template written to {}'.format(path))
@@ -0,0 +1,124 @@
+"""Opt-in profiling of the SQL statements of each request (SQL_PROFILING).
+
+Statements are counted and timed by shape, i.e. their SQL with whitespace
+and the bound parameters of IN lists collapsed. A statement slower than
+SQL_SLOW_STATEMENT_SECONDS is logged with its parameters and endpoint. A
+shape executed more than SQL_REPEATED_STATEMENT_LIMIT times by a single
+request, typically a query within a loop (N+1 queries), is logged when the
+request ends. Both are counted by tcm_app.metrics as well.
+"""
+import re
+from collections import defaultdict
+from time import perf_counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from tcm_app import metrics
+
+# Parameters logged per slow statement are cut at this length.
+MAX_PARAMETERS_LENGTH = 1000
+
+# Bound parameters of an expanded IN list, e.g. (?, ?, ?) or (%(id_1)s, ...).
+_PARAMETER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_PARAMETER_LIST = re.compile(
+    r'\(\s*' + _PARAMETER + r'(?:\s*,\s*' + _PARAMETER + r')+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def shape(statement):
+    """Returns statement with whitespace and IN lists collapsed."""
+    return _PARAMETER_LIST.sub(
+        '(...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class RequestProfile:
+    """Statements of a request: count and seconds by shape."""
+
+    def __init__(self):
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def add(self, statement, seconds):
+        entry = self.statements[shape(statement)]
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def _profile():
+    return g.get('_sql_profile') if has_app_context() else None
+
+
+def _endpoint():
+    return request.endpoint or 'none'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _profile() is not None:
+        conn.info.setdefault('profiling_starts', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    starts = conn.info.get('profiling_starts')
+    profile = _profile()
+    if not starts or profile is None:
+        return
+    seconds = perf_counter() - starts.pop()
+    profile.add(statement, seconds)
+
+    if seconds >= current_app.config['SQL_SLOW_STATEMENT_SECONDS']:
+        endpoint = _endpoint()
+        metrics.slow_statements.inc((endpoint,))
+        current_app.logger.warning(
+            'Slow statement (%.3fs) in %s: %s; parameters: %.*s', seconds,
+            endpoint, statement, MAX_PARAMETERS_LENGTH, repr(parameters))
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    starts = conn.info.get('profiling_starts') if conn is not None else None
+    if starts:
+        starts.pop()
+
+
+def _before_request():
+    g._sql_profile = RequestProfile()
+
+
+def _teardown_request(exc):
+    profile = g.pop('_sql_profile', None)
+    if profile is None:
+        return
+    endpoint = _endpoint()
+    limit = current_app.config['SQL_REPEATED_STATEMENT_LIMIT']
+    for statement, (count, seconds) in profile.statements.items():
+        if count > limit:
+            metrics.repeated_statements.inc((endpoint,))
+            current_app.logger.warning(
+                'Statement repeated %d times (%.3fs) in %s, N+1 queries?: %s',
+                count, seconds, endpoint, statement)
+    current_app.logger.debug(
+        '%d statements (%d unique) in %.3fs in %s',
+        sum(count for count, _ in profile.statements.values()),
+        len(profile.statements),
+        sum(seconds for _, seconds in profile.statements.values()), endpoint)
+
+
+_listening = False
+
+
+def init_app(app):
+    """Profiles statements of requests of app, if SQL_PROFILING is on."""
+    global _listening
+    if not app.config['SQL_PROFILING']:
+        return
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+    if not _listening:
+        # Of any engine, profiled only within a request
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
@@ -0,0 +1,121 @@
+"""Routing of reads to a read replica of the database (DATABASE_REPLICA_URL).
+
+Writes (POST, PATCH and DELETE) always go to the primary. GET endpoints
+read from the replica when it is consistent enough with the primary, as
+decided for each request by the version of the trades read (see
+models.ReporterVersion) in both databases:
+
+* A reporter's own trades and violations are read from the replica only
+  if it holds the same version as the primary, hence reporters always read
+  their own writes, whatever the replica's lag.
+* All trades and violations are read from the replica if it holds the same
+  version, or if its latest write is at most REPLICA_MAX_LAG seconds older
+  than the primary's.
+
+Responses (and cached violations) are of the version read, hence ETags
+stay consistent whichever database served them. When the replica fails,
+reads go to the primary for REPLICA_RETRY_INTERVAL seconds.
+"""
+from time import monotonic
+
+import sqlalchemy
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import orm
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.expression import UpdateBase
+
+from tcm_app import metrics
+
+PRIMARY, REPLICA = 'primary', 'replica'
+
+
+class Replica:
+    """Engine of an app's replica, and until when it is considered failed.
+    """
+
+    def __init__(self, app):
+        self.engine = sqlalchemy.create_engine(
+            app.config['SQLALCHEMY_REPLICA_URI'],
+            **app.config['SQLALCHEMY_REPLICA_ENGINE_OPTIONS'])
+        self.failed_until = 0
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from the replica when the current request is routed
+    there (see route), and otherwise (and always when writing) from the
+    primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if (has_app_context() and g.get('_database') == REPLICA and
+                not self._flushing and not isinstance(clause, UpdateBase)):
+            return self.app.extensions['replica'].engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with sessions of RoutingSession."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def _versions(reporter):
+    from tcm_app.models import ReporterVersion
+    if reporter is None:
+        return ReporterVersion.firm_wide()
+    return ReporterVersion.get(reporter)
+
+
+def _route(database, reason, versions):
+    g._database = database
+    metrics.routed_reads.inc((database, reason))
+    return versions
+
+
+def route(reporter=None):
+    """Routes the reads of the current request to the replica, if
+    consistent enough with the primary, else to the primary. Returns the
+    (version, modified_at) of reporter's trades, or of all trades if None,
+    in the database routed to.
+    """
+    primary = _versions(reporter)
+    replica = current_app.extensions.get('replica')
+    if replica is None:
+        return primary
+    if monotonic() < replica.failed_until:
+        return _route(PRIMARY, 'failed', primary)
+
+    g._database = REPLICA
+    try:
+        versions = _versions(reporter)
+    except DBAPIError:
+        current_app.logger.warning(
+            'Reading from the primary, as the replica failed.', exc_info=True)
+        replica.failed_until = (
+            monotonic() + current_app.config['REPLICA_RETRY_INTERVAL'])
+        return _route(PRIMARY, 'failed', primary)
+
+    if versions[0] == primary[0]:
+        return _route(REPLICA, 'consistent', versions)
+    if (reporter is None and primary[1] is not None and
+            versions[1] is not None):
+        lag = (primary[1] - versions[1]).total_seconds()
+        if lag <= current_app.config['REPLICA_MAX_LAG']:
+            return _route(REPLICA, 'lag', versions)
+    return _route(PRIMARY, 'stale', primary)
+
+
+def _teardown_request(exc):
+    g.pop('_database', None)
+
+
+def init_app(app):
+    """Sets up the replica of app, if SQLALCHEMY_REPLICA_URI is configured.
+    """
+    app.extensions.pop('replica', None)
+    if app.config['SQLALCHEMY_REPLICA_URI'] is None:
+        return
+    app.extensions['replica'] = Replica(app)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,85 @@
+"""Precompiled JSON serialization of trades.
+
+Dumping with marshmallow, and then encoding the result, runs through each
+field's machinery for every trade. A TradeSerializer is instead compiled once
+from a schema into a function encoding an object (an entity or a row from a
+column-only query) straight into JSON, the same as the schema dumps and
+Flask's JSON encoder (simplejson) encodes it. Encoded trades are embedded
+as-is by Flask's encoder as simplejson.RawJSON.
+"""
+from decimal import Decimal
+
+from marshmallow import fields
+from simplejson import RawJSON
+from simplejson.encoder import encode_basestring, encode_basestring_ascii
+
+
+def _integer(value, quote):
+    return 'null' if value is None else str(int(value))
+
+
+def _decimal(value, quote):
+    if value is None:
+        return 'null'
+    if type(value) is not Decimal:
+        value = Decimal(str(value))  # As fields.Decimal does
+    return str(value)
+
+
+def _string(value, quote):
+    return 'null' if value is None else quote(str(value))
+
+
+def _isoformat(value, quote):
+    return 'null' if value is None else '"' + value.isoformat() + '"'
+
+
+# Encoder by field class, encoding as the field serializes and simplejson
+# encodes the result. Subclasses of these may serialize differently, hence
+# only exact classes are compiled.
+ENCODERS = {
+    fields.Integer: _integer,
+    fields.Decimal: _decimal,
+    fields.String: _string,
+    fields.Date: _isoformat,
+    fields.DateTime: _isoformat,
+}
+
+
+class TradeSerializer:
+    """Serializer compiled from (the dump fields of) a marshmallow schema."""
+
+    def __init__(self, schema):
+        # Source of one expression per field, as in: '"id":' + _encode0(
+        # obj.id, quote), in the order the schema dumps them.
+        namespace, items = {}, []
+        for index, (name, field) in enumerate(schema.dump_fields.items()):
+            encoder = ENCODERS.get(type(field))
+            attribute = field.attribute or name
+            if (encoder is None or not attribute.isidentifier() or
+                    getattr(field, 'format', None) not in (None, 'iso') or
+                    getattr(field, 'places', None) is not None or
+                    getattr(field, 'as_string', False)):
+                raise ValueError(f'Field "{name}" can not be compiled.')
+            key = encode_basestring_ascii(field.data_key or name) + ':'
+            namespace[f'_encode{index}'] = encoder
+            items.append(
+                f'{key!r} + _encode{index}(obj.{attribute}, quote)')
+
+        source = ("def encode(obj, quote):\n"
+                  "    return '{' + " + " + ',' + ".join(items) + " + '}'\n")
+        exec(compile(source, f'<{type(schema).__name__} serializer>', 'exec'),
+             namespace)
+        self._encode = namespace['encode']
+
+    def encode(self, obj, ensure_ascii=True):
+        """Returns obj encoded as JSON."""
+        return self._encode(
+            obj,
+            encode_basestring_ascii if ensure_ascii else encode_basestring)
+
+    def raw(self, objs, ensure_ascii=True):
+        """Returns objs encoded as JSON, to be embedded by Flask's encoder."""
+        quote = encode_basestring_ascii if ensure_ascii else encode_basestring
+        encode = self._encode
+        return [RawJSON(encode(obj, quote)) for obj in objs]
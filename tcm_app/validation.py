@@ -0,0 +1,158 @@
+"""Column-wise validation of many trades at once.
+
+The validators of TradeSchema are run one trade at a time by marshmallow.
+Here the same rules are checked for whole columns with NumPy, and only the
+values failing are passed on to the original validators, hence error
+messages are exactly those of marshmallow. ISIN checksums are memoized, as
+the same ISINs are reported again and again.
+
+NumPy is imported when first used, not when the app starts, as only
+reporting many trades at once (batches and imports) validates columns.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+from marshmallow import ValidationError
+
+# Fields checked column-wise, instead of by their validators.
+VALIDATED_FIELDS = ('isin', 'direction', 'currency', 'date')
+
+# Maximum number of ISINs memoized (the memo is cleared when full).
+ISIN_MEMO_SIZE = 100000
+
+# Outcome of validate_isin by ISIN: None or an error message.
+_isin_errors = {}
+
+
+@lru_cache(maxsize=None)
+def _tables():
+    """Returns the lookup tables of the ISIN checksum, built when first used.
+    """
+    import numpy as np
+
+    # Luhn digit sum of a doubled digit, sum(divmod(2 * digit, 10)), by
+    # digit.
+    doubled = np.array([0, 2, 4, 6, 8, 1, 3, 5, 7, 9])
+
+    # Base 36 value of an (ASCII) character, int(c, 36), by character code.
+    base36 = np.zeros(128, dtype=np.int64)
+    base36[ord('0'):ord('9') + 1] = np.arange(10)
+    base36[ord('A'):ord('Z') + 1] = np.arange(10, 36)
+    base36[ord('a'):ord('z') + 1] = np.arange(10, 36)
+    return doubled, base36
+
+
+def _is_alpha(codes):
+    return ((codes >= ord('A')) & (codes <= ord('Z'))) | (
+        (codes >= ord('a')) & (codes <= ord('z')))
+
+
+def _is_alnum(codes):
+    return _is_alpha(codes) | ((codes >= ord('0')) & (codes <= ord('9')))
+
+
+def isin_checks(isins):
+    """Returns a boolean array, True where an ISIN passes validate_isin.
+    ISINs (str) are checked as fixed-width byte arrays. Non-ASCII ISINs are
+    reported as failing, to be checked by validate_isin itself.
+    """
+    import numpy as np
+    doubled, base36 = _tables()
+
+    result = np.zeros(len(isins), dtype=bool)
+    candidates = [i for i, isin in enumerate(isins)
+                  if len(isin) == 12 and isin.isascii()]
+    if not candidates:
+        return result
+    codes = np.frombuffer(
+        np.array([isins[i] for i in candidates], dtype='S12').tobytes(),
+        dtype=np.uint8).reshape(-1, 12)
+
+    well_formed = (_is_alpha(codes[:, :2]).all(axis=1) &
+                   _is_alnum(codes[:, 2:]).all(axis=1))
+
+    # Luhn checksum of the base 36 digits, counting positions from the last
+    # digit: every second digit (odd positions) is doubled. Letters are two
+    # digits (10-35), hence shift the positions of the characters before.
+    values = base36[codes]
+    digits = 1 + (values >= 10)
+    ones_position = np.cumsum(digits[:, ::-1], axis=1)[:, ::-1] - digits
+
+    def luhn(digit, position):
+        return np.where(position % 2, doubled[digit], digit)
+
+    total = (luhn(values % 10, ones_position) +
+             np.where(digits == 2, luhn(values // 10, ones_position + 1), 0))
+    result[candidates] = well_formed & (total.sum(axis=1) % 10 == 0)
+    return result
+
+
+def _error(validator, value):
+    """Returns the error message of validator for value, if any."""
+    try:
+        validator(value)
+    except ValidationError as err:
+        return err.messages[0]
+    return None
+
+
+def validate_columns(data, schema):
+    """Validates the VALIDATED_FIELDS of trades, deserialized without their
+    validators (leaving out fields which failed to deserialize), by the
+    validators of schema. Returns error messages by index and field, as
+    marshmallow would.
+    """
+    import numpy as np
+
+    fields = schema.fields
+    errors = {}
+
+    def add_errors(field, indexes, values, passed):
+        (validator,) = fields[field].validators
+        for index, value, ok in zip(indexes, values, passed):
+            if not ok:
+                message = _error(validator, value)
+                if message is not None:
+                    errors.setdefault(index, {})[field] = [message]
+
+    def column(field):
+        indexes = [i for i, data_ in enumerate(data) if field in data_]
+        return indexes, [data[i][field] for i in indexes]
+
+    # ISIN, each unique ISIN checked once and memoized
+    indexes, values = column('isin')
+    isin_errors, unseen = {}, []
+    for isin in set(values):
+        if isin in _isin_errors:
+            isin_errors[isin] = _isin_errors[isin]
+        else:
+            unseen.append(isin)
+    if unseen:
+        validator = fields['isin'].validators[0]
+        for isin, ok in zip(unseen, isin_checks(unseen)):
+            isin_errors[isin] = None if ok else _error(validator, isin)
+        if len(_isin_errors) + len(unseen) > ISIN_MEMO_SIZE:
+            _isin_errors.clear()
+        _isin_errors.update((isin, isin_errors[isin]) for isin in unseen)
+    for index, isin in zip(indexes, values):
+        message = isin_errors[isin]
+        if message is not None:
+            errors.setdefault(index, {})['isin'] = [message]
+
+    indexes, values = column('direction')
+    choices = list(fields['direction'].validators[0].choices)
+    add_errors('direction', indexes, values,
+               np.isin(np.array(values, dtype=object), choices))
+
+    indexes, values = column('currency')
+    length = fields['currency'].validators[0].equal
+    add_errors('currency', indexes, values,
+               np.fromiter(map(len, values), dtype=np.int64,
+                           count=len(values)) == length)
+
+    indexes, values = column('date')
+    today = np.datetime64(datetime.now().date(), 'D')
+    add_errors('date', indexes, values,
+               np.array(values, dtype='datetime64[D]') <= today)
+
+    return errors
@@ -0,0 +1,205 @@
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+
+from benchmarks import identity_provider
+from tcm_app import auth, create_app
+
+JWKS_PATH = '/.well-known/jwks.json'
+USERINFO_PATH = '/userinfo'
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.provider, cls.server = identity_provider.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app.config.update(
+            AUTH0_API_BASE_URL=self.provider.base_url, JWKS_TTL=600,
+            JWKS_MIN_REFRESH_INTERVAL=30)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.provider.unavailable = False
+        self.provider.requests.clear()
+
+        self.now = 1000.0
+        patcher = mock.patch('tcm_app.auth.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.jwks = auth.JWKSCache()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def fetches(self):
+        return self.provider.requests[JWKS_PATH]
+
+    def test_jwks_ttl(self):
+        kid = self.provider.kid
+        self.assertIsNotNone(self.jwks.get_key(kid))
+        self.now += 599
+        self.assertIsNotNone(self.jwks.get_key(kid))
+        self.assertEqual(self.fetches(), 1)
+
+        self.now += 1
+        self.assertIsNotNone(self.jwks.get_key(kid))
+        self.assertEqual(self.fetches(), 2)
+
+    def test_jwks_unknown_kid(self):
+        old = self.provider.kid
+        self.assertIsNotNone(self.jwks.get_key(old))
+        self.provider.rotate('rotated')
+
+        # Refreshed at most once every JWKS_MIN_REFRESH_INTERVAL
+        self.now += 29
+        self.assertIsNone(self.jwks.get_key('rotated'))
+        self.assertEqual(self.fetches(), 1)
+        self.now += 1
+        self.assertIsNotNone(self.jwks.get_key('rotated'))
+        self.assertIsNone(self.jwks.get_key(old))
+        self.assertEqual(self.fetches(), 2)
+
+    def test_jwks_concurrent_refresh(self):
+        kid = self.provider.kid
+        barrier = threading.Barrier(8)
+        keys = []
+
+        def get_key():
+            with self.app.app_context():
+                barrier.wait()
+                keys.append(self.jwks.get_key(kid))
+
+        for expected in (1, 2):  # First fetch, then refresh after JWKS_TTL
+            threads = [threading.Thread(target=get_key) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(self.fetches(), expected)
+            self.now += 600
+        self.assertEqual(len(keys), 16)
+        self.assertNotIn(None, keys)
+
+    def test_jwks_refresh_failed(self):
+        kid = self.provider.kid
+        key = self.jwks.get_key(kid)
+        self.provider.unavailable = True
+        self.now += 600
+
+        # Previous keys kept, and retried after JWKS_MIN_REFRESH_INTERVAL
+        with self.assertLogs(self.app.logger, 'ERROR'):
+            self.assertIs(self.jwks.get_key(kid), key)
+        self.now += 29
+        self.assertIs(self.jwks.get_key(kid), key)
+        self.assertEqual(self.fetches(), 2)
+
+        self.provider.unavailable = False
+        self.now += 1
+        self.assertIsNotNone(self.jwks.get_key(kid))
+        self.assertEqual(self.fetches(), 3)
+
+    def test_jwks_refresh_failed_unknown_kid(self):
+        self.jwks.get_key(self.provider.kid)
+        self.provider.unavailable = True
+        self.now += 30
+
+        # Attempts are limited by JWKS_MIN_REFRESH_INTERVAL too
+        with self.assertLogs(self.app.logger, 'ERROR'):
+            self.assertIsNone(self.jwks.get_key('unknown'))
+        self.assertIsNone(self.jwks.get_key('unknown'))
+        self.now += 29
+        self.assertIsNone(self.jwks.get_key('unknown'))
+        self.assertEqual(self.fetches(), 2)
+
+    def test_jwks_first_fetch_failed(self):
+        self.provider.unavailable = True
+        with self.assertRaises(HTTPError):
+            self.jwks.get_key(self.provider.kid)
+
+    def test_token_cache_lru(self):
+        cache = auth.TokenCache()
+        for token in ('a', 'b'):
+            cache.put(token, {'exp': 2e9, 'sub': token}, maxsize=2)
+        self.assertEqual(cache.get('a')['sub'], 'a')  # Most recently used
+        cache.put('c', {'exp': 2e9, 'sub': 'c'}, maxsize=2)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a')['sub'], 'a')
+        self.assertEqual(cache.get('c')['sub'], 'c')
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1, 'size': 2})
+
+    def test_token_cache_expiry(self):
+        cache = auth.TokenCache()
+        payload = cache.put(
+            'a', {'exp': 2000, 'permissions': ['get:trades']}, maxsize=2)
+        self.assertEqual(payload['permissions'], frozenset(['get:trades']))
+
+        with mock.patch('tcm_app.auth.time', lambda: 1999.5):
+            self.assertIs(cache.get('a'), payload)
+        with mock.patch('tcm_app.auth.time', lambda: 2000):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 0})
+
+    def test_token_cache_without_exp(self):
+        cache = auth.TokenCache()
+        payload = cache.put('a', {'permissions': ['get:trades']}, maxsize=2)
+        self.assertEqual(payload['permissions'], frozenset(['get:trades']))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1, 'size': 0})
+
+    def test_ttl_cache(self):
+        cache = auth.TTLCache()
+        cache.put('a', 1, ttl=10, maxsize=2)
+        cache.put('b', 2, ttl=20, maxsize=2)
+        self.now += 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+
+        cache.put('c', 3, ttl=20, maxsize=2)
+        cache.put('d', 4, ttl=20, maxsize=2)  # Evicts the oldest, b
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('c'), cache.get('d')), (3, 4))
+
+    def test_get_email(self):
+        token = self.provider.issue('jane.doe@example.com')
+        payload = {'sub': 'local|jane.doe@example.com'}
+        with mock.patch.object(auth, 'emails', auth.TTLCache()):
+            for _ in range(2):
+                self.assertEqual(auth.get_email(token, payload),
+                                 'jane.doe@example.com')
+            self.assertEqual(self.provider.requests[USERINFO_PATH], 1)
+
+            # After USERINFO_CACHE_TTL
+            self.now += self.app.config['USERINFO_CACHE_TTL']
+            auth.get_email(token, payload)
+            self.assertEqual(self.provider.requests[USERINFO_PATH], 2)
+
+    def test_get_email_from_claim(self):
+        self.app.config['AUTH0_EMAIL_CLAIM'] = 'https://tcm/email'
+        token = self.provider.issue(
+            'jane.doe@example.com', email_claim='https://tcm/email')
+        payload = {'sub': 'local|jane.doe@example.com',
+                   'https://tcm/email': 'jane.doe@example.com'}
+        with mock.patch.object(auth, 'emails', auth.TTLCache()):
+            self.assertEqual(auth.get_email(token, payload),
+                             'jane.doe@example.com')
+        self.assertEqual(self.provider.requests[USERINFO_PATH], 0)
+
+    def test_verified_token_cached(self):
+        token = self.provider.issue('jane.doe@example.com')
+        with mock.patch.object(auth, 'verified_tokens', auth.TokenCache()):
+            payload = auth.verify_decode_jwt(token)
+            self.assertIs(auth.verify_decode_jwt(token), payload)
+            self.assertIn('get:trades', payload['permissions'])
+            self.assertEqual(auth.verified_tokens.stats(),
+                             {'hits': 1, 'misses': 1, 'size': 1})
@@ -0,0 +1,154 @@
+import json
+import unittest
+
+from benchmarks import identity_provider
+from tcm_app import create_app
+from tcm_app.models import Trade, TradePaperTrail, db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.provider, cls.server = identity_provider.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app.config.update(
+            AUTH0_API_BASE_URL=self.provider.base_url,
+            VIOLATIONS_CACHE_TYPE='null')
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+        self.trade = {
+            "isin": "US0378331005",
+            "amount": 36500,
+            "price": 365.00,
+            "direction": 'Buy',
+            "date": "2020-01-01",
+            "name": "Apple Inc",
+            "quantity": 100,
+            "currency": "USD"
+        }
+        self.employee = {'Authorization': 'Bearer {}'.format(
+            self.provider.issue('jane.doe@example.com'))}
+        res = self.client().post(
+            '/api/trades/batch', headers=self.employee,
+            json=[self.trade, dict(self.trade, direction='Sell', quantity=50,
+                                   amount=18250, date='2020-01-10')])
+        self.assertEqual(res.status_code, 200)
+        self.ids = [trade.id for trade in Trade.query.order_by(Trade.id)]
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def quantities(self):
+        return [int(trade.quantity)
+                for trade in Trade.query.order_by(Trade.id)]
+
+    def test_patch_batch(self):
+        res = self.client().patch(
+            '/api/trades/batch', headers=self.employee,
+            json=[dict(self.trade, id=self.ids[0], quantity=80, amount=29200),
+                  dict(self.trade, id=self.ids[1], direction='Sell',
+                       quantity=50, amount=18250, date='2020-01-10')])
+        self.assertEqual(res.status_code, 200)
+        data = res.get_json()
+        self.assertEqual(data['updated'], 1)
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['updated', 'unchanged'])
+        self.assertEqual(data['results'][0]['trade']['quantity'], 80)
+        self.assertEqual(self.quantities(), [80, 50])
+        self.assertEqual(
+            [trail.trade_id for trail in TradePaperTrail.query.all()],
+            [self.ids[0]])
+
+    def test_patch_batch_is_atomic(self):
+        res = self.client().patch(
+            '/api/trades/batch', headers=self.employee,
+            json=[dict(self.trade, id=self.ids[0], quantity=80, amount=29200),
+                  dict(self.trade, id=self.ids[1] + 1)])
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(res.get_json()['errors'], [
+            {'index': 1, 'messages': {'id': ['No such trade.']}}])
+
+        res = self.client().patch(
+            '/api/trades/batch', headers=self.employee,
+            json=[dict(self.trade, id=self.ids[0]),
+                  dict(self.trade, id=self.ids[0], isin='US0378331006'),
+                  self.trade])
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(
+            [error['index'] for error in res.get_json()['errors']], [1, 2])
+        self.assertEqual(self.quantities(), [100, 50])
+        self.assertEqual(TradePaperTrail.query.count(), 0)
+
+    def test_delete_batch(self):
+        res = self.client().delete(
+            '/api/trades/batch', headers=self.employee,
+            json=[self.ids[1], self.ids[1] + 1])
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Trade.query.count(), 2)
+
+        res = self.client().delete(
+            '/api/trades/batch', headers=self.employee, json=self.ids)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['deleted'], 2)
+        self.assertEqual(Trade.query.count(), 0)
+        self.assertEqual(
+            sorted(trail.trade_id for trail in TradePaperTrail.query.all()),
+            self.ids)
+
+    def test_post_batch_atomic(self):
+        res = self.client().post(
+            '/api/trades/batch', headers=self.employee,
+            json=[self.trade, dict(self.trade, isin='US0378331006')])
+        self.assertEqual(res.status_code, 422)
+        data = res.get_json()
+        self.assertEqual(data['reported'], 0)
+        self.assertEqual([error['index'] for error in data['errors']], [1])
+        self.assertIn('isin', data['errors'][0]['messages'])
+        self.assertEqual(Trade.query.count(), 2)
+
+    def test_post_batch_partial(self):
+        res = self.client().post(
+            '/api/trades/batch?mode=partial', headers=self.employee,
+            json=[dict(self.trade, direction='Hold'), self.trade,
+                  dict(self.trade, quantity=None)])
+        self.assertEqual(res.status_code, 200)
+        data = res.get_json()
+        self.assertEqual(data['reported'], 1)
+        self.assertEqual([error['index'] for error in data['errors']],
+                         [0, 2])
+        self.assertEqual(Trade.query.count(), 3)
+
+        res = self.client().post(
+            '/api/trades/batch?mode=all', headers=self.employee,
+            json=[self.trade])
+        self.assertEqual(res.status_code, 400)
+
+    def test_post_batch_ndjson(self):
+        body = '\n'.join(json.dumps(dict(self.trade, quantity=quantity))
+                         for quantity in (10, 20)) + '\n'
+        res = self.client().post(
+            '/api/trades/batch', headers=self.employee, data=body,
+            content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json(), {'reported': 2, 'errors': []})
+        self.assertEqual(self.quantities(), [100, 50, 10, 20])
+
+        res = self.client().post(
+            '/api/trades/batch', headers=self.employee, data='{"isin":\n',
+            content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 400)
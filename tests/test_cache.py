@@ -0,0 +1,31 @@
+import unittest
+
+from tcm_app.cache import LRUCache, ViolationsCache
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def test_lru_cache(self):
+        cache = LRUCache(threshold=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')  # Most recently used
+        cache.set('c', 3)
+        self.assertEqual(
+            [cache.get(key) for key in 'abc'], [1, None, 3])
+        cache.delete('a')
+        self.assertEqual(len(cache), 1)
+
+    def test_violations_cache(self):
+        violations = ViolationsCache()
+        violations.backend = LRUCache()
+        violations.put('john.doe@example.com', 1, 'null')
+        self.assertEqual(violations.get('john.doe@example.com', 1), 'null')
+        # Outdated version
+        self.assertIsNone(violations.get('john.doe@example.com', 2))
+        violations.invalidate('john.doe@example.com')
+        self.assertIsNone(violations.get('john.doe@example.com', 1))
+        stats = violations.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertEqual(stats['entries'], 0)
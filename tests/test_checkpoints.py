@@ -0,0 +1,89 @@
+import unittest
+from datetime import date, datetime
+from itertools import groupby
+
+from tcm_app import checkpoints, create_app, fifo
+from tcm_app.models import Checkpoint, CheckpointLot, Trade, db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def create_trade(self, direction, quantity, price, day):
+        trade = Trade(
+            isin='US0378331005', name='Apple Inc', direction=direction,
+            quantity=quantity, price=price, currency='USD',
+            amount=quantity * price, date=date(2020, 1, day),
+            reporter='john.doe@example.com', reported_at=datetime.utcnow())
+        trade.create()
+        return trade.id
+
+    def create_checkpoints(self, day):
+        checkpoints.create(date(2020, 1, day))
+        db.session.commit()
+
+    def assertCheckpointsMatchReplay(self):
+        trades = Trade.query.order_by(
+            Trade.reporter, Trade.isin, Trade.date, Trade.id).all()
+        expected = []
+        for reporter, trades_ in groupby(trades, key=lambda t: t.reporter):
+            by_isin = [
+                (isin, [(p.buy.id, p.sell.id) for p in positions
+                        if p.violating])
+                for isin, positions in fifo.match_by_isin(list(trades_))]
+            expected.append(
+                (reporter, [item for item in by_isin if item[1]]))
+
+        self.assertEqual(
+            [(reporter, [(isin, [(p.buy.id, p.sell.id) for p in positions])
+                         for isin, positions in by_isin])
+             for reporter, by_isin in checkpoints.violating_positions(
+                 ['john.doe@example.com'])],
+            expected)
+
+    def test_checkpoints(self):
+        self.create_trade('Buy', 100, 365, 1)
+        self.create_trade('Sell', 60, 375, 5)
+        self.create_trade('Buy', 50, 380, 10)
+        self.create_checkpoints(12)
+        self.assertEqual(Checkpoint.query.count(), 1)
+        self.assertEqual(
+            {(lot.trade_id, lot.quantity) for lot in CheckpointLot.query},
+            {(1, 40), (3, 50)})
+
+        # Matched against the open lots of the checkpoint
+        self.create_trade('Sell', 70, 390, 20)
+        self.assertCheckpointsMatchReplay()
+
+        # Advancing the checkpoint keeps violations closed before it
+        self.create_checkpoints(25)
+        self.assertEqual(Checkpoint.query.one().as_of, date(2020, 1, 25))
+        self.assertCheckpointsMatchReplay()
+
+        # A back-dated write invalidates the checkpoint
+        id = self.create_trade('Buy', 10, 360, 3)
+        self.assertEqual(Checkpoint.query.count(), 0)
+        self.assertEqual(CheckpointLot.query.count(), 0)
+        self.assertCheckpointsMatchReplay()
+
+        # Whereas a later one does not
+        self.create_checkpoints(25)
+        self.create_trade('Sell', 10, 400, 28)
+        self.assertEqual(Checkpoint.query.count(), 1)
+        self.assertCheckpointsMatchReplay()
+
+        Trade.query.get(id).delete()
+        self.assertEqual(Checkpoint.query.count(), 0)
+        self.assertCheckpointsMatchReplay()
@@ -0,0 +1,31 @@
+import unittest
+from collections import namedtuple
+from datetime import date
+
+from tcm_app.evaluation import violating_pairs
+
+Row = namedtuple('Row', 'id isin direction quantity price date reporter')
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def test_violating_pairs(self):
+        trades = []
+        for i in range(40):
+            trades.append(Row(
+                2 * i + 1, 'US0378331005', 'Buy', 10, 1, date(2020, 1, 1),
+                f'reporter{i % 7}'))
+            trades.append(Row(
+                2 * i + 2, 'US0378331005', 'Sell', 10, 2, date(2020, 1, 2),
+                f'reporter{i % 7}'))
+        serial = violating_pairs(trades)
+        self.assertEqual(
+            [reporter for reporter, _ in serial],
+            [f'reporter{i}' for i in range(7)])
+        self.assertEqual(serial[0][1], [('US0378331005', [
+            (1, 2), (15, 16), (29, 30), (43, 44), (57, 58), (71, 72)])])
+        self.assertEqual(
+            violating_pairs(trades, executor='thread', workers=3), serial)
+        self.assertEqual(
+            violating_pairs(trades, executor='process', workers=2), serial)
@@ -0,0 +1,43 @@
+import unittest
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+from tcm_app.fifo import match_by_isin, match_trades
+
+Row = namedtuple('Row', 'id isin direction quantity price date')
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def test_match_trades(self):
+        trades = [
+            Row(1, 'US0378331005', 'Buy', Decimal(100), 365,
+                date(2020, 1, 1)),
+            Row(2, 'US0378331005', 'Sell', Decimal(60), 375,
+                date(2020, 1, 15)),
+            Row(3, 'US0378331005', 'Sell', Decimal(60), 360,
+                date(2020, 3, 1)),
+        ]
+        closed_positions, buy, sell = match_trades(trades)
+        self.assertEqual(
+            [(p.buy.id, p.sell.id, p.quantity, p.duration)
+             for p in closed_positions],
+            [(1, 2, 60, 14), (1, 3, 40, 60)])
+        self.assertEqual([p.violating for p in closed_positions],
+                         [True, False])
+        self.assertEqual(len(buy), 0)
+        self.assertEqual([(lot.trade.id, lot.quantity) for lot in sell],
+                         [(3, 20)])
+
+    def test_match_by_isin(self):
+        trades = [
+            Row(1, 'US0378331005', 'Buy', 10, 1, date(2020, 1, 1)),
+            Row(2, 'SE0000108656', 'Buy', 10, 1, date(2020, 1, 2)),
+            Row(3, 'US0378331005', 'Sell', 10, 2, date(2020, 1, 3)),
+        ]
+        matched = [(isin, [(p.buy.id, p.sell.id) for p in closed_positions])
+                   for isin, closed_positions in match_by_isin(trades)]
+        self.assertEqual(
+            matched, [('SE0000108656', []), ('US0378331005', [(1, 3)])])
@@ -0,0 +1,60 @@
+import unittest
+
+from benchmarks import identity_provider
+from tcm_app import create_app
+from tcm_app.models import db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.provider, cls.server = identity_provider.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app.config['AUTH0_API_BASE_URL'] = self.provider.base_url
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def get(self, path, token):
+        return self.client().get(
+            path, headers={'Authorization': f'Bearer {token}'})
+
+    def test_employee(self):
+        token = self.provider.issue('jane.doe@example.com', 'employee')
+        self.assertEqual(self.get('/api/trades', token).status_code, 204)
+        self.assertEqual(self.get('/api/all-trades', token).status_code, 403)
+
+    def test_compliance_officer(self):
+        token = self.provider.issue(
+            'john.doe@example.com', 'compliance-officer')
+        self.assertEqual(self.get('/api/all-trades', token).status_code, 204)
+
+    def test_email_claim(self):
+        self.app.config['AUTH0_EMAIL_CLAIM'] = 'https://tcm/email'
+        token = self.provider.issue(
+            'jane.doe@example.com', email_claim='https://tcm/email')
+        self.assertEqual(self.get('/api/trades', token).status_code, 204)
+
+    def test_expired_token(self):
+        token = self.provider.issue('jane.doe@example.com', expires_in=-60)
+        self.assertEqual(self.get('/api/trades', token).status_code, 401)
+
+    def test_foreign_token(self):
+        other = identity_provider.IdentityProvider(self.provider.base_url)
+        token = other.issue('jane.doe@example.com')
+        self.assertEqual(self.get('/api/trades', token).status_code, 401)
@@ -0,0 +1,51 @@
+import io
+import unittest
+
+from tcm_app import create_app
+from tcm_app.imports import import_trades
+from tcm_app.models import ClosedPosition, Trade, db
+
+CSV = b'''isin,name,direction,quantity,price,currency,amount,date
+US0378331005,Apple Inc,Buy,100,365,USD,36500,2020-01-01
+US0378331005,Apple Inc,Sell,60,375,USD,22500,2020-01-15
+US0378331005,Apple Inc,Sell,60,375,USDX,22500,2020-01-20
+'''
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app.config['IMPORT_CHUNK_SIZE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_import_csv_atomic(self):
+        counters, errors = import_trades(
+            io.BytesIO(CSV), 'csv', 'john.doe@example.com')
+        self.assertEqual(
+            (counters['rows'], counters['reported'], counters['invalid']),
+            (3, 0, 1))
+        self.assertEqual(
+            errors, [{'index': 2, 'messages': {
+                'currency': ['Length must be 3.']}}])
+        self.assertEqual(Trade.query.count(), 0)
+
+    def test_import_csv_partial(self):
+        counters, errors = import_trades(
+            io.BytesIO(CSV), 'csv', 'john.doe@example.com', atomic=False)
+        self.assertEqual(counters['reported'], 2)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(Trade.query.count(), 2)
+        self.assertEqual(
+            [(p.buy_id, p.sell_id, p.quantity)
+             for p in ClosedPosition.query.all()],
+            [(1, 2, 60)])
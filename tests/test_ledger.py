@@ -0,0 +1,186 @@
+import threading
+import unittest
+from datetime import date, datetime
+from itertools import groupby
+
+from tcm_app import create_app, fifo, ledger
+from tcm_app.models import (
+    ClosedPosition, OpenLot, Trade, TradePaperTrail, db)
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def create_trade(self, direction, quantity, price, day,
+                     isin='US0378331005'):
+        trade = Trade(
+            isin=isin, name='Apple Inc', direction=direction,
+            quantity=quantity, price=price, currency='USD',
+            amount=quantity * price, date=date(2020, 1, day),
+            reporter='john.doe@example.com', reported_at=datetime.utcnow())
+        trade.create()
+        return trade.id
+
+    def assertLedgerMatchesReplay(self):
+        trades = Trade.query.order_by(
+            Trade.reporter, Trade.isin, Trade.date, Trade.id).all()
+        expected_positions, expected_lots = set(), set()
+        for _, trades_ in groupby(trades, key=lambda t: (t.reporter, t.isin)):
+            closed_positions, buy, sell = fifo.match_trades(list(trades_))
+            expected_positions |= {
+                (p.buy.id, p.sell.id, p.quantity) for p in closed_positions}
+            expected_lots |= {
+                (lot.trade.id, lot.quantity) for lot in (*buy, *sell)}
+
+        self.assertEqual(
+            {(p.buy_id, p.sell_id, p.quantity)
+             for p in ClosedPosition.query.all()},
+            expected_positions)
+        self.assertEqual(
+            {(lot.trade_id, lot.quantity) for lot in OpenLot.query.all()},
+            expected_lots)
+
+    def test_ledger(self):
+        self.create_trade('Buy', 100, 365, 1)
+        self.create_trade('Sell', 60, 375, 15)
+        self.create_trade('Sell', 60, 375, 20)
+        self.assertLedgerMatchesReplay()
+
+        # Back-dated insert
+        id = self.create_trade('Buy', 10, 360, 10)
+        self.assertLedgerMatchesReplay()
+
+        # Moving a trade in time and changing quantity
+        trade = Trade.query.get(id)
+        trade.date = date(2020, 1, 25)
+        trade.quantity = 30
+        trade.update()
+        self.assertLedgerMatchesReplay()
+
+        Trade.query.get(1).delete()
+        self.assertLedgerMatchesReplay()
+
+    def test_reported_update_and_delete(self):
+        self.create_trade('Buy', 100, 365, 1)
+        id = self.create_trade('Sell', 60, 375, 15)
+        reporter = 'john.doe@example.com'
+
+        trade = Trade.update_reported(
+            id, reporter, {'quantity': 30, 'amount': 11250})
+        self.assertEqual(trade['quantity'], 30)
+        self.assertLedgerMatchesReplay()
+        # Unchanged values are no update
+        self.assertIsNone(
+            Trade.update_reported(id, reporter, {'quantity': 30}))
+
+        Trade.delete_reported(id, reporter)
+        self.assertIsNone(Trade.query.get(id))
+        self.assertLedgerMatchesReplay()
+        self.assertEqual(
+            [trail.quantity for trail in TradePaperTrail.query.filter_by(
+                trade_id=id).order_by(TradePaperTrail.id)],
+            [60, 30])
+
+    def test_bulk_update_and_delete(self):
+        ids = [self.create_trade('Buy', 100, 365, 1),
+               self.create_trade('Sell', 60, 375, 15),
+               self.create_trade('Sell', 60, 375, 20)]
+        reporter = 'john.doe@example.com'
+
+        serialised, missing = Trade.bulk_update_reported(reporter, {
+            ids[0]: {'date': date(2020, 1, 16)},
+            ids[2]: {'quantity': 30, 'amount': 11250}}, chunk_size=1)
+        self.assertEqual(missing, [])
+        self.assertEqual(serialised[ids[2]]['quantity'], 30)
+        self.assertLedgerMatchesReplay()
+
+        self.assertEqual(Trade.bulk_delete_reported(
+            reporter, [ids[1], 0], chunk_size=1), [0])
+        self.assertEqual(Trade.query.count(), 3)
+        self.assertEqual(Trade.bulk_delete_reported(
+            reporter, ids[:2], chunk_size=1), [])
+        self.assertLedgerMatchesReplay()
+        self.assertEqual(TradePaperTrail.query.count(), 4)
+
+    def test_concurrent_writers(self):
+        if db.engine.dialect.name != 'postgresql':
+            self.skipTest('Requires PostgreSQL (SQLite locks the database).')
+        locked, release = threading.Event(), threading.Event()
+
+        def buy():
+            with self.app.app_context():
+                trade = Trade(
+                    isin='US0378331005', name='Apple Inc', direction='Buy',
+                    quantity=100, price=365, currency='USD', amount=36500,
+                    date=date(2020, 1, 1), reporter='john.doe@example.com',
+                    reported_at=datetime.utcnow())
+                db.session.add(trade)
+                ledger.on_create(trade)
+                locked.set()
+                release.wait(10)
+                db.session.commit()
+                db.session.remove()
+
+        def sell():
+            with self.app.app_context():
+                self.create_trade('Sell', 60, 375, 15)
+                db.session.remove()
+
+        buyer = threading.Thread(target=buy)
+        buyer.start()
+        self.assertTrue(locked.wait(10))
+        seller = threading.Thread(target=sell)
+        seller.start()
+        # Waits for the buyer's lock, to re-match with its trade
+        seller.join(0.5)
+        self.assertTrue(seller.is_alive())
+        release.set()
+        buyer.join()
+        seller.join()
+
+        self.assertEqual(ClosedPosition.query.count(), 1)
+        self.assertLedgerMatchesReplay()
+
+    def test_update_moves_isin(self):
+        id = self.create_trade('Buy', 100, 365, 1)
+        self.create_trade('Sell', 60, 375, 15)
+        self.create_trade('Buy', 50, 90, 2, isin='SE0000108656')
+
+        Trade.update_reported(
+            id, 'john.doe@example.com', {'isin': 'SE0000108656'})
+        self.assertEqual(Trade.query.get(id).isin, 'SE0000108656')
+        self.assertLedgerMatchesReplay()
+
+    def test_bulk_update_moves_isin(self):
+        reporter = 'john.doe@example.com'
+        se = self.create_trade('Buy', 100, 90, 1, isin='SE0000108656')
+        us = [self.create_trade('Buy', 100, 365, 2),
+              self.create_trade('Sell', 60, 375, 15)]
+
+        # The ISIN moved into is edited by an earlier item
+        serialised, missing = Trade.bulk_update_reported(reporter, {
+            se: {'quantity': 80}, us[1]: {'isin': 'SE0000108656'}},
+            chunk_size=10)
+        self.assertEqual(missing, [])
+        self.assertLedgerMatchesReplay()
+
+        # Trades swapping ISINs
+        Trade.bulk_update_reported(reporter, {
+            se: {'isin': 'US0378331005'}, us[0]: {'isin': 'SE0000108656'}},
+            chunk_size=10)
+        self.assertEqual(
+            [Trade.query.get(id).isin for id in (se, *us)],
+            ['US0378331005', 'SE0000108656', 'SE0000108656'])
+        self.assertLedgerMatchesReplay()
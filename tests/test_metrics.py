@@ -0,0 +1,64 @@
+import time
+import unittest
+
+from flask import g
+
+from tcm_app import create_app, metrics
+from tcm_app.models import Trade, db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram(
+            'test_seconds', 'Test.', ('endpoint',), (0.1, 1.0))
+        histogram.observe(('a',), 0.05)
+        histogram.observe(('a',), 0.5)
+        histogram.observe(('a',), 5)
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{endpoint="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{endpoint="a",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{endpoint="a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{endpoint="a"} 3', lines)
+
+    def test_stages_exclude_nested_stages(self):
+        with self.app.test_request_context():
+            g._metrics_timings = timings = metrics.RequestTimings()
+            with metrics.stage('match'):
+                time.sleep(0.01)
+                with metrics.stage('serialise'):
+                    time.sleep(0.02)
+                Trade.query.count()
+            total, stages = timings.breakdown()
+        self.assertEqual(timings.statements, 1)
+        self.assertGreaterEqual(stages['serialise'], 0.02)
+        self.assertGreaterEqual(stages['match'], 0.01)
+        self.assertLess(stages['match'], 0.02)
+        self.assertAlmostEqual(sum(stages.values()), total)
+
+    def test_metrics(self):
+        self.app.config['METRICS_SERVER_TIMING'] = True
+        res = self.client().get('/api/trades')
+        self.assertEqual(res.status_code, 401)
+        self.assertIn('total;dur=', res.headers['Server-Timing'])
+
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        text = res.get_data(as_text=True)
+        self.assertIn('tcm_request_duration_seconds_count'
+                      '{endpoint="api.trades_endpoint"}', text)
+        self.assertIn('tcm_cache_hit_ratio{cache="violations"}', text)
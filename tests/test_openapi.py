@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+
+from tcm_app import create_app, openapi
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'openapi.json')
+        self.app.config['OPENAPI_TEMPLATE_PATH'] = self.path
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_template_is_cached(self):
+        template = openapi.template(self.app)
+        self.assertIn('Trade', template['components']['schemas'])
+        self.assertEqual(json.loads(json.dumps(template)), template)
+        with open(self.path) as f:
+            cached = json.load(f)
+        self.assertEqual(cached['template'], template)
+
+        # Read from the cache while its fingerprint matches
+        cached['template']['info']['title'] = 'Cached'
+        with open(self.path, 'w') as f:
+            json.dump(cached, f)
+        self.assertEqual(
+            openapi.template(self.app)['info']['title'], 'Cached')
+
+        self.app.config['AUTH0_API_BASE_URL'] = 'http://127.0.0.1:8765'
+        template = openapi.template(self.app)
+        self.assertEqual(template['info']['title'], 'Trade Compliance Monitor')
+        self.assertTrue(template['components']['securitySchemes'][
+            'implicitFlow']['flows']['implicit']['authorizationUrl']
+            .startswith('http://127.0.0.1:8765/authorize'))
+
+    def test_openapi_command(self):
+        result = self.app.test_cli_runner().invoke(
+            args=['openapi', '--output', self.path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(self.path) as f:
+            cached = json.load(f)
+        self.assertEqual(cached['fingerprint'], openapi.fingerprint(self.app))
+
+    def test_swagger(self):
+        res = self.app.test_client().get('/apispec_1.json')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('/api/trades', res.get_json()['paths'])
@@ -0,0 +1,88 @@
+import re
+import unittest
+
+from benchmarks import identity_provider
+from tcm_app import create_app
+from tcm_app.models import db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.provider, cls.server = identity_provider.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app.config['AUTH0_API_BASE_URL'] = self.provider.base_url
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+        self.trade = {
+            "isin": "US0378331005",
+            "amount": 36500,
+            "price": 365.00,
+            "direction": 'Buy',
+            "date": "2020-01-01",
+            "name": "Apple Inc",
+            "quantity": 100,
+            "currency": "USD"
+        }
+        self.employee = {'Authorization': 'Bearer {}'.format(
+            self.provider.issue('jane.doe@example.com'))}
+        # Five trades of the same date
+        res = self.client().post(
+            '/api/trades/batch', headers=self.employee,
+            json=[dict(self.trade, quantity=quantity)
+                  for quantity in range(1, 6)])
+        self.assertEqual(res.status_code, 200)
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def pages(self, path):
+        """Follows Link rel="next" headers from path, returning quantities
+        of trades by page.
+        """
+        pages = []
+        while path is not None:
+            res = self.client().get(path, headers=self.employee)
+            self.assertEqual(res.status_code, 200)
+            pages.append([trade['quantity'] for trade in res.get_json()])
+            link = res.headers.get('Link')
+            path = None
+            if link is not None:
+                path = re.fullmatch(r'<(.+)>; rel="next"', link).group(1)
+        return pages
+
+    def test_pages(self):
+        self.assertEqual(self.pages('/api/trades?limit=2'),
+                         [[1, 2], [3, 4], [5]])
+        self.assertEqual(self.pages('/api/trades?limit=5'),
+                         [[1, 2, 3, 4, 5]])
+        self.assertEqual(self.pages('/api/trades'), [[1, 2, 3, 4, 5]])
+
+    def test_default_and_max_limit(self):
+        self.app.config['TRADES_DEFAULT_LIMIT'] = 3
+        self.assertEqual(self.pages('/api/trades'), [[1, 2, 3], [4, 5]])
+
+        self.app.config['TRADES_MAX_LIMIT'] = 2
+        self.assertEqual(self.pages('/api/trades?limit=1000'),
+                         [[1, 2], [3, 4], [5]])
+
+    def test_invalid_parameters(self):
+        for query in ('limit=abc', 'limit=0', 'limit=-1', 'limit=1.5',
+                      'cursor=!!!', 'cursor=YWJj'):
+            res = self.client().get(
+                f'/api/trades?{query}', headers=self.employee)
+            self.assertEqual(res.status_code, 400, query)
@@ -0,0 +1,64 @@
+import unittest
+
+from tcm_app import create_app, metrics, profiling
+from tcm_app.models import Trade, db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app.config.update(
+            SQL_PROFILING=True, SQL_SLOW_STATEMENT_SECONDS=60,
+            SQL_REPEATED_STATEMENT_LIMIT=2)
+        profiling.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def request(self, queries):
+        """Runs queries within a request, returning its warnings."""
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            with self.app.test_request_context('/nowhere'):
+                self.app.preprocess_request()
+                queries()
+            self.app.logger.warning('Done')
+        return logs.output[:-1]
+
+    def test_shape(self):
+        self.assertEqual(
+            profiling.shape('SELECT *\n FROM t WHERE id IN (?, ?, ?)'),
+            'SELECT * FROM t WHERE id IN (...)')
+        self.assertEqual(
+            profiling.shape('WHERE id IN (%(id_1)s, %(id_2)s)'),
+            'WHERE id IN (...)')
+
+    def test_repeated_statements(self):
+        repeated = metrics.repeated_statements._values[('none',)]
+
+        def n_plus_one():
+            for id in range(3):
+                Trade.query.get(id)
+        warnings = self.request(n_plus_one)
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('Statement repeated 3 times', warnings[0])
+        self.assertEqual(
+            metrics.repeated_statements._values[('none',)], repeated + 1)
+
+        self.assertEqual(
+            self.request(lambda: Trade.query.filter(
+                Trade.id.in_([1, 2, 3])).all()), [])
+
+    def test_slow_statements(self):
+        self.app.config['SQL_SLOW_STATEMENT_SECONDS'] = 0
+        warnings = self.request(lambda: Trade.query.get(7))
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('Slow statement', warnings[0])
+        self.assertIn('(7,', warnings[0])
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks import identity_provider
+from tcm_app import create_app, metrics, replicas
+from tcm_app.models import ReporterVersion, Trade, db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.provider, cls.server = identity_provider.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app()
+        self.app.config.update(
+            AUTH0_API_BASE_URL=self.provider.base_url,
+            SQLALCHEMY_REPLICA_URI='sqlite:///{}'.format(
+                os.path.join(self.directory.name, 'replica.db')),
+            VIOLATIONS_CACHE_TYPE='null')
+        replicas.init_app(self.app)
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.replica = self.app.extensions['replica'].engine
+        db.metadata.create_all(self.replica)
+
+        self.trade = {
+            "isin": "US0378331005",
+            "amount": 36500,
+            "price": 365.00,
+            "direction": 'Buy',
+            "date": "2020-01-01",
+            "name": "Apple Inc",
+            "quantity": 100,
+            "currency": "USD"
+        }
+        self.employee = {'Authorization': 'Bearer {}'.format(
+            self.provider.issue('jane.doe@example.com'))}
+        self.officer = {'Authorization': 'Bearer {}'.format(
+            self.provider.issue('john.doe@example.com', 'compliance-officer'))}
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def replicate(self, name):
+        """Copies trades (renamed name) and versions to the replica."""
+        for table in (Trade.__table__, ReporterVersion.__table__):
+            rows = [dict(row) for row in db.session.execute(table.select())]
+            if table is Trade.__table__:
+                rows = [dict(row, name=name) for row in rows]
+            with self.replica.begin() as connection:
+                connection.execute(table.delete())
+                if rows:
+                    connection.execute(table.insert(), rows)
+
+    def names(self, path, headers):
+        res = self.client().get(path, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        return {trade['name'] for trade in res.get_json()}
+
+    def test_reads_own_writes(self):
+        res = self.client().post(
+            '/api/trades', headers=self.employee, json=self.trade)
+        self.assertEqual(res.status_code, 200)
+        # Not replicated yet
+        self.assertEqual(self.names('/api/trades', self.employee),
+                         {'Apple Inc'})
+
+        self.replicate('Replicated')
+        self.assertEqual(self.names('/api/trades', self.employee),
+                         {'Replicated'})
+
+        # Writes go to the primary, and are read from it until replicated
+        trade_id = self.client().get(
+            '/api/trades', headers=self.employee).get_json()[0]['id']
+        res = self.client().patch(
+            f'/api/trades/{trade_id}', headers=self.employee,
+            json=dict(self.trade, quantity=50, amount=18250))
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/api/trades', headers=self.employee)
+        self.assertEqual(res.get_json()[0]['quantity'], 50)
+
+    def test_all_trades_within_lag(self):
+        self.client().post(
+            '/api/trades', headers=self.employee, json=self.trade)
+        self.replicate('Replicated')
+        self.client().post(
+            '/api/trades', headers=self.officer, json=self.trade)
+
+        # The replica is behind by less than REPLICA_MAX_LAG
+        self.assertEqual(self.names('/api/all-trades', self.officer),
+                         {'Replicated'})
+        self.app.config['REPLICA_MAX_LAG'] = -1
+        self.assertEqual(self.names('/api/all-trades', self.officer),
+                         {'Apple Inc'})
+
+    def test_primary_without_versions(self):
+        self.client().post(
+            '/api/trades', headers=self.employee, json=self.trade)
+        self.replicate('Replicated')
+        # E.g. a primary restored empty, while the replica is not
+        for table in (Trade.__table__, ReporterVersion.__table__):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+        for path in ('/api/all-trades', '/api/all-violations'):
+            res = self.client().get(path, headers=self.officer)
+            self.assertEqual(res.status_code, 204, path)
+
+    def test_replica_failed(self):
+        self.app.config['SQLALCHEMY_REPLICA_URI'] = (
+            'sqlite:////nonexistent/replica.db')
+        replicas.init_app(self.app)
+        failed = metrics.routed_reads._values[('primary', 'failed')]
+
+        with self.assertLogs(self.app.logger, 'WARNING'):
+            res = self.client().get('/api/trades', headers=self.employee)
+        self.assertEqual(res.status_code, 204)
+        res = self.client().get('/api/trades', headers=self.employee)
+        self.assertEqual(res.status_code, 204)
+        self.assertEqual(
+            metrics.routed_reads._values[('primary', 'failed')], failed + 2)
@@ -0,0 +1,29 @@
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+import simplejson
+
+from tcm_app.models import Trade, trade_serializer, trades_schema
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def test_trade_serializer(self):
+        trades = [
+            Trade(id=1, isin='US0378331005', name='Äpple "Inc"',
+                  direction='Buy', quantity=Decimal('100.0000000000'),
+                  price=Decimal('364.11'), currency='USD', amount=1e16,
+                  date=date(2020, 1, 1), reporter='john.doe@example.com',
+                  reported_at=datetime(2020, 1, 2, 3, 4, 5, 6)),
+            Trade(id=2),
+        ]
+        for ensure_ascii in (True, False):
+            self.assertEqual(
+                simplejson.dumps(
+                    trade_serializer.raw(trades, ensure_ascii),
+                    separators=(',', ':'), ensure_ascii=ensure_ascii),
+                simplejson.dumps(
+                    trades_schema.dump(trades),
+                    separators=(',', ':'), ensure_ascii=ensure_ascii))
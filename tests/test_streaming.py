@@ -0,0 +1,90 @@
+import json
+import unittest
+
+from benchmarks import identity_provider
+from tcm_app import create_app
+from tcm_app.models import db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.provider, cls.server = identity_provider.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app.config.update(
+            AUTH0_API_BASE_URL=self.provider.base_url,
+            VIOLATIONS_CACHE_TYPE='null', VIOLATIONS_STREAM_BATCH_SIZE=2)
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+        trade = {
+            "isin": "US0378331005",
+            "amount": 36500,
+            "price": 365.00,
+            "direction": 'Buy',
+            "date": "2020-01-01",
+            "name": "Apple Inc",
+            "quantity": 100,
+            "currency": "USD"
+        }
+        # Profitable round trips within the holding period
+        trades = [
+            trade,
+            dict(trade, direction='Sell', quantity=60, price=375,
+                 amount=22500, date='2020-01-15'),
+            dict(trade, direction='Sell', quantity=40, price=380,
+                 amount=15200, date='2020-01-20')]
+        for email in ('jane.doe@example.com', 'john.doe@example.com',
+                      'mary.major@example.com'):
+            headers = {'Authorization': 'Bearer {}'.format(
+                self.provider.issue(email))}
+            res = self.client().post(
+                '/api/trades/batch', headers=headers, json=trades)
+            self.assertEqual(res.status_code, 200)
+        # No violation
+        headers = {'Authorization': 'Bearer {}'.format(
+            self.provider.issue('richard.roe@example.com'))}
+        res = self.client().post(
+            '/api/trades', headers=headers, json=trade)
+        self.assertEqual(res.status_code, 200)
+        self.officer = {'Authorization': 'Bearer {}'.format(
+            self.provider.issue('john.doe@example.com', 'compliance-officer'))}
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def get(self, path):
+        res = self.client().get(path, headers=self.officer)
+        self.assertEqual(res.status_code, 200)
+        return res
+
+    def test_streamed_violations(self):
+        for from_ledger in (True, False):
+            self.app.config['VIOLATIONS_FROM_LEDGER'] = from_ledger
+            expected = self.get('/api/all-violations').get_json()
+            self.assertEqual(
+                [item['reporter'] for item in expected],
+                ['jane.doe@example.com', 'john.doe@example.com',
+                 'mary.major@example.com'])
+
+            res = self.get('/api/all-violations?stream=ndjson')
+            self.assertEqual(res.mimetype, 'application/x-ndjson')
+            lines = res.get_data(as_text=True).splitlines()
+            self.assertEqual([json.loads(line) for line in lines], expected)
+
+            res = self.get('/api/all-violations?stream=json')
+            self.assertEqual(res.mimetype, 'application/json')
+            self.assertEqual(res.get_json(), expected)
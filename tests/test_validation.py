@@ -0,0 +1,44 @@
+import unittest
+
+from marshmallow import ValidationError
+
+from tcm_app.models import load_trades, trades_schema, validate_isin
+from tcm_app.validation import isin_checks
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def test_isin_checks(self):
+        isins = ['US0378331005', 'AU0000XVGZA3', 'us0378331005',
+                 'US0378331006', 'ab0123456789', 'US037833100', '12US03783310',
+                 'U$0378331005', 'US03783310٣5']
+
+        def passes(isin):
+            try:
+                validate_isin(isin)
+            except ValidationError:
+                return False
+            return True
+
+        self.assertEqual(list(isin_checks(isins)), [passes(i) for i in isins])
+
+    def test_load_trades_errors(self):
+        trade = {
+            'isin': 'US0378331005', 'name': 'Apple Inc', 'direction': 'Buy',
+            'quantity': '100', 'price': '365', 'currency': 'USD',
+            'amount': '36500', 'date': '2020-01-01'}
+        json_data = [
+            trade,
+            dict(trade, isin='US0378331006', direction='buy'),
+            dict(trade, currency='USDX', date='2999-01-01'),
+            dict(trade, isin=1, currency=None),
+        ]
+        try:
+            trades_schema.load(json_data)
+        except ValidationError as err:
+            expected = err.messages
+
+        valid, errors = load_trades(json_data)
+        self.assertEqual([index for index, _ in valid], [0])
+        self.assertEqual(errors, expected)
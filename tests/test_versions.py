@@ -0,0 +1,75 @@
+import unittest
+from datetime import date, datetime
+
+from tcm_app import create_app
+from tcm_app.models import ReporterVersion, Trade, db
+
+
+class TradeComplianceMonitor(unittest.TestCase):
+    """Trade Compliance Monitor test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def create_trade(self, reporter):
+        trade = Trade(
+            isin='US0378331005', name='Apple Inc', direction='Buy',
+            quantity=100, price=365, currency='USD', amount=36500,
+            date=date(2020, 1, 1), reporter=reporter,
+            reported_at=datetime.utcnow())
+        trade.create()
+        return trade.id
+
+    def test_reporter_version(self):
+        self.assertEqual(ReporterVersion.get('john.doe@example.com'),
+                         (0, None))
+        self.assertEqual(ReporterVersion.firm_wide(), (0, None))
+
+        id = self.create_trade('john.doe@example.com')
+        self.create_trade('jane.doe@example.com')
+        trade = Trade.query.get(id)
+        trade.quantity = 50
+        trade.update()
+        Trade.query.get(id).delete()
+
+        version, modified_at = ReporterVersion.get('john.doe@example.com')
+        self.assertEqual(version, 3)
+        self.assertIsNotNone(modified_at)
+        self.assertEqual(ReporterVersion.firm_wide()[0], 4)
+
+    def test_write_bumps_version_once(self):
+        self.create_trade('jane.doe@example.com')
+        jane = ReporterVersion.get('jane.doe@example.com')
+        reporter = 'john.doe@example.com'
+        row = dict(
+            isin='US0378331005', name='Apple Inc', direction='Sell',
+            quantity=10, price=375, currency='USD', amount=3750,
+            date=date(2020, 1, 2), reporter=reporter,
+            reported_at=datetime.utcnow())
+
+        id = self.create_trade(reporter)
+        writes = [
+            lambda: Trade.bulk_create([row, dict(row, quantity=20)], 1),
+            lambda: Trade.update_reported(id, reporter, {'quantity': 50}),
+            lambda: Trade.bulk_update_reported(
+                reporter, {id: {'quantity': 40}}, 1),
+            lambda: Trade.delete_reported(id, reporter),
+            lambda: Trade.bulk_delete_reported(reporter, [
+                trade.id for trade in Trade.query.filter_by(
+                    reporter=reporter)], 1),
+        ]
+        for version, write in enumerate(writes, 2):
+            write()
+            self.assertEqual(ReporterVersion.get(reporter)[0], version)
+            # Other reporters' versions (and ETags) are unchanged
+            self.assertEqual(ReporterVersion.get('jane.doe@example.com'),
+                             jane)